@@ -6,6 +6,11 @@ import argparse
 import StringIO
 import sys
 import metric_behavior as mb
+import truth_store
+import bitmatrix
+import memplan
+import telemetry
+import profiling
 from functools import reduce
 from scoring_harness_optimized import *
 from permutations import *
@@ -29,13 +34,11 @@ MEM             = False
 FINAL_MEM       = False
 WRITE_2B_FILES  = False
 WRITE_3B_FILES  = False
+WRITE_VCF_MASK  = False
+# memory limit in bytes scoreChallenge plans for, None to score without planning
+MEM_LIMIT       = None
 
-class ValidationError(Exception):
-    def __init__(self, value):
-        self.value = value
-        print('VALIDATION ERROR: %s' % value)
-    def __str__(self):
-        return repr(self.value)
+# ValidationError comes from scoring_harness_optimized, whose validation raises it too
 
 class SampleError(Exception):
     def __init__(self, value):
@@ -154,12 +157,21 @@ def validate1C(data, nssms, mask=None):
         raise ValidationError("Total number of reported mutations is %d. Should be %d" % (reported_nssms, nssms))
     return zip([int(x[1]) for x in data2], [float(x[2]) for x in data2])
 
+def expand_sc(sc):
+    """
+    Cellular frequency of every mutation, in the order of the clusters
+    :param sc: list of (number of mutations, cellular frequency) tuples, one per cluster
+    :return: array with the cellular frequency of each cluster repeated once per mutation
+    """
+    if len(sc) == 0:
+        return np.zeros(0)
+    return np.repeat([x[1] for x in sc], [x[0] for x in sc])
+
 def calculate_original1C(pred, truth, err='abs'):
     pred.sort(key = lambda x: x[1])
     truth.sort(key = lambda x: x[1])
-    #itertools.chain(*x) flattens a list of lists
-    predvs = np.array(list(itertools.chain(*[[x[1]]*x[0] for x in pred])))
-    truthvs = np.array(list(itertools.chain(*[[x[1]]*x[0] for x in truth])))
+    predvs = expand_sc(pred)
+    truthvs = expand_sc(truth)
  
     # calculate the score using the given error penalty
     if err is 'abs':
@@ -169,14 +181,14 @@ def calculate_original1C(pred, truth, err='abs'):
     else:
         raise KeyError('Invalid error penalty for scoring SC 1C. Choose one of "abs" or "sqr".')
  
-    return sum(1-se)/float(len(truthvs))
+    return np.sum(1-se)/float(len(truthvs))
  
-def calculate_scaled1C(pred, truth, err='abs'):
+def calculate_scaled1C(pred, truth, err='abs', resolution=1000):
     pred.sort(key = lambda x: x[1])
     truth.sort(key = lambda x: x[1])
     truth = truth[1:]
-    predvs = compute_scaled_sc(pred)
-    truthvs = compute_scaled_sc(truth)
+    predvs = compute_scaled_sc(pred, resolution)
+    truthvs = compute_scaled_sc(truth, resolution)
     # calculate the score using the given error penalty
     if err is 'abs':
         se = abs(truthvs - predvs)
@@ -185,24 +197,27 @@ def calculate_scaled1C(pred, truth, err='abs'):
     else:
         raise KeyError('Invalid error penalty for scoring SC 1C. Choose one of "abs" or "sqr".')
  
-    return sum(1-se)/float(len(truthvs))
+    return np.sum(1-se)/float(len(truthvs))
    
-def compute_scaled_sc(sc):
-    out = np.zeros((1000))
-    t_ssms = sum([float(x[0]) for x in sc])
-    sc = [list(x)+[float(x[0])/t_ssms] for x in sc]
+def compute_scaled_sc(sc, resolution=1000):
+    """
+    Cellular frequencies of the clusters sampled at evenly spaced quantiles of the mutations
+    :param sc: list of (number of mutations, cellular frequency) tuples, one per cluster
+    :param resolution: number of quantiles
+    :return: array with the cellular frequency of the cluster at each quantile
+    """
+    out = np.zeros((resolution))
     if len(sc) != 0:
-        for i in range(1000):
-            try:
-                ind = sum(np.cumsum([x[2] for x in sc]) < i/1000.0)
-                out[i] = sc[ind][1]
-            except IndexError:
-                raise
+        nssms = np.array([x[0] for x in sc], dtype=float)
+        cum_fraction = np.cumsum(nssms / np.sum(nssms))
+        # index of the cluster at each quantile, i.e. the number of clusters whose cumulative fraction is below it
+        ind = np.searchsorted(cum_fraction, np.arange(resolution) / float(resolution), side='left')
+        out[:] = np.array([x[1] for x in sc])[ind]
     return out
  
-def calculate1C(pred, truth, err='abs'):
+def calculate1C(pred, truth, err='abs', resolution=1000):
     orig = calculate_original1C(pred,truth,err)
-    scaled = calculate_scaled1C(pred, truth, err)
+    scaled = calculate_scaled1C(pred, truth, err, resolution)
     return max(orig,scaled)
 
 
@@ -260,9 +275,9 @@ def validate2Afor3A(data, nssms, mask=None):
     # mask works for free!
     return validate2A(data, nssms, return_ccm=False, mask=mask)
 
-def validate2B(filename, nssms, mask=None):
+def validate2B(filename, nssms, mask=None, dtype=np.float64):
   
-    ccm = np.zeros((nssms, nssms))
+    ccm = np.zeros((nssms, nssms), dtype=dtype)
     try:
         if os.path.exists(filename):
             
@@ -324,7 +339,7 @@ def isSymmetric(x):
     return symmetricity
 
 #@profile
-def calculate2(pred, truth, full_matrix=True, method='default', pseudo_counts=None):
+def calculate2(pred, truth, full_matrix=True, method='default', pseudo_counts=None, baselines=None):
     '''
     Calculate the score for SubChallenge 2
     :param pred: predicted co-clustering matrix
@@ -332,30 +347,19 @@ def calculate2(pred, truth, full_matrix=True, method='default', pseudo_counts=No
     :param full_matrix: logical for whether to use the full matrix or just the upper triangular matrices when calculating the score
     :param method: scoring metric used, default is average of Pseudo V,
     :param pseudo_counts: logical for how many psuedo counts to add to the matrices
+    :param baselines: worst scores from get_baselines2, computed from the truth if not given
     :return: subchallenge 2 score for the predicted co-clustering matrix
     '''
 
-    larger_is_worse_methods = ['pseudoV', 'sym_pseudoV'] # methods where a larger score is worse
-    y = np.array(pred.shape)[1]
-    nssms = np.ceil(0.5 * (2*y + 1) - 0.5 * np.sqrt(4*y + 1))
     import gc
 
-    func_dict = {
-        "orig"           : calculate2_orig,
-        "sqrt"           : calculate2_sqrt,
-        "pseudoV"        : calculate2_pseudoV,
-        "sym_pseudoV"    : calculate2_sym_pseudoV,
-        "spearman"       : calculate2_spearman,
-        "pearson"        : calculate2_pearson,
-        "aupr"           : calculate2_aupr,
-        "mcc"            : calculate2_mcc
-    }
+    func_dict = calculate2_funcs
     func = func_dict.get(method, None)
     if func is None:
         scores = []
         worst_scores = []
 
-        functions = ['pseudoV', 'pearson', 'mcc']
+        functions = calculate2_default_methods
         # functions = ['pseudoV']
         # functions = ['pearson']
         # functions = ['mcc']
@@ -364,25 +368,52 @@ def calculate2(pred, truth, full_matrix=True, method='default', pseudo_counts=No
             gc.collect()
             scores.append(func_dict[m](pred, truth, full_matrix=full_matrix))
             # normalize the scores to be between (worst of OneCluster and NCluster scores) and (Truth score)
+        if baselines is None:
+            baselines = get_baselines2(truth)
         for m in functions:
-            gc.collect()
-            worst_scores.append(get_worst_score(nssms, truth, func_dict[m], larger_is_worse=(m in larger_is_worse_methods)))
+            worst_scores.append(baselines[m])
         for i, m in enumerate(functions):
-            if m in larger_is_worse_methods:
-                scores[i] = set_to_zero(1 - (scores[i] / worst_scores[i]))
-            else:
-                scores[i] = set_to_zero((scores[i] - worst_scores[i]) / (1 - worst_scores[i]))
+            scores[i] = normalize_score2(m, scores[i], worst_scores[i])
         return np.mean(scores)
 
     else:
         score = func(pred, truth, full_matrix=full_matrix)
-        if method in larger_is_worse_methods: # normalize the scores to be between 0 and 1 where 1 is the true matrix
-            worst_score = get_worst_score(nssms, truth, func, larger_is_worse=True) # and zero is the worse score of the NCluster matrix
-            score = set_to_zero(1 - (score / worst_score))                   # and the OneCluster matrix - similar to above
-        else:
-            worst_score = get_worst_score(nssms, truth, func, larger_is_worse=False)
-            score = set_to_zero((score - worst_score) / (1 - worst_score))
-        return score
+        if baselines is None:
+            baselines = get_baselines2(truth, method=method)
+        return normalize_score2(method, score, baselines[method])
+
+def normalize_score2(method, score, worst_score):
+    '''
+    Normalize a SubChallenge 2 score to be between 0 and 1 where 1 is the true matrix
+    and zero is the worse score of the NCluster matrix and the OneCluster matrix
+    :param method: scoring metric the score was calculated with
+    :param score: raw score
+    :param worst_score: baseline score of the metric, from get_baselines2
+    :return: normalized score
+    '''
+    if method in ['pseudoV', 'sym_pseudoV']: # methods where a larger score is worse
+        return set_to_zero(1 - (score / worst_score))
+    return set_to_zero((score - worst_score) / (1 - worst_score))
+
+@telemetry.traced('baselines')
+def get_baselines2(truth, method='default'):
+    '''
+    Calculate the worst scores (worst of OneCluster and NCluster) used to normalize the scores for SubChallenge 2.
+    They only depend on the truth, so they can be computed once per truth file
+    :param truth: true co-clustering matrix, including pseudo counts
+    :param method: scoring metric used, default is the average used by calculate2
+    :return: dictionary with the worst score of each scoring metric
+    '''
+    larger_is_worse_methods = ['pseudoV', 'sym_pseudoV'] # methods where a larger score is worse
+    y = np.array(truth.shape)[1]
+    nssms = np.ceil(0.5 * (2*y + 1) - 0.5 * np.sqrt(4*y + 1))
+
+    methods = [method] if method in calculate2_funcs else calculate2_default_methods
+    baselines = {}
+    for m in methods:
+        gc.collect()
+        baselines[m] = get_worst_score(nssms, truth, calculate2_funcs[m], larger_is_worse=(m in larger_is_worse_methods))
+    return baselines
 
 #### METRICS ###############################################################################################
 
@@ -487,6 +518,11 @@ def calculate2_pseudoV_norm(pred, truth, rnd=0.01, max_val=4000, full_matrix=Tru
     return max(1 -  pv_val/ max_val, 0)
 
 def calculate2_pseudoV(pred, truth, rnd=0.01, full_matrix=True, sym=False):
+    # binary matrices only need the per row counts of ones, which are popcounts of the packed rows
+    packed = bitmatrix.pack_binary(pred, truth)
+    if packed is not None:
+        return bitmatrix.pseudoV_rows(packed[0], packed[1], rnd=rnd, sym=sym, full_matrix=full_matrix)
+
     if full_matrix:
         pred_cp = pred
         truth_cp = truth
@@ -534,7 +570,76 @@ def calculate2_sym_pseudoV_norm(pred, truth, rnd=0.01, max_val=8000, full_matrix
 def calculate2_sym_pseudoV(pred, truth, rnd=0.01, full_matrix=True):
     return calculate2_pseudoV(pred, truth, rnd=rnd, full_matrix=full_matrix, sym=True)
 
+# largest number of distinct (pred, truth) value pairs for which calculate2_spearman and calculate2_aupr count a
+# contingency table instead of sorting all entries
+MAX_VALUE_PAIRS = 2**22
+
+# number of bins the predicted values are rounded into for calculate2_aupr when there are too many distinct values,
+# None to pass all the entries to sklearn instead
+AUPR_RESOLUTION = None
+
+def matrix_entries(matrix, full_matrix=True, resolution=None):
+    '''
+    Entries of a square matrix, one block of rows at a time
+    :param matrix: square matrix
+    :param full_matrix: all entries or only the strict upper triangle
+    :param resolution: if given, the entries are rounded to multiples of 1/resolution
+    :return: generator of 1D arrays with the entries of every block
+    '''
+    n_cols = matrix.shape[1]
+    for start, stop in bitmatrix.row_blocks(matrix.shape[0], n_cols):
+        block = np.asarray(matrix[start:stop])
+        if full_matrix:
+            block = block.ravel()
+        else:
+            block = block[np.arange(n_cols)[None, :] > np.arange(start, stop)[:, None]]
+        if resolution is not None:
+            block = np.round(block * resolution) / float(resolution)
+        yield block
+
+def value_pair_counts(pred, truth, full_matrix=True, resolution=None):
+    '''
+    Counts the entries of every pair of (pred, truth) values, for matrices with few distinct values
+    (e.g. 0/1 matrices or probabilities rounded to a few digits)
+    :param pred: predicted matrix
+    :param truth: true matrix
+    :param full_matrix: all entries or only the strict upper triangle
+    :param resolution: if given, the predicted values are rounded to multiples of 1/resolution first
+    :return: len(pred values) x len(truth values) matrix of counts, rows and columns in ascending order of the values,
+        the pred values and the truth values; or None if there are more than MAX_VALUE_PAIRS pairs of values
+    '''
+    pred_values = np.array([])
+    truth_values = np.array([])
+    for p, t in itertools.izip(matrix_entries(pred, full_matrix, resolution), matrix_entries(truth, full_matrix)):
+        pred_values = np.union1d(pred_values, p)
+        truth_values = np.union1d(truth_values, t)
+        if len(pred_values) * len(truth_values) > MAX_VALUE_PAIRS:
+            return None
+
+    counts = np.zeros(len(pred_values) * len(truth_values), dtype=np.int64)
+    for p, t in itertools.izip(matrix_entries(pred, full_matrix, resolution), matrix_entries(truth, full_matrix)):
+        pairs = np.searchsorted(pred_values, p) * len(truth_values) + np.searchsorted(truth_values, t)
+        counts += np.bincount(pairs, minlength=len(counts))
+    return counts.reshape(len(pred_values), len(truth_values)), pred_values, truth_values
+
+def average_ranks(counts):
+    '''
+    Rank of every value (ties get the average rank, as in scipy.stats.rankdata)
+    :param counts: number of entries of every value, in ascending order of the values
+    '''
+    below = np.cumsum(counts) - counts
+    return below + (counts + 1) / 2.0
+
 def calculate2_spearman(pred, truth, full_matrix=True):
+    # with few distinct values the ranks only depend on how many entries have each value, so
+    # the sum of squared rank differences can be taken over the table of value pairs
+    table = value_pair_counts(pred, truth, full_matrix=full_matrix)
+    if table is not None:
+        counts = table[0]
+        n = float(np.sum(counts))
+        d = average_ranks(counts.sum(0))[None, :] - average_ranks(counts.sum(1))[:, None]
+        return 1 - (6 * np.sum(counts * np.square(d)) / n) / (np.square(n) - 1)
+
     # use only the upper triangular matrix of the truth and
     # prediction matrices
     n = truth.shape[0]
@@ -631,7 +736,41 @@ def mystd(vec1, vec2, m1, m2):
 
     return s1, s2
 
+def precision_recall_from_counts(positives, negatives):
+    '''
+    Precision-recall curve as returned by sklearn.metrics.precision_recall_curve, from the number of
+    positive and negative entries at every distinct predicted value
+    :param positives: number of true entries for every predicted value, in ascending order of the values
+    :param negatives: number of false entries for every predicted value
+    :return: precision, recall
+    '''
+    # every distinct value is a threshold, from the largest to the smallest
+    tps = np.cumsum(positives[::-1]).astype(float)
+    fps = np.cumsum(negatives[::-1]).astype(float)
+    precision = tps / (tps + fps)
+    recall = tps / tps[-1]
+
+    # stop when full recall is attained and reverse the outputs so recall is decreasing
+    last_ind = tps.searchsorted(tps[-1])
+    sl = slice(last_ind, None, -1)
+    return np.r_[precision[sl], 1], np.r_[recall[sl], 0]
+
 def calculate2_aupr(pred, truth, full_matrix=True):
+    import sklearn.metrics as mt
+
+    # with few distinct predicted values the curve only depends on the number of true and false entries at every value
+    table = value_pair_counts(pred, truth, full_matrix=full_matrix)
+    if table is None and AUPR_RESOLUTION is not None:
+        table = value_pair_counts(pred, truth, full_matrix=full_matrix, resolution=AUPR_RESOLUTION)
+    if table is not None and set(table[2]) <= set([0, 1]):
+        counts, truth_values = table[0], list(table[2])
+        positives = counts[:, truth_values.index(1)] if 1 in truth_values else np.zeros(len(counts), dtype=np.int64)
+        negatives = counts[:, truth_values.index(0)] if 0 in truth_values else np.zeros(len(counts), dtype=np.int64)
+        precision, recall = precision_recall_from_counts(positives, negatives)
+        if (not full_matrix):
+            recall = np.nan_to_num(recall)
+            precision = np.nan_to_num(precision)
+        return mt.auc(recall, precision)
 
     n = truth.shape[0]
     if full_matrix:
@@ -641,7 +780,6 @@ def calculate2_aupr(pred, truth, full_matrix=True):
         inds = np.triu_indices(n, k=1)
         pred_cp = pred[inds]
         truth_cp = truth[inds]
-    import sklearn.metrics as mt
 
     precision, recall, thresholds = mt.precision_recall_curve(truth_cp, pred_cp)
 
@@ -657,6 +795,15 @@ def calculate2_aupr(pred, truth, full_matrix=True):
 # note about casting: should be int/float friendly for pred/truth matrices
 
 def calculate2_mcc(pred, truth, full_matrix=True):
+    # binary matrices are packed into bits and the confusion counts are popcounts of their ands
+    packed = bitmatrix.pack_binary(pred, truth)
+    if packed is not None:
+        tp, fp, tn, fn = bitmatrix.confusion_counts(packed[0], packed[1], full_matrix=full_matrix)
+    else:
+        tp, fp, tn, fn = mcc_counts(pred, truth, full_matrix=full_matrix)
+    return mcc_from_counts(tp, fp, tn, fn)
+
+def mcc_counts(pred, truth, full_matrix=True):
     n = truth.shape[0]
     ptype = str(pred.dtype)
     ttype = str(truth.dtype)
@@ -706,6 +853,9 @@ def calculate2_mcc(pred, truth, full_matrix=True):
         fn += counts[2]
         tp += counts[3]
 
+    return tp, fp, tn, fn
+
+def mcc_from_counts(tp, fp, tn, fn):
     # To avoid divide-by-zero cases
     denom_terms = [(tp+fp), (tp+fn), (tn+fp), (tn+fn)]
 
@@ -724,12 +874,292 @@ def calculate2_mcc(pred, truth, full_matrix=True):
     return num / float(denom)
 
 
+# dictionary of method names and their corresponding metric functions for SubChallenge 2
+calculate2_funcs = {
+    "orig"           : calculate2_orig,
+    "sqrt"           : calculate2_sqrt,
+    "pseudoV"        : calculate2_pseudoV,
+    "sym_pseudoV"    : calculate2_sym_pseudoV,
+    "spearman"       : calculate2_spearman,
+    "pearson"        : calculate2_pearson,
+    "aupr"           : calculate2_aupr,
+    "mcc"            : calculate2_mcc
+}
+# metrics averaged by the default calculate2 score
+calculate2_default_methods = ['pseudoV', 'pearson', 'mcc']
+
+#### SUBCHALLENGE 2 HARD CLUSTERINGS #######################################################################
+# A co-clustering matrix that comes from a hard clustering is fully described by the cluster of every mutation.
+# Every row of the matrix is then the indicator of a cluster, so the metrics only depend on the overlap of the
+# predicted and the true clusters. The overlap is given as the nonzero entries of the overlap matrix, each with
+# the size of its true cluster and of its predicted cluster and the number of times the entry occurs.
+
+def ccm_labels(ccm):
+    '''
+    Recovers the clusters of a co-clustering matrix that comes from a hard clustering
+    :param ccm: co-clustering matrix
+    :return: array with the cluster label of every mutation (the index of the first mutation in its cluster),
+        None if the matrix is not the co-clustering matrix of a hard clustering
+    '''
+    n = ccm.shape[0]
+    labels = np.empty(n, dtype=np.int64)
+    for start, stop in bitmatrix.row_blocks(n, ccm.shape[1]):
+        block = np.asarray(ccm[start:stop])
+        ones = block == 1
+        # soft matrices are rejected from their first rows, before the rest of the matrix is read
+        if start == 0 and not (np.all(ones | (block == 0)) and np.all(ones[np.arange(stop), np.arange(stop)])):
+            return None
+        labels[start:stop] = np.argmax(ones, axis=1)
+    # every row has to be exactly the indicator of the mutations with the same label
+    for start, stop in bitmatrix.row_blocks(n, ccm.shape[1]):
+        if not np.array_equal(np.asarray(ccm[start:stop]), labels[start:stop, None] == labels[None, :]):
+            return None
+    return labels
+
+def add_overlap_pseudo_counts(entries, num):
+    # pseudo counts are singleton clusters in both matrices
+    return [np.append(x, y) for x, y in zip(entries, [1, 1, 1, num])]
+
+def overlap_entries(truth_labels, pred_labels, pseudo_counts=None):
+    '''
+    Overlap of two hard clusterings of the same mutations
+    :param truth_labels: true cluster of every mutation
+    :param pred_labels: predicted cluster of every mutation
+    :param pseudo_counts: number of pseudo counts to add, floor(sqrt(n)) if None (as in add_pseudo_counts)
+    :return: list of arrays [overlap, size of true cluster, size of predicted cluster, number of occurrences]
+    '''
+    truth_labels = np.unique(truth_labels, return_inverse=True)[1]
+    pred_labels = np.unique(pred_labels, return_inverse=True)[1]
+    n_pred = np.max(pred_labels) + 1
+    pairs, overlap = np.unique(truth_labels * n_pred + pred_labels, return_counts=True)
+    entries = [overlap, np.bincount(truth_labels)[pairs // n_pred], np.bincount(pred_labels)[pairs % n_pred], np.ones(len(pairs))]
+    if pseudo_counts is None:
+        pseudo_counts = np.floor(np.sqrt(len(truth_labels)))
+    return add_overlap_pseudo_counts(entries, pseudo_counts)
+
+def bad_overlap_entries(truth_labels, scenario='OneCluster', pseudo_counts=None):
+    '''
+    Overlap of the truth with the OneCluster or NCluster prediction, as scored by get_bad_score
+    '''
+    sizes = np.bincount(np.unique(truth_labels, return_inverse=True)[1])
+    n = np.sum(sizes)
+    if scenario == 'OneCluster':
+        entries = [sizes, sizes, np.ones(len(sizes)) * n, np.ones(len(sizes))]
+    elif scenario == 'NCluster':
+        entries = [np.ones(len(sizes)), sizes, np.ones(len(sizes)), sizes]
+    else:
+        raise ValueError('Scenario must be one of OneCluster or NCluster')
+    if pseudo_counts is None:
+        pseudo_counts = np.floor(np.sqrt(n))
+    return add_overlap_pseudo_counts(entries, pseudo_counts)
+
+def overlap_confusion_counts(entries):
+    # tp, fp, tn, fn over the full co-clustering matrices, the entries of many replicates are along the last axis
+    overlap, truth_size, pred_size, occurrences = [np.asarray(x, dtype=float) for x in entries]
+    n = np.sum(occurrences * overlap, axis=-1)
+    tp = np.sum(occurrences * overlap * overlap, axis=-1)
+    pred_ones = np.sum(occurrences * overlap * pred_size, axis=-1)
+    truth_ones = np.sum(occurrences * overlap * truth_size, axis=-1)
+    fp = pred_ones - tp
+    fn = truth_ones - tp
+    return tp, fp, n * n - tp - fp - fn, fn
+
+def overlap_pseudoV(entries, rnd=0.01, sym=False):
+    overlap, truth_size, pred_size, occurrences = [np.asarray(x, dtype=float) for x in entries]
+    # every mutation in the overlap has the same pair of rows
+    return bitmatrix.pseudoV_from_counts(overlap, pred_size, truth_size, np.sum(occurrences * overlap, axis=-1, keepdims=True),
+                                         rnd=rnd, sym=sym, weights=occurrences * overlap, axis=-1)
+
+def overlap_sym_pseudoV(entries, rnd=0.01):
+    return overlap_pseudoV(entries, rnd=rnd, sym=True)
+
+def overlap_pearson(entries):
+    tp, fp, tn, fn = overlap_confusion_counts(entries)
+    total = tp + fp + tn + fn
+    pred_ones = tp + fp
+    truth_ones = tp + fn
+    return (tp - pred_ones * truth_ones / total) / np.sqrt((pred_ones - pred_ones**2 / total) * (truth_ones - truth_ones**2 / total))
+
+def overlap_mcc(entries):
+    counts = overlap_confusion_counts(entries)
+    if np.ndim(counts[0]) == 0:
+        return mcc_from_counts(*counts)
+    return np.array([mcc_from_counts(*c) for c in zip(*counts)])
+
+# metrics of calculate2 that can be calculated from the overlap of hard clusterings
+calculate2_overlap_funcs = {
+    "pseudoV"        : overlap_pseudoV,
+    "sym_pseudoV"    : overlap_sym_pseudoV,
+    "pearson"        : overlap_pearson,
+    "mcc"            : overlap_mcc
+}
+
+def calculate2_overlap(truth_labels, pred_labels, method='default', baselines=None):
+    '''
+    Same score as calculate2 (with full matrices and the default pseudo counts) for co-clustering matrices
+    that come from hard clusterings, calculated from the overlap of the clusters
+    :param truth_labels: true cluster of every mutation
+    :param pred_labels: predicted cluster of every mutation
+    :param method: scoring metric used, one of calculate2_overlap_funcs or default
+    :param baselines: worst scores from get_baselines2 or get_baselines2_overlap, computed from the truth if not given
+    :return: subchallenge 2 score
+    '''
+    methods = [method] if method in calculate2_overlap_funcs else calculate2_default_methods
+    entries = overlap_entries(truth_labels, pred_labels)
+    if baselines is None:
+        baselines = get_baselines2_overlap(truth_labels, method=method)
+    scores = [normalize_score2(m, calculate2_overlap_funcs[m](entries), baselines[m]) for m in methods]
+    if method in calculate2_overlap_funcs:
+        return scores[0]
+    return np.mean(scores)
+
+@telemetry.traced('baselines')
+def get_baselines2_overlap(truth_labels, method='default', pseudo_counts=None):
+    '''
+    Same baselines as get_baselines2, for a truth that is a hard clustering
+    :param truth_labels: true cluster of every mutation
+    :param method: scoring metric used, default is the average used by calculate2
+    :param pseudo_counts: number of pseudo counts, floor(sqrt(n)) if None (as in add_pseudo_counts)
+    :return: dictionary with the worst score of each scoring metric
+    '''
+    methods = [method] if method in calculate2_overlap_funcs else calculate2_default_methods
+    one = bad_overlap_entries(truth_labels, 'OneCluster', pseudo_counts=pseudo_counts)
+    n_cluster = bad_overlap_entries(truth_labels, 'NCluster', pseudo_counts=pseudo_counts)
+    baselines = {}
+    for m in methods:
+        scores = [calculate2_overlap_funcs[m](one), calculate2_overlap_funcs[m](n_cluster)]
+        baselines[m] = max(scores) if m in ['pseudoV', 'sym_pseudoV'] else min(scores)
+    return baselines
+
+#### SUBCHALLENGE 2 REPLICATES ##############################################################################
+# The metric behavior studies score many random predictions of the same truth. The replicates are scored as one
+# stack of co-clustering matrices, or of cluster labels, with one NumPy call per metric for all of them.
+
+def calculate2_batch_orig(preds, truth):
+    n = truth.shape[0]
+    return 1 - np.sum(np.abs(preds - truth), axis=(1, 2)) / float(n**2 - n)
+
+def calculate2_batch_sqrt(preds, truth):
+    n = truth.shape[0]
+    return np.sqrt(1 - np.sum(np.abs(preds - truth), axis=(1, 2)) / float(n**2 - n))
+
+def calculate2_batch_pseudoV(preds, truth, rnd=0.01, sym=False):
+    pred_rows = (1 - rnd) * preds + rnd
+    truth_rows = (1 - rnd) * truth + rnd
+    truth_rows /= np.sum(truth_rows, axis=1, keepdims=True)
+    if sym:
+        pred_rows /= np.sum(pred_rows, axis=2, keepdims=True)
+        return np.sum(truth_rows * np.log(truth_rows / pred_rows) + pred_rows * np.log(pred_rows / truth_rows), axis=(1, 2))
+    # the true rows sum to one, so the log of the normalized predicted rows only adds the log of their sums
+    pred_sums = np.sum(pred_rows, axis=2)
+    log_pred = np.log(pred_rows, out=pred_rows)
+    return (np.sum(truth_rows * np.log(truth_rows)) - np.tensordot(log_pred, truth_rows, axes=([1, 2], [0, 1])) +
+            np.sum(np.log(pred_sums), axis=1))
+
+def calculate2_batch_sym_pseudoV(preds, truth, rnd=0.01):
+    return calculate2_batch_pseudoV(preds, truth, rnd=rnd, sym=True)
+
+def calculate2_batch_pearson(preds, truth):
+    m = float(truth.size)
+    p = preds - np.mean(preds, axis=(1, 2), keepdims=True)
+    t = truth - np.mean(truth)
+    sp = np.sqrt(np.sum(p**2, axis=(1, 2)) / (m - 1))
+    st = np.sqrt(np.sum(t**2) / (m - 1))
+    return np.sum(p * t, axis=(1, 2)) / (sp * st) / (m - 1)
+
+def calculate2_batch_mcc(preds, truth):
+    # float matrices are rounded as in mcc_counts
+    p = (np.round(preds + 10.0**(-10)) if 'float' in str(preds.dtype) else preds) != 0
+    t = (np.round(truth + 10.0**(-10)) if 'float' in str(truth.dtype) else truth) != 0
+    tp = np.sum(p & t, axis=(1, 2)).astype(float)
+    fp = np.sum(p & ~t, axis=(1, 2)).astype(float)
+    fn = np.sum(~p & t, axis=(1, 2)).astype(float)
+    tn = truth.size - tp - fp - fn
+    return np.array([mcc_from_counts(*c) for c in zip(tp, fp, tn, fn)])
+
+# metrics of calculate2 that are calculated for a whole stack of matrices, the others are called once per matrix
+calculate2_batch_funcs = {
+    "orig"           : calculate2_batch_orig,
+    "sqrt"           : calculate2_batch_sqrt,
+    "pseudoV"        : calculate2_batch_pseudoV,
+    "sym_pseudoV"    : calculate2_batch_sym_pseudoV,
+    "pearson"        : calculate2_batch_pearson,
+    "mcc"            : calculate2_batch_mcc
+}
+
+def calculate2_batch(preds, truth, method='default', baselines=None):
+    '''
+    Same scores as calculate2 (with full matrices) for a stack of predicted co-clustering matrices
+    :param preds: replicates x n x n array of predicted co-clustering matrices
+    :param truth: true co-clustering matrix
+    :param method: scoring metric used, default is the average used by calculate2
+    :param baselines: worst scores from get_baselines2, computed from the truth if not given
+    :return: array with the score of every replicate
+    '''
+    methods = [method] if method in calculate2_funcs else calculate2_default_methods
+    if baselines is None:
+        baselines = get_baselines2(truth, method=method)
+    scores = []
+    for m in methods:
+        if m in calculate2_batch_funcs:
+            raw = calculate2_batch_funcs[m](preds, truth)
+        else:
+            raw = [calculate2_funcs[m](pred, truth) for pred in preds]
+        scores.append([normalize_score2(m, s, baselines[m]) for s in raw])
+    return np.mean(scores, axis=0)
+
+def overlap_matrices(truth_labels, pred_labels):
+    '''
+    Overlap matrices of a true clustering and many predicted clusterings of the same mutations
+    :param truth_labels: true cluster of every mutation
+    :param pred_labels: replicates x mutations array with the predicted cluster (from 0) of every mutation
+    :return: replicates x true clusters x predicted clusters array, the number of mutations in both clusters
+    '''
+    truth_labels = np.unique(truth_labels, return_inverse=True)[1]
+    pred_labels = np.asarray(pred_labels)
+    n_rep = pred_labels.shape[0]
+    n_truth = np.max(truth_labels) + 1
+    n_pred = np.max(pred_labels) + 1
+    pairs = (np.arange(n_rep)[:, None] * n_truth + truth_labels[None, :]) * n_pred + pred_labels
+    return np.bincount(pairs.ravel(), minlength=n_rep * n_truth * n_pred).reshape(n_rep, n_truth, n_pred)
+
+def calculate2_overlap_batch(truth_labels, pred_labels, method='default', baselines=None, pseudo_counts=0):
+    '''
+    Same scores as calculate2 for many predicted hard clusterings of the same mutations, calculated from
+    the overlap of the clusters
+    :param truth_labels: true cluster of every mutation
+    :param pred_labels: replicates x mutations array with the predicted cluster (from 0) of every mutation
+    :param method: scoring metric used, one of calculate2_overlap_funcs or default
+    :param baselines: worst scores from get_baselines2 or get_baselines2_overlap, computed from the truth if not given
+    :param pseudo_counts: number of pseudo counts added to both clusterings, none by default as in calculate2,
+        None for floor(sqrt(n)) as in add_pseudo_counts
+    :return: array with the score of every replicate
+    '''
+    if pseudo_counts is None:
+        pseudo_counts = np.floor(np.sqrt(len(truth_labels)))
+    methods = [method] if method in calculate2_overlap_funcs else calculate2_default_methods
+    om = overlap_matrices(truth_labels, pred_labels)
+    n_rep = om.shape[0]
+    # every entry of the overlap matrices, the empty ones occur zero times
+    entries = [om, np.broadcast_to(np.sum(om, axis=2)[:, :, None], om.shape),
+               np.broadcast_to(np.sum(om, axis=1)[:, None, :], om.shape), np.ones(om.shape)]
+    pseudo = [1, 1, 1, pseudo_counts]
+    entries = [np.hstack([x.reshape(n_rep, -1), np.ones((n_rep, 1)) * y]) for x, y in zip(entries, pseudo)]
+    if baselines is None:
+        baselines = get_baselines2_overlap(truth_labels, method=method, pseudo_counts=pseudo_counts)
+    scores = [[normalize_score2(m, s, baselines[m]) for s in calculate2_overlap_funcs[m](entries)] for m in methods]
+    if method in calculate2_overlap_funcs:
+        return np.array(scores[0])
+    return np.mean(scores, axis=0)
+
+
 #### SUBCHALLENGE 3 #########################################################################################
 
-def validate3A(data, cas, nssms, mask=None):
+def validate3A(data, cas, nssms, mask=None, out=None):
     # why do we even do a validate2A if we're basically just re-assembling the 2A file..
+    # out - optional n x n int8 matrix (e.g. a np.memmap) that the AD matrix is written into, one block of rows at a time
     predK = cas.shape[1]
-    cluster_assignments = np.argmax(cas, 1) + 1
+    cluster_assignments = np.asarray(np.argmax(cas, 1)).ravel() + 1
 
     data = data.split('\n')
     data = filter(None, data)
@@ -748,45 +1178,41 @@ def validate3A(data, cas, nssms, mask=None):
     if [x[0] for x in data] != range(1, predK+1):
         raise ValidationError("First column must have %d entries in ascending order starting with 1" % predK)
 
+    valid_parents = set(range(predK+1))
     for i in range(len(data)):
-        if data[i][1] not in set(range(predK+1)):
+        if data[i][1] not in valid_parents:
             raise ValidationError("Parent node label in line %d is not valid." % (i+1))
 
-    # Form descendant of dict.  Each entry, keyed by cluster number, consists of a list of nodes that are decendents of the key.
-    descendant_of = dict()
-    for i in range(predK+1):
-        descendant_of[i] = []
-    for child, parent in data:
-        descendant_of[parent] += [child] + descendant_of[child]
-        # gps (grandparents) are the list of nodes that are ancestors of the immediate parent
-        gps = [x for x in descendant_of.keys() if parent in descendant_of[x]]
-        for gp in gps:
-            descendant_of[gp] += [child] + descendant_of[child]
+    # ancestor matrix of the clusters, row and column 0 are the root
+    cluster_ad = phylogeny_closure([x[1] for x in data])
 
     # Check that root has all nodes as decendants (equivalent to checking if the tree is connected)
-    if set(descendant_of[0]) != set(range(1, predK+1)):
+    if cluster_ad is None:
         raise ValidationError("Root of phylogeny not ancestor of all clusters / Tree is not connected. " +
-                              "Phelogeny matrix: %s, Descendant_of Dictionary %s" %
-                              (data, descendant_of))
+                              "Phelogeny matrix: %s" % data)
 
-    # Form AD matrix
+    # Form AD matrix, every mutation takes the row and column of its cluster
+    # can use int8 because only 0 and 1 integers
+    cluster_ad = cluster_ad.astype(np.int8)
+
+    if out is None:
+        return cluster_ad[cluster_assignments[:, None], cluster_assignments[None, :]]
 
     n = len(cluster_assignments)
-    # can use int8 because only 0 and 1 integers
-    ad = np.zeros((n, n), dtype=np.int8)
-    for i in range(n):
-        for j in range(n):
-            if cluster_assignments[j] in descendant_of[cluster_assignments[i]]:
-                ad[i, j] = 1
-    return ad
+    # rows per block so that a block takes about 64mb
+    block = max(1, 2**26 // max(n, 1))
+    for start in xrange(0, n, block):
+        rows = cluster_assignments[start:start+block]
+        out[start:start+len(rows)] = cluster_ad[rows[:, None], cluster_assignments[None, :]]
+    return out
 
 
-def validate3B(filename, ccm, nssms, mask=None):
+def validate3B(filename, ccm, nssms, mask=None, dtype=np.float64):
     size = ccm.shape[0]
     
     try:
         if os.path.exists(filename):
-            ad = np.zeros((size, size))
+            ad = np.zeros((size, size), dtype=dtype)
             if is_gzip(filename):
                 gzipfile = gzip.open(str(filename), 'r')
             else:
@@ -804,7 +1230,7 @@ def validate3B(filename, ccm, nssms, mask=None):
             #ad = filename
             # TODO - optimize with line by line 
             data = StringIO.StringIO(filename)
-            ad = np.zeros((nssms, nssms))
+            ad = np.zeros((nssms, nssms), dtype=dtype)
             cm = np.loadtxt(data, ndmin=2)
             ad[:nssms, :nssms] = cm
 
@@ -834,22 +1260,25 @@ def checkForBadTriuIndices(*matrices):
     # plus, doing matrix[np.triu_indices()] creates a copy which is doubly bad
     shape = matrices[0].shape
     equalShapes = True
-    fail = True
     for x in matrices:
         equalShapes &= shape == x.shape
         if (not equalShapes):
             break
-    if (equalShapes):
-        for i in xrange(shape[0]):
-            for j in xrange(i + offset, shape[0]):
-                fail &= reduce(lambda x, y: x + y, [z[i, j] for z in matrices]) <= 1
-                if (not fail):
-                    break
-    else:
+    if (not equalShapes):
         raise ValidationError('Unequal shapes passed to checkForBadTriuIndices')
-    return not fail
 
-def calculate3Final(pred_ccm, pred_ad, truth_ccm, truth_ad, method="default"):
+    # for binary matrices the sum is > 1 exactly where two of them have a one at the same entry
+    packed = bitmatrix.pack_binary(*matrices)
+    if packed is not None:
+        return bitmatrix.any_overlap_triu(*packed)
+
+    for i in xrange(shape[0]):
+        row_sum = reduce(lambda x, y: x + y, [np.asarray(z[i, (i + offset):]).ravel() for z in matrices])
+        if np.any(row_sum > 1):
+            return True
+    return False
+
+def calculate3Final(pred_ccm, pred_ad, truth_ccm, truth_ad, method="default", baselines=None):
     f = calculate2_sym_pseudoV
     
     scores = []
@@ -861,41 +1290,148 @@ def calculate3Final(pred_ccm, pred_ad, truth_ccm, truth_ad, method="default"):
     del pred_c, truth_c
     gc.collect()
 
+    if baselines is None:
+        baselines = get_baselines3Final(truth_ccm, truth_ad)
+
+    score = sum(scores) / 3.0
+
+#imaad: I commented out the return of two scorse because we will be going with n_score_permute
+#    return [set_to_zero(1 - (score / max(one_score, n_score))),set_to_zero(1 - (score / max(one_score, n_score_permute)))]
+    return set_to_zero(1 - (score / max(baselines['OneCluster'], baselines['NCluster'])))
+
+@telemetry.traced('baselines')
+def get_baselines3Final(truth_ccm, truth_ad):
+    """
+    Calculate the OneCluster and the (permuted) NCluster scores used to normalize calculate3Final.
+    They only depend on the truth, so they can be computed once per truth file
+
+    :param truth_ccm: true co-clustering matrix
+    :param truth_ad: true ancestor-descendant matrix
+    :return: dictionary with the OneCluster and NCluster scores
+    """
+    f = calculate2_sym_pseudoV
+
     one_scores = []
-    one_ad = mb.get_ad('OneCluster', nssms=truth_ad.shape[0])
+    # not cached, they are as large as the truth and only needed once per truth
+    one_ad = mb.get_ad('OneCluster', nssms=truth_ad.shape[0], cache=False)
     one_scores.append(f(one_ad, truth_ad))
     one_scores.append(f(one_ad.T, truth_ad.T))
     truth_c = makeCMatrix(truth_ccm, truth_ad, truth_ad.T)
-    one_ccm = mb.get_ccm('OneCluster', nssms=truth_ccm.shape[0])
+    one_ccm = mb.get_ccm('OneCluster', nssms=truth_ccm.shape[0], cache=False)
     one_c = makeCMatrix(one_ccm, one_ad, one_ad.T)
     one_scores.append(f(one_c, truth_c))
     del one_c, truth_c, one_ad, one_ccm
     gc.collect()
 
-    n_scores = []
-    n_ad = mb.get_ad('NClusterOneLineage', nssms=truth_ad.shape[0])
-    n_scores.append(f(n_ad, truth_ad))
-    n_scores.append(f(n_ad.T, truth_ad.T))
+    # only the cousin matrix score of NClusterOneLineage is used, the AD scores are replaced by the permuted ones
     truth_c = makeCMatrix(truth_ccm, truth_ad, truth_ad.T)
-    n_ccm = mb.get_ccm('NClusterOneLineage', nssms=truth_ccm.shape[0])
+    n_ad = mb.get_ad('NClusterOneLineage', nssms=truth_ad.shape[0], cache=False)
+    n_ccm = mb.get_ccm('NClusterOneLineage', nssms=truth_ccm.shape[0], cache=False)
     n_c = makeCMatrix(n_ccm, n_ad, n_ad.T)
-    n_scores.append(f(n_c, truth_c))
+    n_c_score = f(n_c, truth_c)
     del n_c, truth_c, n_ad, n_ccm
     gc.collect()
 
     n_scores_permute = []
     n_scores_permute.append(ccm_permute_N_cluster(truth_ad))
     n_scores_permute.append(ccm_permute_N_cluster(truth_ad.T))
-    n_scores_permute.append(n_scores[2])
+    n_scores_permute.append(n_c_score)
+
+    return { 'OneCluster' : sum(one_scores) / 3.0, 'NCluster' : sum(n_scores_permute) / 3.0 }
+
+#### SUBCHALLENGE 3B HARD CLUSTERINGS ######################################################################
+# A 3B submission whose co-clustering matrix is a hard clustering and whose AD matrix is constant on the blocks
+# of the clusters carries no more information than a 3A submission. Every matrix used by calculate3Final is then
+# constant on the blocks too, and each of its rows only depends on the (true, predicted) clusters of the mutation.
+
+def cluster_blocks(ccm, ad):
+    '''
+    Recovers the clusters and the cluster level AD matrix of a hard clustering
+    :param ccm: co-clustering matrix
+    :param ad: ancestor-descendant matrix
+    :return: (index of the cluster of every mutation, K x K cluster AD matrix),
+        None if the ccm is not a hard clustering or the AD matrix is not binary and constant on the cluster blocks
+    '''
+    labels = ccm_labels(ccm)
+    if labels is None:
+        return None
+    first, clusters = np.unique(labels, return_inverse=True)
+    ad_clusters = np.asarray(ad[first][:, first])
+    if not np.all((ad_clusters == 0) | (ad_clusters == 1)):
+        return None
+    for start, stop in bitmatrix.row_blocks(ad.shape[0], ad.shape[1]):
+        if not np.array_equal(np.asarray(ad[start:stop]), ad_clusters[clusters[start:stop, None], clusters[None, :]]):
+            return None
+    return clusters, ad_clusters.astype(np.int8)
+
+def cousin_clusters(ad_clusters):
+    # cluster level version of makeCMatrix, mutations of one cluster are never cousins
+    return 1 - np.identity(ad_clusters.shape[0], dtype=np.int8) - ad_clusters - ad_clusters.T
+
+def block_sym_pseudoV(om, pred_clusters, truth_clusters, rnd=0.01):
+    '''
+    calculate2_sym_pseudoV of two binary mutation level matrices that are constant on the cluster blocks
+    :param om: overlap matrix, number of mutations in every (true cluster, predicted cluster)
+    :param pred_clusters: cluster level predicted matrix
+    :param truth_clusters: cluster level true matrix
+    '''
+    om = np.asarray(om, dtype=float)
+    # ones in the rows of a mutation of true cluster a and predicted cluster b, on their own and in both rows
+    pred_ones = np.dot(pred_clusters, np.sum(om, axis=0))
+    truth_ones = np.dot(truth_clusters, np.sum(om, axis=1))
+    n11 = np.dot(np.dot(truth_clusters, om), np.transpose(pred_clusters))
+    return bitmatrix.pseudoV_from_counts(n11, pred_ones[None, :], truth_ones[:, None], np.sum(om), rnd=rnd, sym=True, weights=om)
+
+def calculate3_overlap(truth_blocks, pred_blocks, baselines=None):
+    '''
+    Same score as calculate3Final for hard clusterings with block constant AD matrices, from the cluster level matrices
+    :param truth_blocks: true (cluster of every mutation, cluster AD matrix), from cluster_blocks
+    :param pred_blocks: predicted (cluster of every mutation, cluster AD matrix) for the same mutations
+    :param baselines: scores from get_baselines3Final or get_baselines3_overlap, computed from the truth if not given
+    :return: subchallenge 3 score
+    '''
+    truth_labels, truth_ad = truth_blocks
+    pred_labels, pred_ad = pred_blocks
+    n_pred = pred_ad.shape[0]
+    om = np.bincount(truth_labels * n_pred + pred_labels, minlength=truth_ad.shape[0] * n_pred).reshape(-1, n_pred)
+
+    scores = []
+    scores.append(block_sym_pseudoV(om, pred_ad, truth_ad))
+    scores.append(block_sym_pseudoV(om, pred_ad.T, truth_ad.T))
+    scores.append(block_sym_pseudoV(om, cousin_clusters(pred_ad), cousin_clusters(truth_ad)))
+
+    if baselines is None:
+        baselines = get_baselines3_overlap(truth_blocks)
 
     score = sum(scores) / 3.0
-    one_score = sum(one_scores) / 3.0
-    n_score = sum(n_scores) / 3.0
-    n_score_permute = sum(n_scores_permute) / 3.0
+    return set_to_zero(1 - (score / max(baselines['OneCluster'], baselines['NCluster'])))
+
+@telemetry.traced('baselines')
+def get_baselines3_overlap(truth_blocks):
+    '''
+    Same baselines as get_baselines3Final, for a truth that is a hard clustering with a block constant AD matrix
+    :param truth_blocks: true (cluster of every mutation, cluster AD matrix), from cluster_blocks
+    :return: dictionary with the OneCluster and NCluster scores
+    '''
+    truth_labels, truth_ad = truth_blocks
+    sizes = np.bincount(truth_labels, minlength=truth_ad.shape[0])
+    # the OneCluster prediction is a single cluster without descendants or cousins
+    om = sizes.reshape(-1, 1)
+    zeros = np.zeros((1, 1), dtype=np.int8)
+
+    one_scores = []
+    one_scores.append(block_sym_pseudoV(om, zeros, truth_ad))
+    one_scores.append(block_sym_pseudoV(om, zeros, truth_ad.T))
+    one_scores.append(block_sym_pseudoV(om, zeros, cousin_clusters(truth_ad)))
+
+    # NClusterOneLineage has no cousins either, so its cousin score is the one of OneCluster
+    n_scores_permute = []
+    n_scores_permute.append(descendants_permute_N_cluster(np.dot(truth_ad, sizes)[truth_labels]))
+    n_scores_permute.append(descendants_permute_N_cluster(np.dot(truth_ad.T, sizes)[truth_labels]))
+    n_scores_permute.append(one_scores[2])
+
+    return { 'OneCluster' : sum(one_scores) / 3.0, 'NCluster' : sum(n_scores_permute) / 3.0 }
 
-#imaad: I commented out the return of two scorse because we will be going with n_score_permute
-#    return [set_to_zero(1 - (score / max(one_score, n_score))),set_to_zero(1 - (score / max(one_score, n_score_permute)))]
-    return set_to_zero(1 - (score / max(one_score, n_score_permute)))
 def makeCMatrix(*matrices):
     # perform (1 - *matrices) without loading all the matrices into memory
     shape = matrices[0].shape
@@ -905,7 +1441,11 @@ def makeCMatrix(*matrices):
         if (not equalShapes):
             break
     if (equalShapes):
-        output = np.ones([shape[0], shape[0]])
+        # integer inputs only hold 0/1 entries, so the output fits in int8 and can be packed later on
+        if all(np.issubdtype(x.dtype, np.integer) or x.dtype == np.bool_ for x in matrices):
+            output = np.ones([shape[0], shape[0]], dtype=np.int8)
+        else:
+            output = np.ones([shape[0], shape[0]], dtype=np.result_type(*matrices))
         for i in xrange(shape[0]):
             output[i, ] -= reduce(lambda x, y: x + y, [z[i, ] for z in matrices])
     else:
@@ -913,7 +1453,7 @@ def makeCMatrix(*matrices):
     return output
 
 
-def calculate3(pred_ccm, pred_ad, truth_ccm, truth_ad, method="sym_pseudoV", weights=None, verbose=False, pseudo_counts=True, full_matrix=True, in_mat=2):
+def calculate3(pred_ccm, pred_ad, truth_ccm, truth_ad, method="sym_pseudoV", weights=None, verbose=False, pseudo_counts=True, full_matrix=True, in_mat=2, baselines=None):
     """
     Calculate the score for subchallenge 3 using the given metric or a weighted average of the
     given metrics, if more than one are specified.
@@ -934,6 +1474,7 @@ def calculate3(pred_ccm, pred_ad, truth_ccm, truth_ad, method="sym_pseudoV", wei
             3 - use all except ancestor descendant matrix (ADM)
             4 - use all except ADM^T
             5 - use all except cousin matrix (CM)
+    :param baselines: worst scores from get_baselines3, computed from the truth if not given
     :return: score for the given submission to subchallenge 3 using the given metric
     """
     larger_is_worse_methods = ['sym_pseudoV_nc', 'sym_pseudoV', 'pseudoV_nc', 'pseudoV', "simpleKL_nc", 'simpleKL'] # methods where a larger score is worse
@@ -948,20 +1489,13 @@ def calculate3(pred_ccm, pred_ad, truth_ccm, truth_ad, method="sym_pseudoV", wei
                                     method=m, verbose=verbose, in_mat=in_mat) for m in method] # calculate the score for each method
 
         # normalize the scores to be between (worst of NCluster score and OneCluster score) and (Truth score)
-        ncluster_ccm, ncluster_ad = add_pseudo_counts(mb.get_ccm('NClusterOneLineage', nssms=nssms), mb.get_ad('NClusterOneLineage', nssms=nssms))
-        ncluster_score = [calculate3_onemetric(ncluster_ccm, ncluster_ad, pc_truth_ccm, pc_truth_ad,
-                                               method=m, verbose=verbose, full_matrix=full_matrix, in_mat=in_mat) for m in method]
-        del ncluster_ccm, ncluster_ad
-        onecluster_ccm, onecluster_ad = add_pseudo_counts(mb.get_ccm('OneCluster', nssms=nssms), mb.get_ad('OneCluster', nssms=nssms))
-        onecluster_score = [calculate3_onemetric(onecluster_ccm, onecluster_ad, pc_truth_ccm, pc_truth_ad,
-                                                 method=m, verbose=verbose, full_matrix=full_matrix, in_mat=in_mat) for m in method]
-        del onecluster_ccm, onecluster_ad
+        if baselines is None:
+            baselines = get_baselines3(pc_truth_ccm, pc_truth_ad, method, nssms=nssms, verbose=verbose, full_matrix=full_matrix, in_mat=in_mat)
         for i in range(len(method)):
+            worst_score = baselines[method[i]] # worst of NCluster and OneCluster scores
             if method[i] in larger_is_worse_methods: # normalization for methods where a larger score is worse
-                worst_score = max(ncluster_score[i], onecluster_score[i]) # worst of NCluster and OneCluster scores
                 res[i] = 1 - (res[i] / worst_score) # normalize the score
             else: # normalization for methods where a smaller score is worse
-                worst_score = min(ncluster_score[i], onecluster_score[i])
                 res[i] = (res[i] - worst_score) / (1 - worst_score)
 
 
@@ -980,25 +1514,52 @@ def calculate3(pred_ccm, pred_ad, truth_ccm, truth_ad, method="sym_pseudoV", wei
         del pc_pred_ccm
         del pc_pred_ad
         # normalize the score to be between (worst of NCluster score and OneCluster score) and (Truth score) - similar to above
-        ncluster_ccm, ncluster_ad = add_pseudo_counts(mb.get_ccm('NClusterOneLineage', nssms=nssms), mb.get_ad('NClusterOneLineage', nssms=nssms))
-        ncluster_score = calculate3_onemetric(ncluster_ccm, ncluster_ad, pc_truth_ccm, pc_truth_ad,
-                                              method=method, verbose=verbose, full_matrix=full_matrix, in_mat=in_mat)
-        del ncluster_ccm, ncluster_ad
-        onecluster_ccm, onecluster_ad = add_pseudo_counts(mb.get_ccm('OneCluster', nssms=nssms), mb.get_ad('OneCluster', nssms=nssms))
-        
-        onecluster_score = calculate3_onemetric(onecluster_ccm, onecluster_ad, pc_truth_ccm, pc_truth_ad,
-                                                method=method, verbose=verbose, full_matrix=full_matrix, in_mat=in_mat)
-        del onecluster_ccm, onecluster_ad
+        if baselines is None:
+            baselines = get_baselines3(pc_truth_ccm, pc_truth_ad, [method], nssms=nssms, verbose=verbose, full_matrix=full_matrix, in_mat=in_mat)
+        worst_score = baselines[method]
 
-        #print score, ncluster_score, onecluster_score
         if method in larger_is_worse_methods:
-            worst_score = max(ncluster_score, onecluster_score)
             score = 1 - (score / worst_score)
         else:
-            worst_score = min(ncluster_score, onecluster_score)
             score = (score - worst_score) / (1 - worst_score)
     return score
 
+@telemetry.traced('baselines')
+def get_baselines3(truth_ccm, truth_ad, methods, nssms=None, verbose=False, full_matrix=True, in_mat=2):
+    """
+    Calculate the worst scores (worst of NCluster and OneCluster) used to normalize calculate3.
+    They only depend on the truth, so they can be computed once per truth file
+
+    :param truth_ccm: true co-clustering matrix, including pseudo counts
+    :param truth_ad: true ancestor-descendant matrix, including pseudo counts
+    :param methods: list of methods to compute the worst score for
+    :param nssms: number of SSMs without the pseudo counts, computed from the matrix size if not given
+    :return: dictionary with the worst score of each method
+    """
+    larger_is_worse_methods = ['sym_pseudoV_nc', 'sym_pseudoV', 'pseudoV_nc', 'pseudoV', "simpleKL_nc", 'simpleKL'] # methods where a larger score is worse
+
+    if nssms is None:
+        y = np.array(truth_ad.shape)[1]
+        nssms = int(np.ceil(0.5 * (2*y + 1) - 0.5 * np.sqrt(4*y + 1)))
+
+    # the matrices of get_ccm are cached read-only, add_pseudo_counts resizes the ccm in place
+    ncluster_ccm, ncluster_ad = add_pseudo_counts(np.copy(mb.get_ccm('NClusterOneLineage', nssms=nssms)), mb.get_ad('NClusterOneLineage', nssms=nssms))
+    ncluster_score = [calculate3_onemetric(ncluster_ccm, ncluster_ad, truth_ccm, truth_ad,
+                                           method=m, verbose=verbose, full_matrix=full_matrix, in_mat=in_mat) for m in methods]
+    del ncluster_ccm, ncluster_ad
+    onecluster_ccm, onecluster_ad = add_pseudo_counts(np.copy(mb.get_ccm('OneCluster', nssms=nssms)), mb.get_ad('OneCluster', nssms=nssms))
+    onecluster_score = [calculate3_onemetric(onecluster_ccm, onecluster_ad, truth_ccm, truth_ad,
+                                             method=m, verbose=verbose, full_matrix=full_matrix, in_mat=in_mat) for m in methods]
+    del onecluster_ccm, onecluster_ad
+
+    baselines = {}
+    for i, m in enumerate(methods):
+        if m in larger_is_worse_methods:
+            baselines[m] = max(ncluster_score[i], onecluster_score[i])
+        else:
+            baselines[m] = min(ncluster_score[i], onecluster_score[i])
+    return baselines
+
 # dictionary of method names and their corresponding metric functions
 method_funcs = {"pseudoV": calculate2_pseudoV,
                "simpleKL": calculate2_simpleKL,
@@ -1089,29 +1650,70 @@ def calculate3_onemetric(pred_ccm, pred_ad, truth_ccm, truth_ad, rnd=0.01, metho
     return res
 
 
-def parseVCF1C(data, sample_mask=None):
-    data = data.split('\n')
-    data = [x for x in data if x != '']
-    data = [x for x in data if x[0] != '#']
-    if len(data) == 0:
+def read_vcf_truth(vcf):
+    '''
+    Reads the truth flag (last column is True) of every SSM in a scoring vcf, one line at a time.
+    Header lines and empty lines are skipped, plain and gzip compressed files are supported.
+    If there is a <vcf>.mask.npy sidecar that is not older than the vcf, the flags are loaded from it instead.
+    :param vcf: path to the vcf, IOError if it cannot be read
+    :return: boolean array with the truth flag of every SSM
+    '''
+    sidecar = vcf + '.mask.npy'
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(vcf):
+        return np.load(sidecar)
+
+    if is_gzip(vcf):
+        handle = gzip.open(vcf, 'r')
+    else:
+        handle = open(vcf, 'r')
+    try:
+        truth = vcf_truth_flags(handle)
+    finally:
+        handle.close()
+
+    if WRITE_VCF_MASK:
+        try:
+            tmp = '%s.%d.tmp' % (sidecar, os.getpid())
+            with open(tmp, 'wb') as f:
+                np.save(f, truth)
+            os.rename(tmp, sidecar)
+        except (IOError, OSError):
+            # the sidecar only saves time, scoring does not depend on it
+            traceback.print_exc()
+    return truth
+
+def read_vcf_truth_text(data):
+    '''
+    Reads the truth flag of every SSM from the content of a scoring vcf, see read_vcf_truth
+    :param data: content of the vcf
+    :return: boolean array with the truth flag of every SSM
+    '''
+    return vcf_truth_flags(StringIO.StringIO(data))
+
+def vcf_truth_flags(lines):
+    # same rules as splitting the whole vcf on newlines: skip empty lines and headers, True lines end in "True"
+    lines = (x.rstrip('\n') for x in lines)
+    return np.fromiter((x[-4:] == "True" for x in lines if x != '' and x[0] != '#'), dtype=bool)
+
+def parseVCF1C(data, sample_mask=None, is_path=False):
+    truth = read_vcf_truth(data) if is_path else read_vcf_truth_text(data)
+    if len(truth) == 0:
         raise ValidationError("Input VCF contains no SSMs")
-    return [[len(data)], [len(data)]]
+    return [[len(truth)], [len(truth)]]
 
-def parseVCF2and3(data, sample_mask=None):
+def parseVCF2and3(data, sample_mask=None, is_path=False):
 
-    data = data.split('\n')
-    data = [x for x in data if x != '']
-    data = [x for x in data if x[0] != '#']
+    # data is the content of the vcf, or its path when is_path is set (verify)
+    truth = read_vcf_truth(data) if is_path else read_vcf_truth_text(data)
 
     # apply sample_mask to data, sample_mask exists
-    data = [x for i, x in enumerate(data) if i in sample_mask] if sample_mask else data
+    truth = truth[np.asarray(sample_mask, dtype=int)] if sample_mask else truth
 
-    if len(data) == 0:
+    if len(truth) == 0:
         raise ValidationError("Input VCF contains no SSMs")
-    vcf_lines = len(data)
-    # check if line is true or false, array of 0/1's
-    mask = [x[-4:] == "True" for x in data]
-    mask = [i for i, x in enumerate(mask) if x]
+    vcf_lines = len(truth)
+    # indices of the lines that are true
+    mask = np.flatnonzero(truth).tolist()
     true_lines = len(mask)
 
     # return
@@ -1177,6 +1779,8 @@ def add_pseudo_counts(ccm, ad=None, num=None):
         num = np.floor(np.sqrt(old_n))
     elif num == 0:
         return ccm, ad
+    # the number of pseudo counts is used as a shape and in slices
+    num = int(num)
 
     # EVERYTHING is done in memory
     #   The matrix is extended from nxn to mxm where { m = n + sqrt(n) }
@@ -1285,21 +1889,22 @@ def get_bad_ad(nssms, scenario='OneCluster'):
 
 def verify(filename, role, func, *args, **kwargs):
     # printInfo('ARGS -> %s | %s | %s | %s | %s' % (filename, role, func, args, kwargs))
-    t_start = time.time()
-    
     try:
-        if func.__name__ in ['validate2B']:
-            verified = func(filename,*args, **kwargs)
-        elif is_gzip(filename): #pass compressed files directly to 2B or 3B validate functions
-            verified = func(filename, *args, **kwargs)
-        #if is_gzip(filename):
-        #    verified = func(filename, *args, **kwargs)
-        else:
-            # really shouldn't do read() here, stores the whole thing in memory when we could read it in chunks/lines
-            f = open(filename)
-            data = f.read()
-            f.close()
-            verified = func(data, *args, **kwargs)
+        with telemetry.span('verify', function=func.__name__, file=filename):
+            if func.__name__ in ['parseVCF1C', 'parseVCF2and3']: #the vcf parsers read the file one line at a time
+                verified = func(filename, *args, is_path=True, **kwargs)
+            elif func.__name__ in ['validate2B']:
+                verified = func(filename,*args, **kwargs)
+            elif is_gzip(filename): #pass compressed files directly to 2B or 3B validate functions
+                verified = func(filename, *args, **kwargs)
+            #if is_gzip(filename):
+            #    verified = func(filename, *args, **kwargs)
+            else:
+                # really shouldn't do read() here, stores the whole thing in memory when we could read it in chunks/lines
+                f = open(filename)
+                data = f.read()
+                f.close()
+                verified = func(data, *args, **kwargs)
     except (IOError, TypeError) as e:
         traceback.print_exc()
         err_msgs.append("Error opening %s, from function %s using file %s in" %  (role, func, filename))
@@ -1309,21 +1914,24 @@ def verify(filename, role, func, *args, **kwargs):
         return None
     except SampleError as e:
         raise e
-    t_end = time.time()
-    #print (filename +  "  " + str(t_end - t_start)) #debug
     return verified
 
-def verify2A(filename_pred, filename_truth, role, pred_size, truth_size, filter_mut=None, mask=None, subchallenge="2A"):
+def verify2A(filename_pred, filename_truth, role, pred_size, truth_size, filter_mut=None, mask=None, subchallenge="2A", truth_labels=None):
     try:
-        f = open(filename_pred)
-        data1 = f.read()
-        f = open(filename_truth)
-        data2 = f.read()
-        f.close()
-        if subchallenge is "3A":
-            verified, raw = om_validate2A(data1, data2, pred_size, truth_size, filter_mut=filter_mut, mask=mask, subchallenge=subchallenge)
-            return verified, raw
-        verified = om_validate2A(data1, data2, pred_size, truth_size, filter_mut=filter_mut, mask=mask, subchallenge=subchallenge)
+        # om_validate2A reads the files line by line
+        with open(filename_pred) as data1:
+            if truth_labels is not None:
+                data2 = truth_labels
+            else:
+                data2 = open(filename_truth)
+            try:
+                if subchallenge is "3A":
+                    verified, raw = om_validate2A(data1, data2, pred_size, truth_size, filter_mut=filter_mut, mask=mask, subchallenge=subchallenge)
+                    return verified, raw
+                verified = om_validate2A(data1, data2, pred_size, truth_size, filter_mut=filter_mut, mask=mask, subchallenge=subchallenge)
+            finally:
+                if truth_labels is None:
+                    data2.close()
     except (IOError, TypeError) as e:
         traceback.print_exc()
         err_msgs.append("Error opening %s, from function new_validate2A using file %s and %s in" %  (role, filename_pred, filename_truth))
@@ -1335,6 +1943,232 @@ def verify2A(filename_pred, filename_truth, role, pred_size, truth_size, filter_
         raise e
     return verified, [-1]
 
+def new_artifact_cache(challenge_files):
+    '''
+    Creates the per-invocation artifact cache used when several challenges are scored in one run.
+    Only files that are used by more than one challenge are cached, so scoring a single challenge
+    does not keep an extra copy of its matrices around.
+    :param challenge_files: list with one list of files (pred, truth and vcf) per challenge to be scored
+    :return: artifact cache to pass to scoreChallenge
+    '''
+    counts = {}
+    for files in challenge_files:
+        for path in set(os.path.abspath(f) for f in files):
+            counts[path] = counts.get(path, 0) + 1
+    return { 'shared' : set(p for p, c in counts.items() if c > 1), 'artifacts' : {} }
+
+def cached_artifact(cache, kind, paths, mask, loader, copy=False, derived=False):
+    '''
+    Returns the parsed artifact (VCF mask, cluster labels, overlap matrix, CCM..) for the given files,
+    only calling loader() if it has not been parsed yet in this invocation.
+    :param cache: artifact cache from new_artifact_cache, or None to disable caching
+    :param kind: name of the parsed form, so one file can be cached in more than one form
+    :param paths: files the artifact is parsed from, keyed by (path, mtime)
+    :param mask: sampling mask applied while parsing (None if no mask)
+    :param loader: function that parses the artifact, returns None if the files do not validate
+    :param copy: hand out a copy of a cached array, for callers that modify it in place (filterFPs, add_pseudo_counts)
+    :param derived: the artifact is computed from other artifacts (e.g. the truth with pseudo counts), it is only kept
+        by caches that are reused for many predictions (see batch_scoring.TruthContext)
+    :return: the parsed artifact
+    '''
+    if cache is None or (derived and not cache.get('derived', False)):
+        return loader()
+    paths = [os.path.abspath(p) for p in paths]
+    if not all(p in cache['shared'] for p in paths):
+        return loader()
+    try:
+        key = (kind,) + tuple((p, os.path.getmtime(p)) for p in paths) + (None if mask is None else tuple(mask),)
+    except OSError:
+        return loader()
+
+    if key not in cache['artifacts']:
+        artifact = loader()
+        # don't cache failures, every challenge should report its own validation errors
+        if artifact is None:
+            return artifact
+        cache['artifacts'][key] = artifact
+        printInfo('CACHED %s -> ' % kind, paths)
+    artifact = cache['artifacts'][key]
+    if copy and isinstance(artifact, np.ndarray):
+        return np.copy(artifact)
+    return artifact
+
+def stored_truth(store, kind, paths, mask, loader, writable=False):
+    '''
+    Returns a parsed truth artifact from the on-disk truth store, calling loader() and storing
+    the result the first time the truth files are seen. Stored arrays are memory mapped read-only.
+    Nothing is stored or loaded when a sampling mask is used.
+    :param store: truth store directory, or None to disable the store
+    :param kind: name of the parsed form
+    :param paths: files the artifact is parsed from, the artifact is keyed by their content
+    :param mask: sampling mask applied while parsing (None if no mask)
+    :param loader: function that parses the artifact, returns None if the files do not validate
+    :param writable: load stored arrays into memory, for callers that modify them in place (add_pseudo_counts)
+    :return: the parsed artifact
+    '''
+    if store is None or mask is not None:
+        return loader()
+    try:
+        artifact = truth_store.load_artifact(store, kind, paths, mmap_mode=None if writable else 'r')
+    except (IOError, OSError, ValueError):
+        # unreadable entry, parse the truth again and overwrite it
+        traceback.print_exc()
+        artifact = None
+    if artifact is not None:
+        printInfo('TRUTH STORE %s -> ' % kind, paths)
+        return artifact
+
+    artifact = loader()
+    if artifact is not None:
+        try:
+            truth_store.save_artifact(store, kind, paths, artifact)
+        except (IOError, OSError):
+            # the store only saves time, scoring does not depend on it
+            traceback.print_exc()
+    return artifact
+
+def pseudo_count_truth(cache, truth_store, truthfile, vcf, mask, loader):
+    '''
+    Returns the 2B truth co-clustering matrix with pseudo counts added.
+    add_pseudo_counts resizes the matrix in place, so it works on a copy of a cached matrix.
+    :param cache: artifact cache, or None
+    :param truth_store: truth store directory, or None
+    :param truthfile: 2B truth file
+    :param vcf: scoring vcf
+    :param mask: sampling mask applied while parsing (None if no mask)
+    :param loader: function that parses the truth file, returns None if it does not validate
+    :return: the truth matrix with pseudo counts, None if the truth does not validate
+    '''
+    def expand():
+        # a cache that keeps the result never needs the matrix without pseudo counts again
+        ccm_cache = None if cache is not None and cache.get('derived', False) else cache
+        ccm = cached_artifact(ccm_cache, 'ccm', [truthfile, vcf], mask,
+                              lambda: stored_truth(truth_store, 'ccm', [truthfile, vcf], mask, loader, writable=True),
+                              copy=True)
+        if ccm is None:
+            return None
+        return add_pseudo_counts(ccm)
+    return cached_artifact(cache, 'ccm_pseudo', [truthfile, vcf], mask, expand, derived=True)
+
+def baselines_path(truthfiles):
+    # the sidecar lives next to the last truth file, which is different for every challenge
+    return truthfiles[-1] + '.baselines.json'
+
+def truth_digests(truthfiles, vcf):
+    return [truth_store.file_digest(f) for f in truthfiles + [vcf]]
+
+@telemetry.traced('baselines')
+def load_baselines(challenge, truthfiles, vcf):
+    '''
+    Reads the baseline scores precomputed by precompute_baselines for the given truth.
+    :param challenge: challenge the baselines were computed for
+    :param truthfiles: truth files of the challenge
+    :param vcf: scoring vcf
+    :return: dictionary of baseline scores, or None if there is no (up to date) sidecar for the truth files
+    '''
+    path = baselines_path(truthfiles)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as handle:
+            sidecar = json.load(handle)
+        if sidecar['challenge'] != challenge or sidecar['truth'] != truth_digests(truthfiles, vcf):
+            printInfo('STALE BASELINES -> ', path)
+            return None
+        return sidecar['baselines']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        traceback.print_exc()
+        return None
+
+def get_baselines(challenge, truthfiles, vcf, truth_store=None, cache=None):
+    '''
+    Calculates the baseline (OneCluster / NCluster) scores used to normalize the score of a challenge.
+    These only depend on the truth, so they are the same for every submission.
+    :param challenge: one of 2A, 2B, 3A, 3B
+    :param truthfiles: truth files of the challenge
+    :param vcf: scoring vcf
+    :param truth_store: truth store directory used to load the parsed truth files, or None
+    :param cache: artifact cache the parsed truth files are taken from and added to, or None
+    :return: dictionary of baseline scores, None if the truth does not validate
+    '''
+    if challenge not in ['2A', '2B', '3A', '3B']:
+        raise ValueError('Baselines are only used by challenges 2A, 2B, 3A and 3B')
+    if len(truthfiles) != len(challengeMapping[challenge]['val_funcs']):
+        err_msgs.append("Not enough input files for Challenge %s" % challenge)
+        return None
+
+    nssms = cached_artifact(cache, 'parseVCF2and3', [vcf], None,
+                            lambda: stored_truth(truth_store, 'parseVCF2and3', [vcf], None, lambda: verify(vcf, "input VCF", parseVCF2and3)))
+    if nssms is None:
+        err_msgs.append("Could not read input VCF. Exiting")
+        return None
+
+    role = "truth file for Challenge %s" % challenge
+    if challenge in ['2A', '3A']:
+        truth_labels = cached_artifact(cache, 'labels', [truthfiles[0], vcf], None,
+                                       lambda: stored_truth(truth_store, 'labels', [truthfiles[0], vcf], None,
+                                                            lambda: verify(truthfiles[0], role, om_validate2A_truth, nssms[1][0])))
+        if truth_labels is None:
+            return None
+        # a single column with the size of every truth cluster is all the baselines look at
+        om = np.bincount(truth_labels, minlength=np.max(truth_labels) + 1)[1:].reshape(-1, 1)
+        if challenge == '2A':
+            return om_get_baselines2A(om)
+        ad_truth = cached_artifact(cache, 'ad', [truthfiles[1], truthfiles[0], vcf], None,
+                                   lambda: stored_truth(truth_store, 'ad', [truthfiles[1], truthfiles[0], vcf], None,
+                                                        lambda: verify(truthfiles[1], role, om_validate3A, om.shape[0])))
+        if ad_truth is None:
+            return None
+        return get_baselines3A(om, ad_truth)
+
+    if challenge == '2B':
+        truth_ccm = pseudo_count_truth(cache, truth_store, truthfiles[0], vcf, None,
+                                       lambda: verify(truthfiles[0], role, validate2B, nssms[1][0]))
+        if truth_ccm is None:
+            return None
+        truth_labels = ccm_labels(truth_ccm[:nssms[1][0], :nssms[1][0]])
+        if truth_labels is not None:
+            return get_baselines2_overlap(truth_labels)
+        return get_baselines2(truth_ccm)
+
+    truth_ccm = cached_artifact(cache, 'ccm', [truthfiles[0], vcf], None,
+                                lambda: stored_truth(truth_store, 'ccm', [truthfiles[0], vcf], None,
+                                                     lambda: verify(truthfiles[0], role, validate2B, nssms[1][0])))
+    if truth_ccm is None:
+        return None
+    truth_ad = cached_artifact(cache, 'ad', [truthfiles[1], truthfiles[0], vcf], None,
+                               lambda: stored_truth(truth_store, 'ad', [truthfiles[1], truthfiles[0], vcf], None,
+                                                    lambda: verify(truthfiles[1], role, validate3B, truth_ccm, nssms[1][0])))
+    if truth_ad is None:
+        return None
+    truth_blocks = cluster_blocks(truth_ccm, truth_ad)
+    if truth_blocks is not None:
+        return get_baselines3_overlap(truth_blocks)
+    return get_baselines3Final(truth_ccm, truth_ad)
+
+def precompute_baselines(challenge, truthfiles, vcf, truth_store=None):
+    '''
+    Calculates the baseline scores of a challenge and writes them to a json sidecar next to the truth files,
+    where scoreChallenge picks them up instead of recomputing them for every submission.
+    :param challenge: one of 2A, 2B, 3A, 3B
+    :param truthfiles: truth files of the challenge
+    :param vcf: scoring vcf
+    :param truth_store: truth store directory used to load the parsed truth files, or None
+    :return: path of the sidecar, None if the truth does not validate
+    '''
+    baselines = get_baselines(challenge, truthfiles, vcf, truth_store=truth_store)
+    if baselines is None:
+        return None
+    sidecar = {
+        'challenge' : challenge,
+        'truth' : truth_digests(truthfiles, vcf),
+        'baselines' : dict((k, float(v)) for k, v in baselines.items())
+    }
+    path = baselines_path(truthfiles)
+    with open(path, 'w') as handle:
+        json.dump(sidecar, handle)
+    return path
+
 def makeMasks(vcfFile, sample_fraction):
     # returns mask dictionary { 'all' : sample_mask, 'truth' : truth_mask }
     #   where sample_mask and truth_mask are both lists of indices
@@ -1343,13 +2177,7 @@ def makeMasks(vcfFile, sample_fraction):
     # file line indicies do NOT match up with vcf and pred, so we need to make a
     # separate mask just for the truth file
 
-    f = open(vcfFile)
-    vcf = f.read()
-    f.close()
-
-    vcf = vcf.split('\n')
-    vcf = [x for x in vcf if x != '' and x[0] != '#']
-    vcf = [x[-4:] == "True" for x in vcf]
+    vcf = read_vcf_truth(vcfFile)
 
     # can use the combinadics method here..
     vcf_count = len(vcf)
@@ -1368,16 +2196,13 @@ def makeMasks(vcfFile, sample_fraction):
             sample_mask.add(x)
         i += 1
 
-    truth_mask = []
-    truth_index = 0
-    for i in xrange(len(vcf)):
-        if vcf[i] and i in sample_mask:
-            truth_mask.append(truth_index)
-        if vcf[i]:
-            truth_index += 1
-
     sample_mask = sorted(sample_mask)
 
+    # position in the truth file of every sampled line that is true
+    sampled = np.asarray(sample_mask, dtype=int)
+    sampled = sampled[vcf[sampled]]
+    truth_mask = (np.cumsum(vcf)[sampled] - 1).tolist()
+
     return { 'samples' : sample_mask, 'truths' : truth_mask }
 
 challengeMapping = {
@@ -1426,6 +2251,28 @@ challengeMapping = {
     },
 }
 
+def enable_profiling(mode, prefix=None, functions=None):
+    '''
+    Profiles the functions scoring is dispatched to: the vcf, filter and score functions of challengeMapping,
+    the metrics of calculate2_funcs, calculate2_overlap_funcs, method_funcs and om_calculate2A_funcs,
+    the scores of hard clusterings and the parsing of the input files (verify, verify2A). The validation functions are not wrapped,
+    scoreChallenge tells them apart by identity.
+    :param mode: one of profiling.MODES
+    :param prefix: path prefix of the reports, one report per profiled function is written when the process exits
+    :param functions: names of the functions to profile, None for all of them
+    '''
+    profiling.enable(mode, prefix=prefix, functions=functions)
+    for challenge in challengeMapping:
+        profiling.install(challengeMapping[challenge], ['vcf_func', 'filter_func', 'score_func'])
+    for table in [calculate2_funcs, calculate2_overlap_funcs, method_funcs, om_calculate2A_funcs]:
+        profiling.install(table)
+    profiling.install(globals(), ['verify', 'verify2A', 'calculate2_overlap', 'calculate3_overlap'])
+
+# SMC_PROFILE=<mode> profiles any use of the scorer (ex. batch_scoring) without changing the code
+if os.environ.get('SMC_PROFILE'):
+    enable_profiling(os.environ['SMC_PROFILE'], prefix=os.environ.get('SMC_PROFILE_OUTPUT'),
+                     functions=filter(None, os.environ.get('SMC_PROFILE_FUNCTIONS', '').split(',')))
+
 def verifyChallenge(challenge, predfiles, vcf):
     #global err_msgs
     if challengeMapping[challenge]['vcf_func']:
@@ -1449,16 +2296,21 @@ def verifyChallenge(challenge, predfiles, vcf):
     return "Valid"
 
  
-def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
-    
-    
-    
+def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0, cache=None, truth_store=None, baselines=None):
+    with telemetry.span('score', challenge=challenge):
+        return _scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction, cache, truth_store, baselines)
+
+def _scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction, cache, truth_store, baselines):
     #global err_msgs
     mem('START %s' % challenge)
     masks = makeMasks(vcf, sample_fraction) if sample_fraction != 1.0 else { 'samples' : None, 'truths' : None}
 
     if challengeMapping[challenge]['vcf_func']:
-        nssms = verify(vcf, "input VCF", challengeMapping[challenge]['vcf_func'], sample_mask=masks['samples'])
+        vcf_func = challengeMapping[challenge]['vcf_func']
+        with telemetry.span('vcf', file=vcf):
+            nssms = cached_artifact(cache, vcf_func.__name__, [vcf], masks['samples'],
+                                    lambda: stored_truth(truth_store, vcf_func.__name__, [vcf], masks['samples'],
+                                                         lambda: verify(vcf, "input VCF", vcf_func, sample_mask=masks['samples'])))
         if nssms == None:
             err_msgs.append("Could not read input VCF. Exiting")
             return "NA"
@@ -1476,6 +2328,17 @@ def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
         err_msgs.append("Not enough input files for Challenge %s" % challenge)
         return "NA"
 
+    # prediction matrices are parsed with the dtype of the memory plan
+    pred_kwargs = {}
+    if MEM_LIMIT is not None:
+        if baselines is None and masks['samples'] is None and challenge in ['2A', '2B', '3A', '3B']:
+            baselines = load_baselines(challenge, truthfiles, vcf)
+        strategy = plan_memory(challenge, nssms, truth_store is not None and masks['truths'] is None, baselines is not None)
+        if strategy is None:
+            return "NA"
+        if strategy in ['float32']:
+            pred_kwargs['dtype'] = np.float32
+
     tout = []
     pout = []
     tpout = []
@@ -1491,7 +2354,15 @@ def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
         if challenge in ['2A', '3A']:
             if valfunc is om_validate2A:
                 try:
-                    vout, raw = verify2A(predfile, truthfile, "Combined truth and pred file for Challenge 2A", *vcfargs, filter_mut=nssms[2], mask=masks['truths'], subchallenge="3A")
+                    with telemetry.span('truth', file=truthfile):
+                        truth_labels = cached_artifact(cache, 'labels', [truthfile, vcf], masks['truths'],
+                                                       lambda: stored_truth(truth_store, 'labels', [truthfile, vcf], masks['truths'],
+                                                                            lambda: verify(truthfile, "truth file for Challenge %s" % (challenge), om_validate2A_truth, nssms[1][0], mask=masks['truths'])))
+                    if truth_labels is None:
+                        return "NA"
+                    with telemetry.span('pred', file=predfile):
+                        vout, raw = cached_artifact(cache, 'om', [predfile, truthfile, vcf], masks['truths'],
+                                                    lambda: verify2A(predfile, truthfile, "Combined truth and pred file for Challenge 2A", *vcfargs, filter_mut=nssms[2], mask=masks['truths'], subchallenge="3A", truth_labels=truth_labels))
                 except SampleError as e:
                     raise e
 
@@ -1499,13 +2370,18 @@ def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
                 tpout.append(vout)
                 if vout is None:
                     return "NA"
-                if raw[0] != -1:
+                # only 3A is scored with the cluster of every truth mutation
+                if challenge in ['3A']:
                     tpout.append(raw)
 
             elif valfunc is om_validate3A:
                 try:
-                    vtout = verify(truthfile, "truth file for Challenge %s" % (challenge), valfunc, vcfargs[0].shape[0], mask=masks['truths'])
-                    vpout = verify(predfile, "pred file for Challenge %s" % (challenge), valfunc, vcfargs[0].shape[1], mask=masks['truths'])
+                    with telemetry.span('truth', file=truthfile):
+                        vtout = cached_artifact(cache, 'ad', [truthfile, truthfiles[0], vcf], masks['truths'],
+                                                lambda: stored_truth(truth_store, 'ad', [truthfile, truthfiles[0], vcf], masks['truths'],
+                                                                     lambda: verify(truthfile, "truth file for Challenge %s" % (challenge), valfunc, vcfargs[0].shape[0], mask=masks['truths'])))
+                    with telemetry.span('pred', file=predfile):
+                        vpout = verify(predfile, "pred file for Challenge %s" % (challenge), valfunc, vcfargs[0].shape[1], mask=masks['truths'])
                 except SampleError as e:
                     raise e
                 if vpout is None or vtout is None:
@@ -1515,21 +2391,38 @@ def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
 
         elif challenge in ['2B']:
             try:
-                vout = verify(truthfile, "truth file for Challenge %s" % (challenge), valfunc, *targs, mask=masks['truths'])
+                with telemetry.span('truth', file=truthfile):
+                    vout_with_pseudo_counts = pseudo_count_truth(cache, truth_store, truthfile, vcf, masks['truths'],
+                                                                 lambda: verify(truthfile, "truth file for Challenge %s" % (challenge), valfunc, *targs, mask=masks['truths']))
             except SampleError as e:
                 raise e
-   
+            if vout_with_pseudo_counts is None:
+                return "NA"
+
+            # the truth without pseudo counts is the top left corner
+            vout = vout_with_pseudo_counts[:nssms[1][0], :nssms[1][0]]
             printInfo('TRUTH DIMENSIONS -> ', vout.shape)
 
             if WRITE_2B_FILES:
                 np.savetxt('truth2B.txt.gz', vout)
 
-            mem('VERIFY TRUTH %s' % truthfile)
-            vout_with_pseudo_counts = add_pseudo_counts(vout)
             tout.append(vout_with_pseudo_counts)
             mem('APC TRUTH %s' % truthfile)
+        elif valfunc is validate2B:
+            with telemetry.span('truth', file=truthfile):
+                tout.append(cached_artifact(cache, 'ccm', [truthfile, vcf], masks['truths'],
+                                            lambda: stored_truth(truth_store, 'ccm', [truthfile, vcf], masks['truths'],
+                                                                 lambda: verify(truthfile, "truth file for Challenge %s" % (challenge), valfunc, *targs, mask=masks['truths']))))
+            mem('VERIFY TRUTH %s' % truthfile)
+        elif valfunc is validate3B:
+            with telemetry.span('truth', file=truthfile):
+                tout.append(cached_artifact(cache, 'ad', [truthfile, truthfiles[0], vcf], masks['truths'],
+                                            lambda: stored_truth(truth_store, 'ad', [truthfile, truthfiles[0], vcf], masks['truths'],
+                                                                 lambda: verify(truthfile, "truth file for Challenge %s" % (challenge), valfunc, *targs, mask=masks['truths']))))
+            mem('VERIFY TRUTH %s' % truthfile)
         else:
-            tout.append(verify(truthfile, "truth file for Challenge %s" % (challenge), valfunc, *targs, mask=masks['truths']))
+            with telemetry.span('truth', file=truthfile):
+                tout.append(verify(truthfile, "truth file for Challenge %s" % (challenge), valfunc, *targs, mask=masks['truths']))
             mem('VERIFY TRUTH %s' % truthfile)
         
         if challenge in ['2B', '3B']:
@@ -1544,7 +2437,14 @@ def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
         if challenge not in ['2A', '3A']:
             pargs = pout + nssms[0]
 
-            pout.append(verify(predfile, "prediction file for Challenge %s" % (challenge), valfunc, *pargs, mask=masks['samples']))
+            with telemetry.span('pred', file=predfile):
+                if valfunc is validate2B:
+                    # filterFPs and add_pseudo_counts work on the prediction in place
+                    pout.append(cached_artifact(cache, 'ccm', [predfile, vcf], masks['samples'],
+                                                lambda: verify(predfile, "prediction file for Challenge %s" % (challenge), valfunc, *pargs, mask=masks['samples'], **pred_kwargs),
+                                                copy=True))
+                else:
+                    pout.append(verify(predfile, "prediction file for Challenge %s" % (challenge), valfunc, *pargs, mask=masks['samples'], **pred_kwargs))
             if pout[-1] is None:
                 err_msgs.append("Unable to open prediction file")
                 return "NA"
@@ -1564,8 +2464,39 @@ def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
         printInfo('tout sum -> ', np.sum(tout[0]))
         printInfo('pout sum -> ', np.sum(pout[0]))
 
+    # hard clusterings are scored from the overlap of their clusters instead of from the n x n matrices
+    if challenge in ['2B']:
+        with telemetry.span('hard clusterings'):
+            pred_labels = ccm_labels(pout[0])
+            truth_labels = None
+            if pred_labels is not None:
+                truth_labels = cached_artifact(cache, 'ccm_labels', [truthfiles[0], vcf], masks['truths'],
+                                               lambda: ccm_labels(tout[0][:nssms[1][0], :nssms[1][0]]), derived=True)
+        if truth_labels is not None:
+            printInfo('HARD CLUSTERINGS -> ', len(np.unique(truth_labels)), len(np.unique(pred_labels)))
+            if baselines is None and masks['samples'] is None:
+                baselines = load_baselines(challenge, truthfiles, vcf)
+            with telemetry.span('metric'):
+                return calculate2_overlap(truth_labels, pred_labels[nssms[2]], baselines=baselines)
+
+    # same for 3B submissions that are 3A submissions written out as matrices
+    if challenge in ['3B']:
+        with telemetry.span('hard clusterings'):
+            pred_blocks = cluster_blocks(pout[0], pout[1])
+            truth_blocks = None
+            if pred_blocks is not None:
+                truth_blocks = cached_artifact(cache, 'ad_blocks', [truthfiles[1], truthfiles[0], vcf], masks['truths'],
+                                               lambda: cluster_blocks(tout[0], tout[1]), derived=True)
+        if truth_blocks is not None:
+            printInfo('HARD CLUSTERINGS -> ', truth_blocks[1].shape[0], pred_blocks[1].shape[0])
+            if baselines is None and masks['samples'] is None:
+                baselines = load_baselines(challenge, truthfiles, vcf)
+            with telemetry.span('metric'):
+                return calculate3_overlap(truth_blocks, (pred_blocks[0][nssms[2]], pred_blocks[1]), baselines=baselines)
+
     if challengeMapping[challenge]['filter_func']:
-        pout = [challengeMapping[challenge]['filter_func'](x, nssms[2]) for x in pout]
+        with telemetry.span('filter'):
+            pout = [challengeMapping[challenge]['filter_func'](x, nssms[2]) for x in pout]
         printInfo('PRED DIMENSION(S) -> ', [p.shape for p in pout])
 
         mem('FILTER PRED(S)')
@@ -1574,7 +2505,8 @@ def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
         printInfo('pout sum filtered -> ', np.sum(pout[0]))
 
         if challenge in ['2B']:
-            pout = [ add_pseudo_counts(*pout) ]
+            with telemetry.span('pseudo counts'):
+                pout = [ add_pseudo_counts(*pout) ]
             mem('APC PRED')
             printInfo('FINAL PRED DIMENSION -> ', pout[-1].shape)
 
@@ -1583,12 +2515,115 @@ def scoreChallenge(challenge, predfiles, truthfiles, vcf, sample_fraction=1.0):
             # pout[0] = np.dot(pout[0], pout[0].T)
             # mem('3A DOT')
 
-    if challenge in ['2A']:
-        return challengeMapping[challenge]['score_func'](*tpout, add_pseudo=True, pseudo_counts=None)
-    if challenge in ['3A']:
-        return challengeMapping[challenge]['score_func'](*tpout)
+    # baselines only depend on the truth, use the precomputed ones if there are any
+    if challenge in ['2A', '2B', '3A', '3B'] and masks['samples'] is None and baselines is None:
+        baselines = load_baselines(challenge, truthfiles, vcf)
+        printInfo('PRECOMPUTED BASELINES -> ', baselines)
+
+    with telemetry.span('metric'):
+        if challenge in ['2A']:
+            return challengeMapping[challenge]['score_func'](*tpout, add_pseudo=True, pseudo_counts=None, baselines=baselines)
+        if challenge in ['3A']:
+            return challengeMapping[challenge]['score_func'](*tpout, baselines=baselines)
+        if challenge in ['2B', '3B']:
+            return challengeMapping[challenge]['score_func'](*(pout + tout), baselines=baselines)
+
+        return challengeMapping[challenge]['score_func'](*(pout + tout))
+
+def plan_memory(challenge, nssms, truth_mapped=False, baselines=False):
+    '''
+    Picks how the matrices of a challenge are held in memory so that scoring stays under MEM_LIMIT
+    :param challenge: one of 1A, 1B, 1C, 2A, 2B, 3A, 3B
+    :param nssms: output of the vcf function of the challenge
+    :param truth_mapped: the truth matrices are memory mapped from the truth store
+    :param baselines: the baseline scores are precomputed
+    :return: name of the strategy (see memplan.STRATEGIES), None if no strategy fits under the limit
+    '''
+    n_pred = nssms[0][0] if len(nssms[0]) > 0 else 0
+    n_truth = nssms[1][0] if len(nssms[1]) > 0 else 0
+    strategy, peak = memplan.plan(challenge, n_pred, n_truth, MEM_LIMIT, truth_mapped=truth_mapped, baselines=baselines)
+    if strategy is None:
+        err_msgs.append("Challenge %s needs about %s of memory to score %d mutations, more than the limit of %s" %
+                        (challenge, memplan.format_size(peak), n_pred, memplan.format_size(MEM_LIMIT)))
+        return None
+    printInfo('Memory plan for Challenge %s: %s, about %s of %s' % (challenge, strategy, memplan.format_size(peak), memplan.format_size(MEM_LIMIT)))
+    return strategy
+
+def count_clusters(filename, challenge):
+    '''
+    Number of clusters of a 1C file (one line per cluster) or a 2A file (cluster of every mutation), read without validating it
+    :return: number of clusters, None if the file can not be read
+    '''
+    try:
+        with open(filename) as f:
+            lines = [l.strip() for l in f if l.strip() != '']
+    except (IOError, OSError):
+        return None
+    return len(lines) if challenge == '1C' else len(set(lines))
 
-    return challengeMapping[challenge]['score_func'](*(pout + tout))
+def is_soft_matrix(filename):
+    '''
+    Reads the first row of a 2B/3B matrix to tell hard predictions (only 0 and 1) from probabilities
+    '''
+    try:
+        handle = gzip.open(filename, 'r') if is_gzip(filename) else open(filename, 'r')
+        try:
+            row = handle.readline().split()
+        finally:
+            handle.close()
+        return any(float(x) not in [0.0, 1.0] for x in row)
+    except (IOError, OSError, ValueError):
+        return False
+
+def estimate_challenge(challenge, predfiles, truthfiles, vcf, truth_store=None):
+    '''
+    Predicts the runtime of scoring a challenge and its peak memory for every memory strategy, without parsing the matrices.
+    The runtime models do not tell the strategies apart, so there is one runtime.
+    Only the vcf is read, with the 1C/2A files to count the clusters and the first row of the 2B/3B predictions.
+    :param challenge: one of 1A, 1B, 1C, 2A, 2B, 3A, 3B
+    :param truth_store: directory of the truth store the run would use (the truth matrices are then memory mapped)
+    :return: dictionary with the number of mutations, clusters and input bytes, the runtime (seconds), the peak
+             memory of every strategy (peak_bytes), and the fastest strategy that fits under MEM_LIMIT (None if none does)
+    '''
+    # 1A and 1B are scored without the vcf, their runtime does not depend on it
+    if challengeMapping[challenge]['vcf_func'] is None and vcf is None:
+        nssms = [[0], [0]]
+    else:
+        nssms = verify(vcf, "input VCF", challengeMapping[challenge]['vcf_func'] or parseVCF1C)
+    if nssms is None:
+        err_msgs.append("Could not read input VCF. Exiting")
+        return None
+    n_pred = nssms[0][0]
+    n_truth = nssms[1][0]
+
+    pred_clusters = truth_clusters = None
+    if challenge in ['1C', '2A', '3A']:
+        pred_clusters = count_clusters(predfiles[0], '1C' if challenge == '1C' else '2A')
+        truth_clusters = count_clusters(truthfiles[0], '1C' if challenge == '1C' else '2A')
+    kind = 'soft' if challenge in ['2B', '3B'] and is_soft_matrix(predfiles[0]) else 'hard'
+    baselines = challenge in ['2A', '2B', '3A', '3B'] and os.path.exists(baselines_path(truthfiles))
+    seconds = memplan.estimate_runtime(challenge, n_pred, kind)
+
+    strategies = {}
+    for strategy in memplan.CHALLENGE_STRATEGIES[challenge]:
+        peak = memplan.estimate_peak(challenge, n_pred, n_truth, strategy, truth_mapped=truth_store is not None, baselines=baselines)
+        strategies[strategy] = {'peak_bytes' : memplan.BASE_BYTES + peak}
+    fitting = [s for s in memplan.CHALLENGE_STRATEGIES[challenge]
+               if MEM_LIMIT is None or strategies[s]['peak_bytes'] - memplan.BASE_BYTES <= MEM_LIMIT]
+
+    return {
+        'challenge' : challenge,
+        'nssms' : n_pred,
+        'truth_nssms' : n_truth,
+        'pred_clusters' : pred_clusters,
+        'truth_clusters' : truth_clusters,
+        'input_bytes' : sum(os.path.getsize(f) for f in predfiles + truthfiles + [vcf] if f is not None and os.path.exists(f)),
+        'predictions' : kind,
+        'baselines' : baselines,
+        'seconds' : seconds,
+        'strategies' : strategies,
+        'strategy' : fitting[0] if fitting else None
+    }
 
 def printInfo(*string):
     if (INFO):
@@ -1596,6 +2631,8 @@ def printInfo(*string):
         sys.stdout.flush()
 
 def mem(note):
+    if not (MEM and (FINAL_MEM and note == 'DONE' or not FINAL_MEM)):
+        return
     pid = os.getpid()
     with open(os.path.join('/proc', str(pid), 'status')) as f:
         lines = f.readlines()
@@ -1610,10 +2647,9 @@ def mem(note):
 
     vrammax = mem_pretty(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
 
-    if (MEM and (FINAL_MEM and note == 'DONE' or not FINAL_MEM)):
-        print('[ M E M ]   total: %s (max: %s) @ %s' % (vt, vmax, note))
-        # print('[ M E M ] total: %s (max: %s) | ram: %s (max: %s) | swap: %s @ %s' % (vt, vmax, vram, vrammax, vswap, note))
-        sys.stdout.flush()
+    print('[ M E M ]   total: %s (max: %s) @ %s' % (vt, vmax, note))
+    # print('[ M E M ] total: %s (max: %s) | ram: %s (max: %s) | swap: %s @ %s' % (vt, vmax, vram, vrammax, vswap, note))
+    sys.stdout.flush()
 
 def mem_pretty(mem):
     denom = 1
@@ -1643,9 +2679,36 @@ if __name__ == '__main__':
     parser.add_argument('-v', action='store_true', default=False)
     parser.add_argument('--approx', nargs=2, type=float, metavar=('sample_fraction', 'iterations'), help='sample_fraction ex. [0.45, 0.8] | iterations ex. [4, 20, 100]')
     parser.add_argument('--approx_seed', nargs=1, type=int, default=[75])
+    parser.add_argument('--truth-cache', default=None, metavar='DIR', help='directory where parsed truth files are stored and reused by later runs')
+    parser.add_argument('--write-vcf-mask', action='store_true', default=False, help='store the truth flags of the vcf in a <vcf>.mask.npy sidecar that later runs read instead of the vcf')
+    parser.add_argument('--precompute-baselines', action='store_true', default=False, help='compute the baseline scores of the truth files and store them next to the truth')
+    parser.add_argument('--trace-file', default=None, metavar='FILE', help='append the wall time, cpu time and memory of every scoring phase to FILE as JSON lines')
+    parser.add_argument('--profile', default=os.environ.get('SMC_PROFILE'), choices=profiling.MODES, help='profile the scoring functions and write a report per function next to the output file')
+    parser.add_argument('--profile-functions', nargs='+', default=None, metavar='FUNCTION', help='only profile these functions ex. [calculate2_pseudoV, verify]')
+    parser.add_argument('--mem-limit', default=None, type=memplan.parse_size, metavar='SIZE', help='memory available for scoring ex. [512M, 16G], submissions that can not be scored within it get NA')
+    parser.add_argument('--estimate', action='store_true', default=False, help='only predict the runtime and peak memory of scoring the challenge, for every memory strategy')
+    parser.add_argument('--calibration', default=None, metavar='FILE', help='runtime models written by benchmark.py calibrate, used by --estimate')
     args = parser.parse_args()
-
-    if args.pred_config is not None and args.truth_config is not None:
+    WRITE_VCF_MASK = args.write_vcf_mask
+    MEM_LIMIT = args.mem_limit
+    if args.trace_file is not None:
+        telemetry.enable(args.trace_file)
+    if args.profile is not None:
+        enable_profiling(args.profile, prefix=args.outputfile, functions=args.profile_functions or profiling.FUNCTIONS)
+    if args.calibration is not None:
+        memplan.load_runtime_models(args.calibration)
+
+    if args.estimate:
+        res = estimate_challenge(args.challenge, args.predfiles, args.truthfiles, args.vcf, truth_store=args.truth_cache)
+        print(json.dumps(res, indent=2, sort_keys=True))
+        if args.outputfile is not None:
+            with open(args.outputfile, "w") as handle:
+                handle.write(json.dumps(res))
+    elif args.precompute_baselines:
+        path = precompute_baselines(args.challenge, args.truthfiles, args.vcf, truth_store=args.truth_cache)
+        if path is not None:
+            print('Baselines for Challenge %s written to %s' % (args.challenge, path))
+    elif args.pred_config is not None and args.truth_config is not None:
         with open(args.pred_config) as handle:
             pred_config = {}
             for line in handle:
@@ -1667,16 +2730,18 @@ if __name__ == '__main__':
         out = {}
         print "pred", pred_config
         print "truth", truth_config
-        for challenge in pred_config:
-            if challenge in truth_config:
-                predfile = pred_config[challenge]
-                vcf = truth_config[challenge]['vcf']
-                truthfiles = truth_config[challenge]['truth']
-                if args.v:
-                    res = verifyChallenge(challenge, predfile, vcf)
-                else:
-                    res = scoreChallenge(challenge, predfile, truthfiles, vcf)
-                out[challenge] = res
+        challenges = sorted(c for c in pred_config if c in truth_config)
+        # 2A/3A and 2B/3B share their prediction and truth files, parse each of them only once
+        cache = new_artifact_cache([pred_config[c] + truth_config[c]['truth'] + [truth_config[c]['vcf']] for c in challenges])
+        for challenge in challenges:
+            predfile = pred_config[challenge]
+            vcf = truth_config[challenge]['vcf']
+            truthfiles = truth_config[challenge]['truth']
+            if args.v:
+                res = verifyChallenge(challenge, predfile, vcf)
+            else:
+                res = scoreChallenge(challenge, predfile, truthfiles, vcf, cache=cache, truth_store=args.truth_cache)
+            out[challenge] = res
         with open(args.outputfile, "w") as handle:
             jtxt = json.dumps(out)
             handle.write(jtxt)
@@ -1726,7 +2791,7 @@ if __name__ == '__main__':
         # REAL SCORE
         else:
             print('Running Challenge %s' % args.challenge)
-            res = scoreChallenge(args.challenge, args.predfiles, args.truthfiles, args.vcf)
+            res = scoreChallenge(args.challenge, args.predfiles, args.truthfiles, args.vcf, truth_store=args.truth_cache)
             print res
             #print('SCORE -> %.16f' % res)
 
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+from SMCScoring import scoreChallenge, load_baselines, get_baselines
+
+# truth context of the running score_many, the pool workers are forked after it is set
+# so they share the parsed truth with the parent process
+_worker_context = None
+
+class TruthContext(object):
+    '''
+    Parsed truth of one challenge, reused for every prediction scored against it.
+    The truth files and the vcf are parsed (and the 2B pseudo counts added) once, the baselines
+    are computed once, then each prediction only costs its own parsing and scoring.
+    '''
+    def __init__(self, challenge, truthfiles, vcf, truth_store=None):
+        '''
+        :param challenge: one of 1A, 1B, 1C, 2A, 2B, 3A, 3B
+        :param truthfiles: truth files of the challenge
+        :param vcf: scoring vcf
+        :param truth_store: truth store directory used to load the parsed truth files, or None
+        '''
+        self.challenge = challenge
+        self.truthfiles = list(truthfiles)
+        self.vcf = vcf
+        self.truth_store = truth_store
+        # only the truth files and the vcf are cached, the prediction files are parsed every time
+        self.cache = {
+            'shared' : set(os.path.abspath(f) for f in self.truthfiles + [vcf]),
+            'artifacts' : {},
+            'derived' : True
+        }
+
+        self.baselines = None
+        if challenge in ['2A', '2B', '3A', '3B']:
+            self.baselines = load_baselines(challenge, self.truthfiles, vcf)
+            if self.baselines is None:
+                self.baselines = get_baselines(challenge, self.truthfiles, vcf, truth_store=truth_store, cache=self.cache)
+
+    def score(self, predfiles):
+        '''
+        Scores one prediction against the truth
+        :param predfiles: prediction file, or list of prediction files for challenges with more than one
+        :return: score of the prediction, "NA" if it does not validate
+        '''
+        if isinstance(predfiles, basestring):
+            predfiles = [predfiles]
+        return scoreChallenge(self.challenge, predfiles, self.truthfiles, self.vcf,
+                              cache=self.cache, truth_store=self.truth_store, baselines=self.baselines)
+
+    def score_many(self, predictions, processes=1):
+        '''
+        Scores many predictions against the truth
+        :param predictions: iterable of predictions, each one a file or a list of files as in score
+        :param processes: number of worker processes, 1 to score them all in this process
+        :return: list with the score of every prediction, in order
+        '''
+        predictions = list(predictions)
+        if processes <= 1 or len(predictions) < 2:
+            return [self.score(p) for p in predictions]
+
+        global _worker_context
+        # the first prediction parses whatever part of the truth is not parsed yet, before the workers are forked
+        results = [self.score(predictions[0])]
+        _worker_context = self
+        pool = multiprocessing.Pool(processes)
+        try:
+            results += pool.map(_score_in_worker, predictions[1:], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            _worker_context = None
+        return results
+
+def _score_in_worker(predfiles):
+    return _worker_context.score(predfiles)
@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+'''
+Benchmark of scoreChallenge on synthetic samples.
+
+    python benchmark.py generate --sizes 1000 5000
+    python benchmark.py run -o results.csv --sizes 1000 5000 --repeat 3
+
+Samples are generated once per size in the work directory and reused by later runs (of any commit),
+so results of different versions of the scoring code are computed on the same files.
+Every case is scored by SMCScoring.py in its own process, its wall time and peak RSS are written to a csv.
+Two csv files (e.g. of the baseline commit and of a candidate) are compared with
+
+    python benchmark.py compare baseline.csv candidate.csv --threshold 0.1
+
+which exits with 1 if a case is slower, uses more memory or gives another score than in the baseline.
+The runtime models of SMCScoring.py --estimate are fitted on the results of a run with
+
+    python benchmark.py calibrate results.csv -o calibration.json
+
+The 2B/3B matrices are n x n text files, so the dense challenges are calibrated on smaller sizes than the others.
+'''
+import argparse
+import csv
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import numpy as np
+import scipy.optimize
+import scipy.stats
+from scoring_harness_optimized import phylogeny_closure
+
+SIZES = [1000, 5000, 20000, 50000]
+CHALLENGES = ['1A', '1B', '1C', '2A', '2B', '3A', '3B']
+# txt and gz are the formats of the 2B/3B matrices, store scores the txt files with the truth
+# memory mapped from a truth store (the parsed, binary form of the truth)
+FORMATS = ['txt', 'gz', 'store']
+# hard predictions are hard clusterings (scored from their clusters), soft ones have probabilities
+# in their 2B/3B matrices and take the dense path
+PREDICTIONS = ['hard', 'soft']
+
+# probability in the soft 2B/3B matrices of the entries that are one in the hard ones
+SOFT_VALUE = 0.8
+
+RESULT_FIELDS = ['challenge', 'nssms', 'format', 'predictions', 'repeat', 'wall', 'peak_rss', 'score', 'status']
+# columns that identify a case, the rows of a case are its repetitions
+CASE_FIELDS = ['challenge', 'nssms', 'format', 'predictions']
+
+# largest exponent of the runtime models: the challenges scored from labels and cluster sizes read the files
+# once and are at most quadratic (the 3A tree), the dense 2B/3B matrices are n x n and their products cubic
+MAX_EXPONENTS = {'1A' : 2, '1B' : 2, '1C' : 2, '2A' : 2, '3A' : 2, '2B' : 3, '3B' : 3}
+# run-to-run noise (relative to the wall time) of a case scored only once
+RUNTIME_NOISE = 0.05
+
+SCORING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SMCScoring.py')
+
+def sample_dir(workdir, nssms, fp_rate, seed):
+    return os.path.join(workdir, 'n%d_fp%g_s%d' % (nssms, fp_rate, seed))
+
+def write_matrix(path, n, rows, tokens):
+    '''
+    Writes an n x n matrix as tab separated text (gzip compressed if the path ends with .gz),
+    one block of rows at a time
+    :param rows: function (start, stop) -> int array with the index into tokens of every entry of the rows
+    :param tokens: text of every value, all of the same width
+    '''
+    width = len(tokens[0])
+    table = np.array([np.frombuffer(t, dtype=np.uint8) for t in tokens])
+    handle = gzip.open(path, 'wb', compresslevel=1) if path.endswith('.gz') else open(path, 'wb')
+    try:
+        block = max(1, 2**24 // n)
+        for start in xrange(0, n, block):
+            stop = min(start + block, n)
+            text = np.empty((stop - start, n, width + 1), dtype=np.uint8)
+            text[:, :, :width] = table[rows(start, stop)]
+            text[:, :, width] = ord('\t')
+            text[:, -1, width] = ord('\n')
+            handle.write(text.tostring())
+    finally:
+        handle.close()
+
+def write_text(path, lines):
+    with open(path, 'w') as f:
+        f.write('\n'.join(str(l) for l in lines) + '\n')
+
+def write_vcf(path, truth):
+    header = ['##fileformat=VCFv4.1',
+              '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\ttumour']
+    with open(path, 'w') as f:
+        f.write('\n'.join(header) + '\n')
+        for i, t in enumerate(truth):
+            f.write('chr1\t%d\t.\tG\tC\t.\tPASS\tSOMATIC;VT=SNP\tGT:AD\t0:30,20\t%s\n' % (30000001 + 10000 * i, t))
+
+def write_matrices(prefix, labels, ancestors, kind, formats):
+    '''
+    Writes the 2B co-clustering and 3B ancestor-descendant matrices of a clustering
+    :param prefix: path prefix of the files, .2B.txt(.gz) and .3B.txt(.gz) are appended
+    :param labels: cluster (0 based) of every mutation
+    :param ancestors: K x K bool matrix, [i, j] is True if cluster i is an ancestor of cluster j
+    :param kind: hard writes 0/1 matrices, soft writes SOFT_VALUE instead of the off-diagonal ones
+    '''
+    n = len(labels)
+    if kind == 'hard':
+        tokens = ['0', '1']
+        one = 1
+    else:
+        tokens = ['0.0', str(SOFT_VALUE), '1.0']
+        one = 2
+
+    def ccm_rows(start, stop):
+        rows = (labels[start:stop, None] == labels[None, :]).astype(int)
+        rows[np.arange(stop - start), np.arange(start, stop)] = one
+        return rows
+
+    def ad_rows(start, stop):
+        return ancestors[labels[start:stop, None], labels[None, :]].astype(int)
+
+    for ext in ['txt', 'txt.gz'] if 'gz' in formats else ['txt']:
+        write_matrix('%s.2B.%s' % (prefix, ext), n, ccm_rows, tokens)
+        write_matrix('%s.3B.%s' % (prefix, ext), n, ad_rows, tokens)
+
+def generate_sample(outdir, nssms, fp_rate=0.1, n_clusters=6, noise=0.1, seed=0, formats=FORMATS, predictions=PREDICTIONS, matrices=True):
+    '''
+    Generates a synthetic sample: a scoring vcf, the truth files of every challenge and a prediction that
+    is the truth with some of the mutations in a random cluster and one cluster moved to another parent.
+    Nothing is written if the sample was already generated with the same settings.
+    :param outdir: directory the files are written to
+    :param nssms: number of lines in the vcf
+    :param fp_rate: fraction of the vcf lines that are false positives
+    :param n_clusters: number of clusters of the truth and of the prediction
+    :param noise: fraction of the predicted mutations put in a random cluster
+    :param seed: seed of the random numbers, samples with the same settings are identical
+    :param formats: formats the 2B/3B matrices are written in (see FORMATS)
+    :param predictions: kinds of 2B/3B prediction matrices written (see PREDICTIONS)
+    :param matrices: boolean for whether to write the 2B/3B matrices, the samples of the other challenges can
+        then have as many mutations as the real ones
+    :return: dictionary with the settings of the sample
+    '''
+    settings = {'nssms' : nssms, 'fp_rate' : fp_rate, 'n_clusters' : n_clusters, 'noise' : noise, 'seed' : seed,
+                'formats' : sorted(formats), 'predictions' : sorted(predictions), 'matrices' : matrices}
+    marker = os.path.join(outdir, 'sample.json')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == settings:
+                return settings
+        shutil.rmtree(outdir)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    rng = np.random.RandomState(seed + nssms)
+    K = n_clusters
+    truth = rng.rand(nssms) >= fp_rate
+    truth[:K] = True
+    true_idx = np.flatnonzero(truth)
+    write_vcf(os.path.join(outdir, 'scoring.vcf'), truth)
+
+    # truth tree, cluster 1 is the clonal cluster and cluster k > 1 has a parent in 1..k-1
+    parents = [0] + [rng.randint(1, k) for k in range(2, K + 1)]
+    phis = [1.0]
+    for k in range(K):
+        phis.append(phis[parents[k]] * rng.uniform(0.5, 0.95))
+    truth_labels = rng.randint(0, K, len(true_idx))
+    truth_labels[:K] = np.arange(K)
+    cellularity = phis[1]
+
+    pred_labels = rng.randint(0, K, nssms)
+    keep = rng.rand(len(true_idx)) >= noise
+    pred_labels[true_idx[keep]] = truth_labels[keep]
+    pred_labels[:K] = np.arange(K)
+    pred_parents = list(parents)
+    if K > 2:
+        k = rng.randint(2, K)
+        pred_parents[k] = rng.randint(1, k + 1)
+
+    path = lambda name: os.path.join(outdir, name)
+    write_text(path('truth.1A.txt'), ['%f' % cellularity])
+    write_text(path('pred.1A.txt'), ['%f' % np.clip(cellularity + rng.normal(0, 0.05), 0, 1)])
+    write_text(path('truth.1B.txt'), [K])
+    write_text(path('pred.1B.txt'), [K])
+    truth_1c = ['%d\t%d\t%f' % (k + 1, np.sum(truth_labels == k), phis[k + 1]) for k in range(K)]
+    if nssms > len(true_idx):
+        truth_1c.append('%d\t%d\t%f' % (K + 1, nssms - len(true_idx), 0.0))
+    write_text(path('truth.1C.txt'), truth_1c)
+    write_text(path('pred.1C.txt'), ['%d\t%d\t%f' % (k + 1, np.sum(pred_labels == k), np.clip(phis[k + 1] + rng.normal(0, 0.05), 0, 1)) for k in range(K)])
+    write_text(path('truth.2A.txt'), truth_labels + 1)
+    write_text(path('pred.2A.txt'), pred_labels + 1)
+    write_text(path('truth.3A.txt'), ['%d\t%d' % (k + 1, parents[k]) for k in range(K)])
+    write_text(path('pred.3A.txt'), ['%d\t%d' % (k + 1, pred_parents[k]) for k in range(K)])
+
+    if matrices:
+        write_matrices(path('truth'), truth_labels, phylogeny_closure(parents)[1:, 1:], 'hard', formats)
+        for kind in predictions:
+            write_matrices(path('pred.%s' % kind), pred_labels, phylogeny_closure(pred_parents)[1:, 1:], kind, formats)
+
+    with open(marker, 'w') as f:
+        json.dump(settings, f)
+    return settings
+
+def case_files(outdir, challenge, fmt, kind):
+    '''
+    Prediction and truth files of a challenge in a generated sample
+    :return: (predfiles, truthfiles)
+    '''
+    path = lambda name: os.path.join(outdir, name)
+    ext = 'txt.gz' if fmt == 'gz' else 'txt'
+    if challenge in ['2B', '3B']:
+        names = ['2B', '3B'] if challenge == '3B' else ['2B']
+        return ([path('pred.%s.%s.%s' % (kind, c, ext)) for c in names],
+                [path('truth.%s.%s' % (c, ext)) for c in names])
+    names = ['2A', '3A'] if challenge == '3A' else [challenge]
+    return [path('pred.%s.txt' % c) for c in names], [path('truth.%s.txt' % c) for c in names]
+
+def run_case(outdir, challenge, fmt='txt', kind='hard', trace_file=None):
+    '''
+    Scores one case with SMCScoring.py in a new process
+    :return: dictionary with the wall time (s), peak RSS (bytes), score and exit status of the process
+    '''
+    predfiles, truthfiles = case_files(outdir, challenge, fmt, kind)
+    output = os.path.join(outdir, 'score.%s.%s.%s.txt' % (challenge, fmt, kind))
+    if os.path.exists(output):
+        os.remove(output)
+    cmd = [sys.executable, SCORING, '-c', challenge, '--predfiles'] + predfiles + ['--truthfiles'] + truthfiles + \
+          ['--vcf', os.path.join(outdir, 'scoring.vcf'), '-o', output]
+    if fmt == 'store':
+        cmd += ['--truth-cache', os.path.join(outdir, 'truth_store')]
+    # the peak RSS of the scoring process is read from its trace: the ru_maxrss of wait4 also counts
+    # the pages of this process the child had before exec
+    trace = output + '.trace.jsonl'
+    if os.path.exists(trace):
+        os.remove(trace)
+    cmd += ['--trace-file', trace]
+
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        process = subprocess.Popen(cmd, stdout=devnull, stderr=devnull)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.time() - start
+    # the process is reaped by wait4, so Popen must not wait for it
+    process.returncode = status
+
+    # ru_maxrss is in kilobytes on linux
+    peak_rss = usage.ru_maxrss * 1024
+    if os.path.exists(trace):
+        with open(trace) as f:
+            lines = f.readlines()
+        os.remove(trace)
+        if lines:
+            peak_rss = max(json.loads(l)['peak_rss'] for l in lines)
+        if trace_file is not None:
+            with open(trace_file, 'a') as f:
+                f.writelines(lines)
+
+    score = None
+    if os.path.exists(output):
+        with open(output) as f:
+            text = f.read().strip()
+        try:
+            score = float(text)
+        except ValueError:
+            score = None
+    return {'wall' : wall, 'peak_rss' : peak_rss, 'score' : score, 'status' : os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1}
+
+def run(results, workdir, sizes=SIZES, challenges=CHALLENGES, formats=FORMATS, predictions=PREDICTIONS,
+        repeat=1, fp_rate=0.1, seed=0, trace_file=None):
+    '''
+    Generates the samples that do not exist yet and scores every case repeat times
+    :param results: csv file the results are written to
+    :param workdir: directory of the samples
+    '''
+    with open(results, 'wb') as handle:
+        writer = csv.DictWriter(handle, RESULT_FIELDS)
+        writer.writeheader()
+        for nssms in sizes:
+            outdir = sample_dir(workdir, nssms, fp_rate, seed)
+            generate_sample(outdir, nssms, fp_rate=fp_rate, seed=seed, formats=formats, predictions=predictions,
+                            matrices=any(c in ['2B', '3B'] for c in challenges))
+            for challenge in challenges:
+                matrices = challenge in ['2B', '3B']
+                for fmt in formats:
+                    # only the 2B/3B matrices can be compressed
+                    if fmt == 'gz' and not matrices:
+                        continue
+                    for kind in predictions if matrices else ['hard']:
+                        if fmt == 'store':
+                            # the first run parses the truth into the store, only the runs that load it are timed
+                            run_case(outdir, challenge, fmt, kind)
+                        for r in range(repeat):
+                            row = run_case(outdir, challenge, fmt, kind, trace_file=trace_file)
+                            row.update({'challenge' : challenge, 'nssms' : nssms, 'format' : fmt, 'predictions' : kind, 'repeat' : r})
+                            writer.writerow(row)
+                            handle.flush()
+                            print('%s n=%d %s %s #%d: %.2fs %.1fMB score %s' % (challenge, nssms, fmt, kind, r, row['wall'], row['peak_rss'] / 2.0**20, row['score']))
+
+def read_results(path):
+    '''
+    Reads the csv written by run
+    :return: dictionary case (tuple of the CASE_FIELDS) -> list of its rows, with numbers parsed
+    '''
+    cases = {}
+    with open(path, 'rb') as handle:
+        for row in csv.DictReader(handle):
+            row['nssms'] = int(row['nssms'])
+            row['wall'] = float(row['wall'])
+            row['peak_rss'] = float(row['peak_rss'])
+            row['score'] = float(row['score']) if row['score'] not in ['', 'None'] else None
+            row['status'] = int(row['status'])
+            cases.setdefault(tuple(row[f] for f in CASE_FIELDS), []).append(row)
+    return cases
+
+def ratio_interval(baseline, candidate, confidence=0.95):
+    '''
+    Ratio of the (geometric) mean of the candidate measurements to the one of the baseline, with a Welch
+    t confidence interval computed on the logarithms of the repetitions
+    :return: (ratio, low, high), low and high are the ratio if a side has less than two repetitions
+    '''
+    b = np.log(baseline)
+    c = np.log(candidate)
+    diff = np.mean(c) - np.mean(b)
+    if len(b) < 2 or len(c) < 2:
+        return np.exp(diff), np.exp(diff), np.exp(diff)
+    vb = np.var(b, ddof=1) / len(b)
+    vc = np.var(c, ddof=1) / len(c)
+    se = np.sqrt(vb + vc)
+    if se == 0:
+        return np.exp(diff), np.exp(diff), np.exp(diff)
+    df = (vb + vc)**2 / (vb**2 / (len(b) - 1) + vc**2 / (len(c) - 1))
+    t = scipy.stats.t.ppf(0.5 + confidence / 2.0, df)
+    return np.exp(diff), np.exp(diff - t * se), np.exp(diff + t * se)
+
+def compare(baseline, candidate, threshold=0.1, mem_threshold=0.1, score_tolerance=1e-9, confidence=0.95):
+    '''
+    Compares every case of two benchmark runs
+    :param baseline: results of the baseline, from read_results
+    :param candidate: results of the candidate, from read_results
+    :param threshold: a case regresses if its time ratio is larger than 1 + threshold with the given confidence
+    :param mem_threshold: same for the peak RSS ratio
+    :param score_tolerance: largest absolute difference allowed between the scores of the baseline and the candidate
+    :param confidence: confidence of the intervals of the ratios
+    :return: list with a dictionary for every case in both runs, with the ratios, their intervals and
+             the list of the failures of the case (empty if it passes)
+    '''
+    comparisons = []
+    for case in sorted(set(baseline) & set(candidate)):
+        b_rows = baseline[case]
+        c_rows = candidate[case]
+        comparison = dict(zip(CASE_FIELDS, case))
+        failures = []
+
+        time_ratio, time_low, time_high = ratio_interval([r['wall'] for r in b_rows], [r['wall'] for r in c_rows], confidence)
+        mem_ratio, mem_low, mem_high = ratio_interval([r['peak_rss'] for r in b_rows], [r['peak_rss'] for r in c_rows], confidence)
+        if time_low > 1 + threshold:
+            failures.append('%.2fx slower' % time_ratio)
+        if mem_low > 1 + mem_threshold:
+            failures.append('%.2fx more memory' % mem_ratio)
+
+        b_score = b_rows[0]['score']
+        for r in c_rows:
+            if r['status'] != 0 and all(b['status'] == 0 for b in b_rows):
+                failures.append('exit status %d' % r['status'])
+                break
+            if (r['score'] is None) != (b_score is None) or (b_score is not None and abs(r['score'] - b_score) > score_tolerance):
+                failures.append('score %s instead of %s' % (r['score'], b_score))
+                break
+
+        comparison.update({'speedup' : 1 / time_ratio, 'speedup_low' : 1 / time_high, 'speedup_high' : 1 / time_low,
+                           'memory_ratio' : mem_ratio, 'memory_low' : mem_low, 'memory_high' : mem_high,
+                           'baseline_score' : b_score, 'candidate_score' : c_rows[0]['score'], 'failures' : failures})
+        comparisons.append(comparison)
+    return comparisons
+
+def print_comparison(comparisons, baseline, candidate):
+    print('%-4s %7s %-6s %-5s %22s %22s  %s' % ('', 'nssms', 'format', 'pred', 'speedup', 'memory ratio', 'result'))
+    for c in comparisons:
+        print('%-4s %7d %-6s %-5s %6.2fx [%5.2f, %5.2f] %6.2fx [%5.2f, %5.2f]  %s' %
+              (c['challenge'], c['nssms'], c['format'], c['predictions'], c['speedup'], c['speedup_low'], c['speedup_high'],
+               c['memory_ratio'], c['memory_low'], c['memory_high'], ', '.join(c['failures']) if c['failures'] else 'ok'))
+    for case in sorted(set(baseline) ^ set(candidate)):
+        print('not compared, only in the %s run: %s' % ('baseline' if case in baseline else 'candidate', ' '.join(str(x) for x in case)))
+
+def calibrate(results, exponents=np.linspace(0, 3, 61)):
+    '''
+    Fits the runtime models of memplan, seconds = a + b * (nssms / 1000) ** p, on the txt cases of a run.
+    a and b are non negative least squares fits of the relative error, for every p of a grid up to the
+    MAX_EXPONENTS of the challenge. When the size term grows by less than the run-to-run noise (two standard
+    deviations of the repetitions) over the sizes of the run, the runtime does not depend on the size it
+    can measure and only the constant is kept, so it is not extrapolated.
+    :param results: results of a run, from read_results
+    :param exponents: values of p that are tried
+    :return: calibration that memplan.load_runtime_models reads, with the model of every challenge and
+             kind of prediction, and the smallest peak RSS of the run as the base memory
+    '''
+    walls = {}
+    for (challenge, nssms, fmt, kind), rows in results.items():
+        rows = [r for r in rows if r['status'] == 0]
+        if fmt == 'txt' and rows:
+            wall = [r['wall'] for r in rows]
+            noise = np.std(wall, ddof=1) if len(wall) > 1 else RUNTIME_NOISE * np.mean(wall)
+            walls.setdefault((challenge, kind), []).append((nssms, np.mean(wall), noise))
+
+    runtime = {}
+    for (challenge, kind), points in sorted(walls.items()):
+        x = np.array([n for n, _, _ in points]) / 1000.0
+        y = np.array([w for _, w, _ in points])
+        best = None
+        for p in [p for p in exponents if p <= MAX_EXPONENTS.get(challenge, max(exponents))]:
+            design = np.column_stack([np.ones(len(x)), x**p]) / y[:, None]
+            (a, b), residual = scipy.optimize.nnls(design, np.ones(len(y)))
+            if best is None or residual < best[0] - 1e-12:
+                best = (residual, [float(a), float(b), float(p)])
+        a, b, p = best[1]
+        if b * (np.max(x)**p - np.min(x)**p) <= 2 * max(noise for _, _, noise in points):
+            best = (None, [float(np.sum(1 / y) / np.sum(1 / y**2)), 0.0, 0.0])
+        runtime.setdefault(challenge, {})[kind] = best[1]
+
+    peaks = [r['peak_rss'] for rows in results.values() for r in rows if r['status'] == 0]
+    return {'runtime' : runtime, 'base_bytes' : int(min(peaks)) if peaks else None}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of SMCScoring.py on synthetic samples')
+    subparsers = parser.add_subparsers(dest='command')
+
+    def sample_arguments(p):
+        p.add_argument('--workdir', default='benchmark_samples', help='directory of the generated samples')
+        p.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='numbers of mutations in the vcf')
+        p.add_argument('--fp-rate', type=float, default=0.1, help='fraction of false positive lines in the vcf')
+        p.add_argument('--seed', type=int, default=0)
+        p.add_argument('--formats', nargs='+', choices=FORMATS, default=FORMATS)
+        p.add_argument('--predictions', nargs='+', choices=PREDICTIONS, default=PREDICTIONS)
+
+    generate_parser = subparsers.add_parser('generate', help='only generate the samples')
+    sample_arguments(generate_parser)
+
+    run_parser = subparsers.add_parser('run', help='generate the samples and time scoring them')
+    sample_arguments(run_parser)
+    run_parser.add_argument('-o', '--output', required=True, help='csv file the results are written to')
+    run_parser.add_argument('-c', '--challenges', nargs='+', choices=CHALLENGES, default=CHALLENGES)
+    run_parser.add_argument('--repeat', type=int, default=1, help='number of times every case is scored')
+    run_parser.add_argument('--trace-file', default=None, help='passed to SMCScoring.py, appends the phases of every run')
+
+    compare_parser = subparsers.add_parser('compare', help='compare the results of a candidate run to the ones of a baseline run')
+    compare_parser.add_argument('baseline', help='csv file of the baseline run')
+    compare_parser.add_argument('candidate', help='csv file of the candidate run')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='largest slowdown allowed, ex. 0.1 for 10%%')
+    compare_parser.add_argument('--mem-threshold', type=float, default=0.1, help='largest increase of the peak RSS allowed')
+    compare_parser.add_argument('--score-tolerance', type=float, default=1e-9, help='largest difference of the scores allowed')
+    compare_parser.add_argument('--confidence', type=float, default=0.95, help='confidence of the intervals of the ratios')
+
+    calibrate_parser = subparsers.add_parser('calibrate', help='fit the runtime models of SMCScoring.py --estimate on the results of a run')
+    calibrate_parser.add_argument('results', nargs='+', help='csv files of runs, with several sizes (ex. one run of the dense 2B/3B challenges and one of the others)')
+    calibrate_parser.add_argument('-o', '--output', required=True, help='json file of the calibration, read by SMCScoring.py --calibration')
+
+    args = parser.parse_args()
+    if args.command == 'calibrate':
+        results = {}
+        for path in args.results:
+            results.update(read_results(path))
+        calibration = calibrate(results)
+        with open(args.output, 'w') as f:
+            json.dump(calibration, f, indent=2, sort_keys=True)
+        for challenge, models in sorted(calibration['runtime'].items()):
+            for kind, (a, b, p) in sorted(models.items()):
+                print('%-4s %-5s %.3gs + %.3gs * (nssms / 1000)^%.2f' % (challenge, kind, a, b, p))
+    elif args.command == 'compare':
+        baseline = read_results(args.baseline)
+        candidate = read_results(args.candidate)
+        comparisons = compare(baseline, candidate, threshold=args.threshold, mem_threshold=args.mem_threshold,
+                              score_tolerance=args.score_tolerance, confidence=args.confidence)
+        print_comparison(comparisons, baseline, candidate)
+        if any(c['failures'] for c in comparisons):
+            sys.exit(1)
+    elif args.command == 'generate':
+        for nssms in args.sizes:
+            outdir = sample_dir(args.workdir, nssms, args.fp_rate, args.seed)
+            generate_sample(outdir, nssms, fp_rate=args.fp_rate, seed=args.seed, formats=args.formats, predictions=args.predictions)
+            print('Sample with %d mutations in %s' % (nssms, outdir))
+    else:
+        run(args.output, args.workdir, sizes=args.sizes, challenges=args.challenges, formats=args.formats,
+            predictions=args.predictions, repeat=args.repeat, fp_rate=args.fp_rate, seed=args.seed, trace_file=args.trace_file)
@@ -0,0 +1,190 @@
+import numpy as np
+
+# number of set bits in every possible byte
+POPCOUNT = np.array([bin(i).count('1') for i in xrange(256)], dtype=np.uint8)
+
+# number of rows packed at a time, so that the dense temporaries of a block stay small
+BLOCK_BYTES = 2**24
+
+def popcount(bits, axis=None):
+    '''
+    Counts the set bits of a packed array
+    :param bits: uint8 array from np.packbits
+    :param axis: axis to count along, None to count all bits
+    :return: number of set bits (int64)
+    '''
+    return np.sum(POPCOUNT[bits], axis=axis, dtype=np.int64)
+
+def row_blocks(n_rows, n_cols):
+    '''
+    Splits the rows of a n_rows x n_cols matrix in blocks of about BLOCK_BYTES entries
+    :return: generator of (start, stop) row ranges
+    '''
+    block = max(1, BLOCK_BYTES // max(n_cols, 1))
+    for start in xrange(0, n_rows, block):
+        yield start, min(start + block, n_rows)
+
+def triu_bits(start, stop, n_cols, k=0):
+    '''
+    Packed mask of the upper triangle (entries with j >= i + k) of rows start to stop of a square matrix
+    '''
+    rows = np.arange(start, stop)
+    return np.packbits(np.arange(n_cols)[None, :] >= rows[:, None] + k, axis=1)
+
+class BitMatrix(object):
+    '''
+    Binary matrix with every row packed into bits, 8 entries per byte.
+    Used for the 0/1 co-clustering and ancestor-descendant matrices, which otherwise take
+    a byte (int8) or eight bytes (float64) per entry.
+    '''
+    def __init__(self, bits, shape):
+        self.bits = bits
+        self.shape = shape
+
+    @staticmethod
+    def from_dense(matrix):
+        '''
+        Packs a dense matrix, one block of rows at a time
+        :param matrix: 2D matrix (any numeric dtype, np.matrix or memmap)
+        :return: BitMatrix or None if the matrix has entries other than 0 and 1
+        '''
+        n_rows, n_cols = matrix.shape
+        bits = np.empty((n_rows, (n_cols + 7) // 8), dtype=np.uint8)
+        for start, stop in row_blocks(n_rows, n_cols):
+            block = np.asarray(matrix[start:stop])
+            ones = block == 1
+            if not np.all(ones | (block == 0)):
+                return None
+            bits[start:stop] = np.packbits(ones, axis=1)
+        return BitMatrix(bits, (n_rows, n_cols))
+
+    def row_counts(self, mask=None):
+        '''
+        Number of ones in every row
+        :param mask: optional function (start, stop) -> packed mask the rows are and-ed with first
+        '''
+        return self.and_counts(None, mask)
+
+    def and_counts(self, other, mask=None):
+        '''
+        Number of entries that are one in both matrices, for every row
+        :param other: BitMatrix of the same shape, None to count the ones of this matrix
+        :param mask: optional function (start, stop) -> packed mask the rows are and-ed with first
+        '''
+        counts = np.empty(self.shape[0], dtype=np.int64)
+        for start, stop in row_blocks(self.shape[0], self.bits.shape[1] * 8):
+            block = self.bits[start:stop]
+            if other is not None:
+                block = block & other.bits[start:stop]
+            if mask is not None:
+                block = block & mask(start, stop)
+            counts[start:stop] = popcount(block, axis=1)
+        return counts
+
+def pack_binary(*matrices):
+    '''
+    Packs all the given matrices if they are all binary
+    :return: list of BitMatrix or None if one of the matrices is not binary
+    '''
+    packed = []
+    for matrix in matrices:
+        if isinstance(matrix, BitMatrix):
+            packed.append(matrix)
+            continue
+        if matrix.ndim != 2:
+            return None
+        bm = BitMatrix.from_dense(matrix)
+        if bm is None:
+            return None
+        packed.append(bm)
+    return packed
+
+def confusion_counts(pred, truth, full_matrix=True):
+    '''
+    True/false positive/negative counts of a binary prediction matrix against a binary truth matrix
+    :param pred: BitMatrix of the prediction
+    :param truth: BitMatrix of the truth
+    :param full_matrix: count all entries or only the strict upper triangle
+    :return: tp, fp, tn, fn as floats
+    '''
+    n_rows, n_cols = truth.shape
+    mask = None
+    if full_matrix:
+        total = n_rows * n_cols
+    else:
+        mask = lambda start, stop: triu_bits(start, stop, n_cols, k=1)
+        total = n_rows * (n_rows - 1) // 2
+    tp = float(np.sum(pred.and_counts(truth, mask)))
+    fp = float(np.sum(pred.row_counts(mask))) - tp
+    fn = float(np.sum(truth.row_counts(mask))) - tp
+    tn = total - tp - fp - fn
+    return tp, fp, tn, fn
+
+def any_overlap_triu(*matrices):
+    '''
+    Checks whether two of the binary matrices have a one at the same entry of the strict upper triangle,
+    i.e. whether their sum is larger than 1 somewhere
+    :param matrices: BitMatrix objects of the same shape
+    '''
+    n_rows, n_cols = matrices[0].shape
+    for start, stop in row_blocks(n_rows, n_cols):
+        mask = triu_bits(start, stop, n_cols, k=1)
+        seen = np.zeros_like(mask)
+        for m in matrices:
+            block = m.bits[start:stop] & mask
+            if np.any(seen & block):
+                return True
+            seen |= block
+    return False
+
+def pseudoV_rows(pred, truth, rnd=0.01, sym=False, full_matrix=True):
+    '''
+    Pseudo V measure of two binary matrices, computed from the per-row counts of the four
+    (pred, truth) entry combinations instead of from the dense rows
+    :param pred: BitMatrix of the prediction
+    :param truth: BitMatrix of the truth
+    :param rnd: value the zero entries are replaced with
+    :param sym: add the divergence of pred from truth as well (symmetric pseudo V)
+    :param full_matrix: use all entries or only the upper triangle (including the diagonal)
+    :return: sum of the row divergences
+    '''
+    n_cols = truth.shape[1]
+    mask = None
+    if not full_matrix:
+        mask = lambda start, stop: triu_bits(start, stop, n_cols)
+    n11 = pred.and_counts(truth, mask)
+    return pseudoV_from_counts(n11, pred.row_counts(mask), truth.row_counts(mask), n_cols, rnd=rnd, sym=sym)
+
+def pseudoV_from_counts(n11, pred_ones, truth_ones, n_cols, rnd=0.01, sym=False, weights=None, axis=None):
+    '''
+    Pseudo V measure of binary rows given only how many ones they have
+    :param n11: number of entries that are one in both the predicted and the true row, for every row
+    :param pred_ones: number of ones in every predicted row
+    :param truth_ones: number of ones in every true row
+    :param n_cols: length of the rows
+    :param rnd: value the zero entries are replaced with
+    :param sym: add the divergence of pred from truth as well (symmetric pseudo V)
+    :param weights: number of times every row occurs, None if every row occurs once
+    :param axis: axis the rows are summed over, None for all of them
+    :return: sum of the row divergences
+    '''
+    n11 = np.asarray(n11, dtype=float)
+    n1_ = pred_ones - n11
+    n_1 = truth_ones - n11
+    n00 = n_cols - n11 - n1_ - n_1
+
+    # row sums after the zeros are replaced by rnd
+    pred_sum = (1 - rnd) * (n11 + n1_) + rnd * n_cols
+    truth_sum = (1 - rnd) * (n11 + n_1) + rnd * n_cols
+
+    res = 0.0
+    for count, p, t in [(n11, 1.0, 1.0), (n1_, 1.0, rnd), (n_1, rnd, 1.0), (n00, rnd, rnd)]:
+        p_val = p / pred_sum
+        t_val = t / truth_sum
+        terms = t_val * np.log(t_val / p_val)
+        if sym:
+            terms += p_val * np.log(p_val / t_val)
+        if weights is not None:
+            terms = terms * weights
+        res += np.sum(count * terms, axis=axis)
+    return res
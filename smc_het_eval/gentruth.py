@@ -182,12 +182,24 @@ func_map = 	{	'1A':{'func': getTruth1A,'extension':'txt'},
 				'scoring_vcf':{'func': getScoringVCF,'extension':'vcf'}
 			}
 
+# truth files scored by each challenge that normalizes its score with baselines
+baseline_map = {	'2A':['2A'],
+					'2B':['2B'],
+					'3A':['2A','3A'],
+					'3B':['2B','3B']
+				}
+
 def generate_truth(yaml_file,truth_vcf_prefix,vcf_location,output_prefix):
 	with open(yaml_file, 'r') as stream:
 		yaml_ob = yaml.load(stream)
+	filenames = {}
 	for challenge in func_map:
 		filename = '%s.truth.%s.%s' % (output_prefix, challenge, func_map[challenge]['extension'])
 		func_map[challenge]['func'](yaml_ob,truth_vcf_prefix,vcf_location,filename)
+		filenames[challenge] = filename
+	# the scoring baselines only depend on the truth, store them next to it so they are not recomputed for every submission
+	for challenge, truth in baseline_map.items():
+		SMCScoring.precompute_baselines(challenge, [filenames[x] for x in truth], filenames['scoring_vcf'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,153 @@
+import json
+import re
+import numpy as np
+
+# ways of holding the matrices of a challenge in memory, fastest first
+#   labels  - 1A/1B/1C vectors and the 2A/3A overlap matrices, linear in the number of mutations
+#   float64 - dense n x n prediction matrices, as parsed by validate2B/validate3B
+#   float32 - dense n x n prediction matrices with half the footprint, scores differ in the last digits
+STRATEGIES = ['labels', 'float64', 'float32']
+
+# strategies that can score each challenge
+CHALLENGE_STRATEGIES = {
+    '1A' : ['labels'],
+    '1B' : ['labels'],
+    '1C' : ['labels'],
+    '2A' : ['labels'],
+    '2B' : ['float64', 'float32'],
+    '3A' : ['labels'],
+    '3B' : ['float64', 'float32']
+}
+
+ITEMSIZE = {
+    'float64' : 8,
+    'float32' : 4
+}
+
+# parsed vcf line, mutation labels and python object overhead per mutation
+MUTATION_BYTES = 512
+
+SIZE_UNITS = {'' : 1, 'K' : 2**10, 'M' : 2**20, 'G' : 2**30, 'T' : 2**40}
+
+# resident memory of the scoring process before any input is read (interpreter, numpy and scipy)
+BASE_BYTES = 34 * 2**20
+
+# runtime of scoreChallenge in seconds, a + b * (nssms / 1000.0) ** p, by challenge and kind of prediction
+# (hard assignments, or soft 2B/3B matrices). Fitted with benchmark.py calibrate on the synthetic samples, the
+# challenges without matrices at 1000-100000 mutations and 2B/3B at 500-4000. 1A/1B/1C do not depend on the
+# number of mutations. load_runtime_models replaces them with the constants of another machine.
+RUNTIME_MODELS = {
+    '1A' : {'hard' : [0.21, 0.0, 0.0]},
+    '1B' : {'hard' : [0.23, 0.0, 0.0]},
+    '1C' : {'hard' : [0.26, 0.0, 0.0]},
+    '2A' : {'hard' : [0.22, 0.115, 1.1]},
+    '2B' : {'hard' : [0.27, 0.35, 1.95], 'soft' : [0.35, 0.75, 2.0]},
+    '3A' : {'hard' : [0.0, 0.315, 0.85]},
+    '3B' : {'hard' : [0.19, 1.91, 1.9], 'soft' : [0.11, 2.77, 1.8]}
+}
+
+def parse_size(text):
+    '''
+    Parses a memory size such as 512M, 4G or 1.5T (powers of 1024, a trailing B is allowed)
+    :param text: size, a plain number is a number of bytes
+    :return: size in bytes
+    '''
+    match = re.match(r'^\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)B?\s*$', str(text), re.IGNORECASE)
+    if match is None:
+        raise ValueError('Invalid memory size %s' % text)
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+def format_size(size):
+    for unit in ['T', 'G', 'M', 'K']:
+        if size >= SIZE_UNITS[unit]:
+            return '%.1f%sB' % (size / float(SIZE_UNITS[unit]), unit)
+    return '%dB' % size
+
+def estimate_peak(challenge, n_pred, n_truth, strategy, truth_mapped=False, baselines=False):
+    '''
+    Estimates the peak memory used by scoreChallenge
+    :param challenge: one of 1A, 1B, 1C, 2A, 2B, 3A, 3B
+    :param n_pred: number of predicted mutations (lines of the vcf)
+    :param n_truth: number of true mutations
+    :param strategy: one of STRATEGIES
+    :param truth_mapped: the truth matrices are memory mapped read-only from the truth store,
+                         their pages can be dropped by the OS so they are not counted
+    :param baselines: the baseline scores are precomputed, so the baseline matrices are never built
+    :return: peak number of bytes, None if the strategy can not score the challenge
+    '''
+    if strategy not in CHALLENGE_STRATEGIES[challenge]:
+        return None
+    peak = MUTATION_BYTES * (n_pred + n_truth)
+    if strategy == 'labels':
+        return peak
+
+    pred = ITEMSIZE[strategy]
+    if challenge == '2B':
+        # the truth is resized in place to m x m with the pseudo counts, and stays loaded
+        m = n_truth + int(np.floor(np.sqrt(n_truth)))
+        truth = 8 * m**2
+        steps = [
+            # the resize of the truth may copy it
+            8 * (n_truth**2 + m**2),
+            # parsed prediction plus the boolean temporaries of the validation
+            truth + (pred + 1) * n_pred**2,
+            # filtered prediction with pseudo counts plus both matrices packed into bits
+            truth + pred * m**2 + m**2 // 4
+        ]
+        if not baselines:
+            # OneCluster / NCluster matrices (int8) and their packed bits
+            steps.append(truth + pred * m**2 + m**2 + m**2 // 8)
+    else:
+        # co-clustering and ancestor-descendant matrix of both the truth and the prediction
+        truth = 0 if truth_mapped else 16 * n_truth**2
+        steps = [
+            truth + (2 * pred + 1) * n_pred**2,
+            # C matrices of calculate3Final, the one of the truth is float64
+            truth + 2 * pred * n_truth**2 + 8 * n_truth**2 + pred * n_truth**2 + n_truth**2 // 2
+        ]
+        if not baselines:
+            # C matrix of the truth and the OneCluster matrices (int8)
+            steps.append(truth + 2 * pred * n_truth**2 + 8 * n_truth**2 + 3 * n_truth**2)
+    return peak + max(steps)
+
+def plan(challenge, n_pred, n_truth, limit, truth_mapped=False, baselines=False):
+    '''
+    Picks the fastest strategy whose estimated peak memory fits under the limit
+    :param limit: memory limit in bytes
+    :return: (strategy, peak bytes), strategy is None and the peak is the smallest one if none fits
+    '''
+    smallest = None
+    for strategy in CHALLENGE_STRATEGIES[challenge]:
+        peak = estimate_peak(challenge, n_pred, n_truth, strategy, truth_mapped=truth_mapped, baselines=baselines)
+        if peak <= limit:
+            return strategy, peak
+        smallest = peak if smallest is None else min(smallest, peak)
+    return None, smallest
+
+def load_runtime_models(path):
+    '''
+    Replaces the runtime models and the base memory with the ones written by benchmark.py calibrate
+    :param path: calibration file (json)
+    '''
+    global BASE_BYTES
+    with open(path) as f:
+        calibration = json.load(f)
+    for challenge, models in calibration['runtime'].items():
+        RUNTIME_MODELS.setdefault(challenge, {}).update(models)
+    if calibration.get('base_bytes') is not None:
+        BASE_BYTES = calibration['base_bytes']
+
+def estimate_runtime(challenge, n_pred, kind='hard'):
+    '''
+    Estimates the runtime of scoreChallenge from the runtime models
+    :param challenge: one of 1A, 1B, 1C, 2A, 2B, 3A, 3B
+    :param n_pred: number of predicted mutations (lines of the vcf)
+    :param kind: hard, or soft for 2B/3B predictions that are not 0/1 matrices
+    :return: seconds, None if there is no model for the challenge
+    '''
+    models = RUNTIME_MODELS.get(challenge, {})
+    model = models.get(kind, models.get('hard'))
+    if model is None:
+        return None
+    a, b, p = model
+    return a + b * (n_pred / 1000.0)**p
@@ -1,8 +1,14 @@
 from SMCScoring import *
 import numpy as np
+import collections
 import csv
+import multiprocessing
+import sweep
+# imported explicitly, SMCScoring imports this module before it defines its names
+from scoring_harness_optimized import om_calculate2A, om_get_baselines2A, calculate3A, get_baselines3A, phylogeny_closure
 
 tsv_dir = './scoring_metric_data/text_files/' # directory to save tsv's to
+batch_entries = 2**22 # matrix entries of the random replicates that are generated and scored together
 
 def scoring1A_behavior(method='abs'):
     guesses = np.array(range(0,101))/100.0
@@ -172,7 +178,7 @@ def scoring1C_behavior(method='abs'):
     f.write('\n'.join(res))
     f.close()        
 
-def scoring2A_behavior(tst_big_mat=True, tst_rand_reassign=True, tst_closest_reassign=True, method='default', verbose=False):
+def scoring2A_behavior(tst_big_mat=True, tst_rand_reassign=True, tst_closest_reassign=True, method='default', verbose=False, processes=1, n_iter=5):
     '''Test the scoring behaviour of different metrics for evaluating Sub-Challenge 2, under various conditions.
 
     :param tst_big_mat: boolean for whether to test all the mistake scenarios with a larger number of clusters
@@ -180,6 +186,8 @@ def scoring2A_behavior(tst_big_mat=True, tst_rand_reassign=True, tst_closest_rea
     :param tst_closest_reassign: boolean for whether to test reassigning a portion of the mutations to the nearest cluster
     :param method: scoring metric to use
     :param verbose: boolean for whether to print output on the status of the function
+    :param processes: number of worker processes for the reassignment probabilities
+    :param n_iter: number of random reassignments for each probability, they are generated and scored in batches
     '''
 
     # Test the scoring behavior when the predicted CCM comes from one of the presepeficied 'mistake scenarios'
@@ -198,7 +206,7 @@ def scoring2A_behavior(tst_big_mat=True, tst_rand_reassign=True, tst_closest_rea
     res = []
     for sc in scenarios:
         # calculate the CCM
-        ccm = get_ccm(sc ,t_ccm=t_ccm, t_clusters=t_clusters, size_clusters=size_clusters, n_clusters=n_clusters, big_extra_num=big_extra_num)
+        ccm = get_ccm(sc, size_clusters=size_clusters, n_clusters=n_clusters, big_extra_num=big_extra_num)
         # calculate the score for the given scenario
         res.append([sc ,calculate2(ccm, t_ccm, method=method)])
         # res.append([sc ,calculate2(ccm, t_ccm, method=method)])
@@ -224,7 +232,7 @@ def scoring2A_behavior(tst_big_mat=True, tst_rand_reassign=True, tst_closest_rea
 
         for sc in scenarios:
             # calculate the CCM
-            ccm = get_ccm(sc ,t_ccm=t_ccm, t_clusters=t_clusters, size_clusters=size_clusters, n_clusters=n_clusters, big_extra_num=big_extra_num)
+            ccm = get_ccm(sc, size_clusters=size_clusters, n_clusters=n_clusters, big_extra_num=big_extra_num)
             # calculate the score for the given scenario
             res_more_cl.append([sc ,calculate2(ccm, t_ccm, method=method)])
             # res_more_cl.append([sc ,calculate2(ccm, t_ccm, method=method)])
@@ -250,59 +258,17 @@ def scoring2A_behavior(tst_big_mat=True, tst_rand_reassign=True, tst_closest_rea
 
         # Testing parameters
         p_errors = [0.01,0.03,0.05,.1,.15,.25,.5] # probability that a mutation is reassigned
-        n_iter = 5 # number of iterations to perform for each p_err value
         size_clusters = 200 # true size of each cluster
         n_clusters = 5 # true number of clusters
 
-        t_ccm, t_clusters = get_ccm('Truth',size_clusters=size_clusters, n_clusters=n_clusters)
-
-        for p_err in p_errors:
-            if verbose:
-                print('     Using a probability of reassignment of ' + str(p_err) + ':')
-            for i in range(n_iter):
-                if verbose:
-                    print('          Iteration ' + str(i+1) + ' of ' + str(n_iter) + '...')
-
-                clusters = {}
-                if tst_rand_reassign:
-                    clusters['rand'] = np.copy(t_clusters)
-                if tst_closest_reassign:
-                    clusters['closest'] = np.copy(t_clusters)
-
-                for j in range(t_ccm.shape[0]):
-                    if np.random.random() < p_err:
-                        if tst_rand_reassign:
-                            cluster = np.argmax(clusters['rand'][j,:])
-                            if np.random.random() < 0.5:
-                                cluster -= 1
-                            else:
-                                cluster += 1
-                            cluster = cluster % n_clusters
-
-                            clusters['rand'][j,:] = 0
-                            clusters['rand'][j,cluster] = 1
-
-                        if tst_closest_reassign:
-                            cluster = np.argmax(clusters['closest'][j,:])
-                            if cluster == (n_clusters - 1):
-                                cluster = (n_clusters - 2)
-                            elif cluster == 0:
-                                cluster = 1
-                            else:
-                                if np.random.random() < 0.5:
-                                    cluster = (cluster + 1)
-                                else:
-                                    cluster = (cluster - 1)
-                            clusters['closest'][j,:] = 0
-                            clusters['closest'][j,cluster] = 1
-                if tst_rand_reassign:
-                    ccm = np.dot(clusters['rand'],clusters['rand'].T)
-                    # res['rand'].append([p_err,calculate2(ccm,t_ccm, method=method)])
-                    res['rand'].append([p_err,calculate2(ccm,t_ccm, method=method)])
-                if tst_closest_reassign:
-                    ccm = np.dot(clusters['closest'],clusters['closest'].T)
-                    # res['closest'].append([p_err,calculate2(ccm,t_ccm, method=method)])
-                    res['closest'].append([p_err,calculate2(ccm,t_ccm, method=method)])
+        # every probability is a task of a sweep, checkpointed so an interrupted run resumes
+        context = scoring2A_reassign_context(size_clusters, n_clusters, method, sorted(res.keys()))
+        grid = [('p_err', p_errors), ('n_iter', [n_iter])]
+        results = sweep.run(scoring2A_reassign_task, grid, tsv_dir + 'scoring2A_' + '_'.join(context['kinds']) + '_reassignment_' + method + '.sweep.tsv',
+                            context=context, processes=processes, verbose=verbose)
+        for task, scores in results:
+            for kind in context['kinds']:
+                res[kind].extend([task['p_err'], score] for score in scores[kind])
 
         # Output the results
         if tst_rand_reassign:
@@ -318,32 +284,78 @@ def scoring2A_behavior(tst_big_mat=True, tst_rand_reassign=True, tst_closest_rea
             f.write('\n'.join(res['closest']))
             f.close()
 
-    
-def scoring2B_behavior(tst_betas=True, tst_prob_mod=True, tst_prob_mod_err=True, method='pseudoV', verbose=True):
+def reassign_labels(t_labels, n_clusters, p_err, n_iter, kind='rand'):
+    '''Reassigns each mutation with probability p_err to the cluster before or after its own, in n_iter independent
+    replicates. 'rand' wraps around the first and the last clusters, 'closest' moves their mutations to their only neighbour.
+
+    :param t_labels: true cluster (from 0) of every mutation
+    :param n_clusters: number of clusters
+    :param p_err: probability that a mutation is reassigned
+    :param n_iter: number of replicates
+    :param kind: 'rand' or 'closest'
+    :return: n_iter x mutations array with the cluster of every mutation in every replicate
+    '''
+    moved = np.random.random((n_iter, len(t_labels))) < p_err
+    step = np.where(np.random.random(moved.shape) < 0.5, -1, 1)
+    labels = t_labels + moved * step
+    if kind == 'rand':
+        return labels % n_clusters
+    elif kind == 'closest':
+        labels[labels == -1] = 1
+        labels[labels == n_clusters] = n_clusters - 2
+        return labels
+    raise ValueError("Reassignment kind must be one of rand or closest, not %s" % kind)
+
+def scoring2A_reassign_context(size_clusters, n_clusters, method, kinds):
+    '''Shared data of the reassignment tasks: the true clusters and the baselines calculate2 computes from the true CCM'''
+    t_ccm = get_ccm('Truth', size_clusters=size_clusters, n_clusters=n_clusters)[0]
+    context = {'t_labels' : np.repeat(np.arange(n_clusters), size_clusters), 'n_clusters' : n_clusters, 'method' : method,
+               'kinds' : kinds, 'baselines' : get_baselines2(t_ccm, method=method)}
+    if method not in calculate2_overlap_funcs and method in calculate2_funcs:
+        context['t_ccm'] = t_ccm
+    return context
+
+def scoring2A_reassign_task(context, p_err, n_iter):
+    '''Reassigns the mutations with probability p_err to a random and/or to the closest cluster in n_iter replicates,
+    and scores every replicate with calculate2. The metrics of calculate2_overlap score the replicates of a batch together.'''
+    t_labels, method, baselines = context['t_labels'], context['method'], context['baselines']
+    batch = max(1, batch_entries // len(t_labels))
+    scores = {}
+    for kind in context['kinds']:
+        scores[kind] = []
+        for start in range(0, n_iter, batch):
+            labels = reassign_labels(t_labels, context['n_clusters'], p_err, min(batch, n_iter - start), kind)
+            if 't_ccm' not in context:
+                scores[kind].extend(calculate2_overlap_batch(t_labels, labels, method=method, baselines=baselines))
+                continue
+            for l in labels:
+                ccm = (l[:, None] == l[None, :]).astype(float)
+                scores[kind].append(calculate2(ccm, context['t_ccm'], method=method, baselines=baselines))
+    return scores
+
+def scoring2B_behavior(tst_betas=True, tst_prob_mod=True, tst_prob_mod_err=True, method='pseudoV', verbose=True, processes=1, n_iter=5):
+    '''Test the scoring behaviour of different metrics for evaluating Sub-Challenge 2B, with probabilities in the predicted CCM.
+
+    :param tst_betas: boolean for whether to test subtracting beta distributed errors from the true CCM
+    :param tst_prob_mod: boolean for whether to test the mistake scenarios with a lower certainty
+    :param tst_prob_mod_err: boolean for whether to also add normally distributed errors to the uncertain CCMs
+    :param method: scoring metric to use
+    :param verbose: boolean for whether to print output on the status of the function
+    :param processes: number of worker processes for the beta concentrations and the scenarios
+    :param n_iter: number of random beta errors for each concentration, they are generated and scored in batches
+    '''
     if tst_betas:
         if verbose:
             print 'Testing adding beta error to the true CCM:'
         t_ccm, t_clusters = get_ccm('Truth',size_clusters=200, n_clusters=3, big_extra_num=33)
 
-        n_uniq = len(np.triu_indices(t_ccm.shape[0],k=1)[0])
-        res = []
         concentrations = [1000,100,50,25,10,5,3,1]
-        n_iter = 5 # number of iterations to perform for each concentration value
 
-        for c in concentrations:
-            if verbose:
-                print ('       Beta Error with concentration param = ' + str(c) + '...')
-            for i in range(n_iter):
-                if verbose:
-                    print('           Iteration ' + str(i+1) + ' of ' + str(n_iter) + '...')
-
-                ccm = np.copy(t_ccm)
-                ccm[np.triu_indices(t_ccm.shape[0],k=1)] -= np.random.beta(1,c,n_uniq) # subtract beta error from the upper triangular part of the true CCM
-                ccm[np.tril_indices(t_ccm.shape[0],k=-1)] = 0 # ensure the matrix is symmetrical
-                ccm = ccm + ccm.T
-                np.fill_diagonal(ccm,1) # ensure the matrix has 1's along the diagonal
-                ccm = np.abs(ccm) # ensure the matrix has values between 0 and 1
-                res.append([c,calculate2(ccm,t_ccm, method=method)])
+        grid = [('concentration', concentrations), ('n_iter', [n_iter])]
+        context = {'t_ccm' : t_ccm, 'method' : method, 'baselines' : get_baselines2(t_ccm, method=method)}
+        results = sweep.run(scoring2B_beta_task, grid, tsv_dir + 'scoring2B_beta_' + method + '.sweep.tsv',
+                            context=context, processes=processes, verbose=verbose)
+        res = [[task['concentration'], score] for task, scores in results for score in scores]
         res = [map(str,x) for x in res]
         res = ['\t'.join(x) for x in res]
         f = open(tsv_dir + 'scoring2B_beta_' + method + '.tsv', 'w')
@@ -358,68 +370,20 @@ def scoring2B_behavior(tst_betas=True, tst_prob_mod=True, tst_prob_mod_err=True,
         t_ccm, t_clusters = get_ccm('Truth', size_clusters=size_clusters, n_clusters=n_clusters, big_extra_num=big_extra_num)
 
         TwoBscenarios = ['SmallExtra', "BigExtra", "OneCluster", "NCluster", "SplitClusterBot", "MergeClusterBot"]
+        probs = [0.95,0.9,0.85,0.8,0.75,0.7]
+        stds = [0.01,0.03,0.05,0.1,0.15,0.2] if tst_prob_mod_err else []
+
+        # every scenario is a task of a sweep, checkpointed so an interrupted run resumes
+        context = {'t_ccm' : t_ccm, 'size_clusters' : size_clusters, 'n_clusters' : n_clusters,
+                   'big_extra_num' : big_extra_num, 'method' : method, 'probs' : probs, 'stds' : stds,
+                   'baselines' : get_baselines2(t_ccm, method=method)}
+        results = sweep.run(scoring2B_prob_task, [('scenario', TwoBscenarios)], tsv_dir + '2B_prob_scoring_' + method + ('_with_err' if tst_prob_mod_err else '') + '.sweep.tsv',
+                            context=context, processes=processes, verbose=verbose)
         scoring_data = {}
-        if tst_prob_mod_err:
-            error_data = {}
-        for sc in TwoBscenarios:
-            if verbose:
-                print('  Scenario: ' + sc)
-            ccm = get_ccm(sc,t_ccm=t_ccm, t_clusters=t_clusters, size_clusters=size_clusters, n_clusters=n_clusters, big_extra_num=big_extra_num)
-            ccm_ones = (ccm == 1)
-            ccms = [ccm]
-            if verbose:
-                print '       Calculating SC2 score with certainty of 1...'
-            data = [calculate2(ccm, t_ccm, method=method)]
-
-            diag = np.diag_indices(ccm.shape[0])
-
-            if tst_prob_mod_err:
-                stds = [0.01,0.03,0.05,0.1,0.15,0.2]
-                errs = {} # error matrix for each std value - keep error matrix the same for all probabalistic ccm's
-                data_err = {} # ccm's for each certainty level with including small errors
-                for std in stds:
-                    err = np.random.normal(0,std,ccm.shape) # add some random error to each entry in the matrix
-                    err = np.triu(err, 1) # make sure the error matrix is symmetrical and the diagonal is all 0's
-                    err = err + np.transpose(err)
-                    errs[std] = err
-
-                for std in stds:
-                    ccm_err = (ccm - errs[std])
-
-                    ccm_err[ccm_err > 1] = 1 # make sure all values are between 0 and 1
-                    ccm_err[ccm_err < 0] = 0
-
-                    ccms_err = [ccm_err]
-                    if verbose:
-                        print '       Calculating SC2 score with certainty of 1 with Errors using std dev of ' + str(std) + '...'
-                    data_err[std] = [calculate2(ccm_err, t_ccm, method=method)]
-
-            probs = [0.95,0.9,0.85,0.8,0.75,0.7]
-            for prob in probs: # prob is your certainty of your results
-                ccm_prob = np.copy(ccm) + (1-prob) # change 0's to 1-prob
-                ccm_prob[ccm_ones] -= 2*(1-prob) # change 1's to prob
-                ccm_prob[diag] = 1 # diagonal should always be ones
-                ccms.append(ccm_prob)
-
-                if verbose:
-                    print '       Calculating SC2 score with certainty of ' + str(prob) + '...'
-                data.append(calculate2(ccm_prob, t_ccm, method=method))
-
-                if tst_prob_mod_err:
-                    for std in stds:
-                        ccm_prob_err = (ccm_prob - errs[std])
-
-                        ccm_prob_err[ccm_prob_err > 1] = 1 # make sure all values are between 0 and 1
-                        ccm_prob_err[ccm_prob_err < 0] = 0
-
-                        ccms_err.append(ccm_prob_err)
-                        if verbose:
-                            print '       Calculating SC2 score with certainty of ' + str(prob) + ' with Errors using std dev of ' + str(std) + '...'
-                        data_err[std].append(calculate2(ccm_prob_err, t_ccm, method=method))
-
-            scoring_data[sc] = data
-            if tst_prob_mod_err:
-                error_data[sc] = data_err
+        error_data = {}
+        for task, result in results:
+            scoring_data[task['scenario']] = result['data']
+            error_data[task['scenario']] = dict(zip(stds, result['errors']))
 
         with open(tsv_dir + '2B_prob_scoring_' + method + '.tsv', 'w') as f:
             writer = csv.writer(f)
@@ -439,6 +403,65 @@ def scoring2B_behavior(tst_betas=True, tst_prob_mod=True, tst_prob_mod_err=True,
 
 
 
+def beta_error_ccms(t_ccm, concentration, n_iter):
+    '''Subtracts beta distributed errors with the given concentration from the true CCM, in n_iter independent replicates
+
+    :return: n_iter x n x n array of symmetric CCMs with ones on the diagonal
+    '''
+    n = t_ccm.shape[0]
+    upper = np.triu(np.ones((n, n), dtype=bool), k=1)
+    # beta(1, concentration) errors, drawn by inverting their distribution function (1 - (1-x)^concentration)
+    errors = 1 - np.random.random((n_iter, np.count_nonzero(upper))) ** (1.0 / concentration)
+    ccms = np.zeros((n_iter, n, n))
+    ccms[:, upper] = t_ccm[upper] - errors # subtract beta error from the upper triangular part of the true CCM
+    ccms += ccms.transpose(0, 2, 1) # ensure the matrix is symmetrical
+    ccms[:, np.arange(n), np.arange(n)] = 1 # ensure the matrix has 1's along the diagonal
+    return np.abs(ccms, out=ccms) # ensure the matrix has values between 0 and 1
+
+def prob_ccms(ccm, probs):
+    '''CCMs of a clustering with every certainty in probs, the ones of the CCM become prob and the zeros 1-prob
+
+    :return: len(probs) x n x n array
+    '''
+    n = ccm.shape[0]
+    probs = np.asarray(probs, dtype=float)[:, None, None]
+    ccms = np.where(ccm == 1, probs, 1 - probs)
+    ccms[:, np.arange(n), np.arange(n)] = 1 # diagonal should always be ones
+    return ccms
+
+def scoring2B_beta_task(context, concentration, n_iter):
+    '''Subtracts beta distributed errors with the given concentration from the true CCM in n_iter replicates, and scores every replicate'''
+    t_ccm = context['t_ccm']
+    batch = max(1, batch_entries // t_ccm.size)
+    scores = []
+    for start in range(0, n_iter, batch):
+        ccms = beta_error_ccms(t_ccm, concentration, min(batch, n_iter - start))
+        scores.extend(calculate2_batch(ccms, t_ccm, method=context['method'], baselines=context['baselines']))
+    return scores
+
+def scoring2B_prob_task(context, scenario):
+    '''Scores the CCM of a mistake scenario with every certainty in context['probs'], with and without the
+    normally distributed errors of every std in context['stds']
+
+    :return: dictionary with the scores with certainty 1 and each of the probs ('data'), and the same scores
+             with the errors of each std ('errors')
+    '''
+    t_ccm, method, baselines = context['t_ccm'], context['method'], context['baselines']
+    ccm = get_ccm(scenario, size_clusters=context['size_clusters'], n_clusters=context['n_clusters'], big_extra_num=context['big_extra_num'])
+    # certainty 1 is the CCM itself
+    ccms = prob_ccms(ccm, [1] + list(context['probs']))
+    data = list(calculate2_batch(ccms, t_ccm, method=method, baselines=baselines))
+
+    errors = []
+    for std in context['stds']:
+        err = np.random.normal(0,std,ccm.shape) # add some random error to each entry in the matrix
+        err = np.triu(err, 1) # make sure the error matrix is symmetrical and the diagonal is all 0's
+        err = err + np.transpose(err)
+        # keep error matrix the same for all probabalistic ccm's, and all values between 0 and 1
+        errors.append(list(calculate2_batch(np.clip(ccms - err, 0, 1), t_ccm, method=method, baselines=baselines)))
+
+    return {'data' : data, 'errors' : errors}
+
 def scoring3A_behavior(method="orig", verbose=False, weights=None, save=True, pc_amount='more', full_matrix=True, in_mat=2):
     '''Scoring behaviour of subchallenge 3 metrics
 
@@ -462,21 +485,7 @@ def scoring3A_behavior(method="orig", verbose=False, weights=None, save=True, pc
 
     res = list() # results of using the given method to score each scenario
 
-    if pc_amount is 'more':
-        n_pc = np.sqrt(t_ccm.shape[0]) # number of pseudo counts to include
-        pc_ext = "_more_pc" # file name extension for the amount of pseudo counts to include
-    elif pc_amount is 'less':
-        n_pc = np.log(t_ccm.shape[0])
-        pc_ext = ""
-    elif pc_amount is 'none':
-        n_pc = 0
-        pc_ext = "_no_pc"
-
-    in_mat_ext = {1:'_all',
-                  2:'_nc',
-                  3:'_na',
-                  4:'_nat',
-                  5:'_ncous'}[in_mat]
+    n_pc = scoring3A_pseudo_counts(pc_amount, t_ccm.shape[0])
 
     for scenario in scenarios:
         if verbose:
@@ -487,118 +496,175 @@ def scoring3A_behavior(method="orig", verbose=False, weights=None, save=True, pc
                         calculate3(t_ccm,t_ad,t_ccm,t_ad,
                                    method=method, verbose=verbose, weights=weights, pseudo_counts=n_pc, full_matrix=full_matrix, in_mat=in_mat)])
         else:
-            ccm = get_ccm(scenario, t_ccm=t_ccm)
-            ad = get_ad(scenario, t_ad=t_ad)
+            ccm = get_ccm(scenario)
+            ad = get_ad(scenario)
             res.append([scenario,
                         calculate3(ccm,ad,t_ccm,t_ad,
                                    method=method, verbose=verbose, weights=weights, pseudo_counts=n_pc, full_matrix=full_matrix, in_mat=in_mat)])
 
 
     if save:
-        if full_matrix:
-            tri_ext = "_full"
-        else:
-            tri_ext = "_triu"
-        if isinstance(method, list):
-            f = open(tsv_dir + 'scoring3A_all_cases_' + '_'.join([m + in_mat_ext for m in method]) + pc_ext + tri_ext + '.tsv', 'w')
-        else:
-            f = open(tsv_dir + 'scoring3A_all_cases_' + method + in_mat_ext +  pc_ext + tri_ext + '.tsv', 'w')
-        out_res = [map(str,x) for x in res]
-        out_res = ['\t'.join(x) for x in out_res]
-        f.write('\n'.join(out_res))
-        f.close()
+        write_scoring3A_cases(res, method, pc_amount, full_matrix, in_mat)
 
     return res
 
-def scoring3A_behavior_all(verbose=True):
-    for method in ['pseudoV',
-                    'orig',
-                    'mcc',
-                    'pearson',
-                    'spearman',
-                    'aupr',
-                    'sqrt',
-                    'sym_pseudoV',
-                   ['pseudoV', 'mcc', 'pearson'],
-                   ['pseudoV', 'pearson', 'sym_pseudoV'],
-                   ['aupr', 'sqrt', 'sym_pseudoV'],
-                   ['aupr', 'sqrt', 'sym_pseudoV', 'pearson']]:
-        for fm in [True, False]:
-            for pc in ['none', 'less', 'more']:
-                for input in range(5):
-                    print 'Starting %s - Pseudo Counts: %s - Full Matrix: %s, Input Matrices Index: %s' % (method,pc,fm, input)
-                    print method, verbose, pc, fm, input+1
-                    scoring3A_behavior(method=method, verbose=verbose,pc_amount=pc, full_matrix=fm, in_mat=input+1)
-                    print 'Done %s - Pseudo Counts: %s - Full Matrix: %s, Input Matrices Index: %s' % (method,pc,fm, input)
-
-def scoring3A_weight_behavior(methods=["pseudoV", "pearson", "sym_pseudoV"], verbose=False, res=None, in_mat=2):
-    '''Create the data on how the weights used in subchallenge 3 affect the score using the given scoring methods
+def scoring3A_pseudo_counts(pc_amount, n):
+    '''Number of pseudo counts to include for a matrix with n mutations, for pc_amount 'more', 'less' or 'none' '''
+    return {'more' : np.sqrt(n),
+            'less' : np.log(n),
+            'none' : 0}[pc_amount]
+
+def write_scoring3A_cases(res, method, pc_amount, full_matrix, in_mat):
+    '''Saves the score of every scenario for one configuration of the SC3 metric to its tsv file'''
+    pc_ext = {'more' : "_more_pc", 'less' : "", 'none' : "_no_pc"}[pc_amount] # file name extension for the amount of pseudo counts to include
+    in_mat_ext = {1:'_all',
+                  2:'_nc',
+                  3:'_na',
+                  4:'_nat',
+                  5:'_ncous'}[in_mat]
+    if full_matrix:
+        tri_ext = "_full"
+    else:
+        tri_ext = "_triu"
+    if isinstance(method, list):
+        f = open(tsv_dir + 'scoring3A_all_cases_' + '_'.join([m + in_mat_ext for m in method]) + pc_ext + tri_ext + '.tsv', 'w')
+    else:
+        f = open(tsv_dir + 'scoring3A_all_cases_' + method + in_mat_ext +  pc_ext + tri_ext + '.tsv', 'w')
+    out_res = [map(str,x) for x in res]
+    out_res = ['\t'.join(x) for x in out_res]
+    f.write('\n'.join(out_res))
+    f.close()
+
+# methods and combinations of methods of the SC3 behavior study
+scoring3A_methods = ['pseudoV',
+                     'orig',
+                     'mcc',
+                     'pearson',
+                     'spearman',
+                     'aupr',
+                     'sqrt',
+                     'sym_pseudoV',
+                     ['pseudoV', 'mcc', 'pearson'],
+                     ['pseudoV', 'pearson', 'sym_pseudoV'],
+                     ['aupr', 'sqrt', 'sym_pseudoV'],
+                     ['aupr', 'sqrt', 'sym_pseudoV', 'pearson']]
+
+def scoring3A_behavior_all(verbose=True, processes=1, methods=scoring3A_methods, full_matrix=(True, False),
+                           pc_amounts=('none', 'less', 'more'), in_mats=(1, 2, 3, 4, 5)):
+    '''Scoring behaviour of every configuration of the subchallenge 3 metrics, see scoring3A_behavior.
+    Every configuration is an independent task of a sweep: the results are checkpointed in
+    scoring3A_all_cases.sweep.tsv as they complete, so an interrupted study resumes where it stopped.
+
+    Attributes:
+    :param verbose: boolean for whether to print every configuration that completes
+    :param processes: number of worker processes scoring configurations in parallel
+    :param methods: methods or lists of methods to evaluate
+    :param full_matrix: values of full_matrix to evaluate
+    :param pc_amounts: amounts of pseudo counts to evaluate
+    :param in_mats: input matrices to evaluate
+    :return: list of (configuration, score of every scenario)
+    '''
+    # the truth and the matrices of every scenario are computed once (and cached) and shared by all the configurations
+    t_ccm, t_clusters = get_ccm("Truth")
+    t_ad = get_ad("Truth")
+    context = {'t_ccm' : t_ccm, 't_ad' : t_ad,
+               'scenarios' : [(sc, (t_ccm, t_ad) if sc == 'Truth' else (get_ccm(sc), get_ad(sc)))
+                              for sc in scenarios]}
+    grid = [('method', list(methods)), ('full_matrix', list(full_matrix)), ('pc_amount', list(pc_amounts)), ('in_mat', list(in_mats))]
+    results = sweep.run(scoring3A_config_task, grid, tsv_dir + 'scoring3A_all_cases.sweep.tsv', context=context,
+                        processes=processes, verbose=verbose)
+    for task, scores in results:
+        write_scoring3A_cases(zip(scenarios, scores), task['method'], task['pc_amount'], task['full_matrix'], task['in_mat'])
+    return results
+
+def scoring3A_config_task(context, method, full_matrix, pc_amount, in_mat):
+    '''Scores every scenario with one configuration of the SC3 metric, the baselines only depend on the truth so they are computed once'''
+    t_ccm, t_ad = context['t_ccm'], context['t_ad']
+    baselines = get_baselines3(t_ccm, t_ad, method if isinstance(method, list) else [method], full_matrix=full_matrix, in_mat=in_mat)
+    n_pc = scoring3A_pseudo_counts(pc_amount, t_ccm.shape[0])
+    return [calculate3(ccm, ad, t_ccm, t_ad, method=method, pseudo_counts=n_pc, full_matrix=full_matrix, in_mat=in_mat, baselines=baselines)
+            for sc, (ccm, ad) in context['scenarios']]
+
+def scoring3A_weight_behavior(methods=["pseudoV", "pearson", "sym_pseudoV"], verbose=False, res=None, in_mat=2, weights=[0, 0.5, 1], fmt='tsv', save=True):
+    '''Create the data on how the weights used in subchallenge 3 affect the score using the given scoring methods.
+    The weighted scores of every scenario are computed for the whole grid of weights at once, so dense grids
+    (ex. steps of 0.05 over 4 methods) can be evaluated.
 
     Attributes:
     :param methods: list of methods to use when evaluating each subchallenge scenario
     :param verbose: boolean for whether to output details of the scoring metrics
+    :param res: scenarios x methods array with the score of every scenario for every method, computed with
+        scoring3A_behavior if None
+    :param in_mat: number representing which matrices were used in calculating the SC3 scoring metric, see scoring3A_behavior
+    :param weights: list of possible weights of each method, see get_weights
+    :param fmt: format of the output file
+        Options:
+            tsv - one row per scenario, a Case column and one column per weight assignment named as before, by the
+                methods or str() of the weights (the file read by sc3.behavior.R). Slow to write for dense grids
+            npz - numpy archive with the columns methods, scenarios, weights (weight assignments x methods, normalized)
+                and scores (weight assignments x scenarios)
+    :param save: boolean for whether or not to save the results to a file
+    :return: weight assignments x methods array of the normalized weights, weight assignments x scenarios array of
+        the weighted scores and the scores of every method (this used to be the dictionary of the tsv columns and res)
     '''
     # True values for each attribute
     if res is None:
         res = np.transpose(np.asarray([[row[1] for row in scoring3A_behavior(method, verbose=verbose)] for method in methods]))
-    print res
-
-    wght_res = {'Case':scenarios}
-    n_method = len(methods)
-    weights = [0,0.5,1]
-    weight_list = get_weights(n_method, weights)
-    print weight_list
-    for wght in weight_list:
-        norm_wght = wght / float(sum(wght))
-        scores = np.sum(norm_wght * res, 1)
-        if set(wght) == {0,weights[-1]} or set(wght) == {weights[-1]}:
-            key = '+'.join([methods[i] for i in range(n_method) if wght[i] == weights[-1]])
-            wght_res[key] = scores
-        else:
-            wght_res[str(wght)] = scores
-
+    res = np.asarray(res, dtype=float)
+    if verbose:
+        print res
 
-    in_mat_ext = {1:'_all',
-                  2:'_nc',
-                  3:'_na',
-                  4:'_nat',
-                  5:'_ncous'}[in_mat]
+    weight_list = get_weights(len(methods), weights)
+    norm_wght = weight_list / np.sum(weight_list, axis=1, keepdims=True)
+    scores = np.dot(norm_wght, res.T)
+    if verbose:
+        print '%d weight assignments of %s' % (len(weight_list), ', '.join(methods))
 
-    with open(tsv_dir + 'weights3A_all_cases_' + '_'.join([m + in_mat_ext for m in methods]) + '.tsv', 'wb') as f:
-        fields = sorted(wght_res.keys())
-        print fields
-        w = csv.DictWriter(f, delimiter='\t', fieldnames=fields)
-        w.writeheader()
-        for i in range(len(scenarios)):
-            w.writerow({field:wght_res[field][i] for field in fields})
+    if save:
+        in_mat_ext = {1:'_all',
+                      2:'_nc',
+                      3:'_na',
+                      4:'_nat',
+                      5:'_ncous'}[in_mat]
+        path = tsv_dir + 'weights3A_all_cases_' + '_'.join([m + in_mat_ext for m in methods])
+
+        if fmt == 'npz':
+            np.savez(path + '.npz', methods=methods, scenarios=scenarios, weights=norm_wght, scores=scores)
+        elif fmt == 'tsv':
+            # an assignment of 0 and the largest weight is named after the methods it weights
+            keys = []
+            for wght in weight_list:
+                if set(wght) <= {0, max(weights)}:
+                    keys.append('+'.join([methods[i] for i in range(len(methods)) if wght[i] == max(weights)]))
+                else:
+                    keys.append(str(wght))
+            order = sorted(range(len(keys)), key=lambda i: keys[i])
+            with open(path + '.tsv', 'wb') as f:
+                f.write('\t'.join(['Case'] + [keys[i] for i in order]) + '\n')
+                for i in range(len(scenarios)):
+                    f.write('\t'.join([scenarios[i]] + map(repr, scores[order, i])) + '\n')
+        else:
+            raise ValueError("Output format must be one of tsv or npz, not %s" % fmt)
 
-    return wght_res, res
+    return norm_wght, scores, res
 
-def get_weights(n_objects, weights, cur_weight=None, list_weights= list()):
-    """Generate a list of all possible unique combinations of weight assignments from the given list
-    of weights. Does not make assumptions about the contents of the list, so some weight combinations
-    may be duplicates if the list of weights contains elements that are multiples of each other.
+def get_weights(n_objects, weights):
+    """Generate all the unique combinations of weight assignments from the given list of weights. A weight
+    assignment that is a multiple of another one (ex. all the weights the same) gives the same weighted average,
+    so only the one with the largest weights is included. The assignment where all the weights are zero is not included.
 
     :param n_objects: number of objects that need to be assigned weights
     :param weights: list of possible weights
-    :param cur_weight: current iteration of weight assignments
-    :param list_weights: list of all weight assignments generated so far
-    :return: list of unique weight assignments
+    :return: array with one row per unique weight assignment, the weight of the first object varies fastest
     """
-    if n_objects is 0:
-        if len(set(cur_weight)) > 1 or cur_weight[0] is weights[-1]: # only include the case where all the weights are the same once
-            if not (len(set(cur_weight)) <= 2 and 0 in set(cur_weight)) or weights[-1] in set(cur_weight): # only include the cases where one or more of the weights
-                                                                                                        # are zero and all the other weights are the same once
-                wght = np.copy(cur_weight)
-                list_weights.append(wght)
-    else:
-        if cur_weight is None:
-            cur_weight = [0] * n_objects
-        for i in weights:
-            cur_weight[n_objects-1] = i
-            get_weights(n_objects-1, weights, cur_weight, list_weights)
+    weights = np.unique(np.asarray(weights, dtype=float))
+    grid = np.stack(np.meshgrid(*[weights] * n_objects, indexing='ij'), axis=-1).reshape(-1, n_objects)[:, ::-1]
+    grid = grid[np.sum(grid, axis=1) > 0]
 
-    return np.asarray(list_weights)
+    # the assignments with the same normalized weights are multiples of each other, the last one has the largest weights
+    norm = np.round(grid / np.sum(grid, axis=1, keepdims=True), 10)
+    _, last = np.unique(norm[::-1], axis=0, return_index=True)
+    return grid[np.sort(len(grid) - 1 - last)]
 
 
 def overall_score(p_cell, t_cell, p_ncluster, t_ncluster, p_1c, t_1c,  p_ccm, t_ccm, p_ad, t_ad, weights = [2000, 2000, 3000, 6000, 7000], verbose=False):
@@ -684,16 +750,84 @@ def rank(scores):
     rank = order.argsort()
     return rank + 1
 
-def get_ccm(scenario, t_ccm=None, t_clusters=None, size_clusters=100, n_clusters=6, big_extra_num=15, nssms=None):
+# representations of the scenario matrices returned by get_ccm and get_ad
+#   dense  - float64 matrices (int8 for the OneCluster and NCluster matrices of a given nssms)
+#   int8   - the same matrices as int8, an eighth of the memory
+#   labels - cluster of every mutation, with the K x K cluster level matrix for get_ad
+SCENARIO_REPRESENTATIONS = ['dense', 'int8', 'labels']
+
+# largest number of bytes of scenario matrices kept by get_ccm and get_ad, the least recently used are dropped first
+SCENARIO_CACHE_BYTES = 256 * 2**20
+
+# (matrices, bytes) by (matrix, scenario, size_clusters, n_clusters, big_extra_num, nssms, representation)
+_scenario_cache = collections.OrderedDict()
+_scenario_cache_bytes = [0]
+
+def cached_scenario(key, build):
+    '''Returns the scenario matrices of a key from the LRU cache, building them with build() if they are not in it.
+    The arrays are made read-only since every caller shares them, a caller that modifies them has to copy them first.
+    Matrices larger than SCENARIO_CACHE_BYTES are returned without being cached.
+    '''
+    if key in _scenario_cache:
+        value, size = _scenario_cache.pop(key)
+        _scenario_cache[key] = (value, size)
+        return value
+
+    value = build()
+    arrays = [a for a in (value if isinstance(value, tuple) else (value,)) if isinstance(a, np.ndarray)]
+    for a in arrays:
+        a.setflags(write=False)
+    size = sum(a.nbytes for a in arrays)
+    if size <= SCENARIO_CACHE_BYTES:
+        while _scenario_cache and _scenario_cache_bytes[0] + size > SCENARIO_CACHE_BYTES:
+            _scenario_cache_bytes[0] -= _scenario_cache.popitem(last=False)[1][1]
+        _scenario_cache[key] = (value, size)
+        _scenario_cache_bytes[0] += size
+    return value
+
+def clear_scenario_cache():
+    _scenario_cache.clear()
+    _scenario_cache_bytes[0] = 0
+
+def scenario_labels(ccm):
+    '''Cluster of every mutation (0 to K-1, in the order of their first mutation) of the co-clustering matrix of a hard clustering'''
+    ccm = np.asarray(ccm)
+    labels = np.unique(np.argmax(ccm == 1, axis=1), return_inverse=True)[1]
+    if not np.array_equal(labels[:, None] == labels[None, :], ccm == 1) or not np.all((ccm == 0) | (ccm == 1)):
+        raise ValueError('The co-clustering matrix is not the one of a hard clustering')
+    return labels
+
+def get_ccm(scenario, t_ccm=None, t_clusters=None, size_clusters=100, n_clusters=6, big_extra_num=15, nssms=None, representation='dense', cache=True):
     '''Find the co-clustering matrix for the given scenario
 
     Attributes:
     :param scenario: string representing the clustering scenario being evaluated
     :params t_ccm, t_clusters: - optional value for the true co-clustering matrix and the true cluster assignments,
             to avoid computing it multiple times
-    :param return: (if scenario is 'Truth') the true co-clustering matrix and the clusters used to generate this matrix
+    :param representation: one of SCENARIO_REPRESENTATIONS
+    :param cache: boolean for whether to reuse the matrices of earlier calls with the same parameters, they are
+            read-only then. Matrices built from a given t_ccm or t_clusters are never cached.
+    :param return: (if scenario == 'Truth') the true co-clustering matrix and the clusters used to generate this matrix
                     (otherwise) the co-clustering matrix fro the given scenario
+                    (if representation == 'labels') the cluster of every mutation
     '''
+    if representation not in SCENARIO_REPRESENTATIONS:
+        raise ValueError('Representation must be one of %s, not %s' % (', '.join(SCENARIO_REPRESENTATIONS), representation))
+
+    def build():
+        ccm = build_ccm(scenario, t_ccm, t_clusters, size_clusters, n_clusters, big_extra_num, nssms)
+        if representation == 'labels':
+            return scenario_labels(ccm[0] if isinstance(ccm, tuple) else ccm)
+        if representation == 'int8':
+            return (ccm[0].astype(np.int8), ccm[1]) if isinstance(ccm, tuple) else ccm.astype(np.int8)
+        return ccm
+
+    if not cache or t_ccm is not None or t_clusters is not None:
+        return build()
+    return cached_scenario(('ccm', scenario, size_clusters, n_clusters, big_extra_num, nssms, representation), build)
+
+def build_ccm(scenario, t_ccm=None, t_clusters=None, size_clusters=100, n_clusters=6, big_extra_num=15, nssms=None):
+    '''Builds the co-clustering matrix for the given scenario, see get_ccm'''
 
     if t_clusters is None:
         t_clusters = np.zeros((n_clusters*size_clusters,n_clusters))
@@ -706,7 +840,7 @@ def get_ccm(scenario, t_ccm=None, t_clusters=None, size_clusters=100, n_clusters
         return t_ccm, t_clusters
     elif "ParentIs" in scenario:
         return t_ccm
-    elif scenario is "OneCluster":
+    elif scenario == "OneCluster":
         if nssms is None:
             return np.ones(t_ccm.shape)
         return np.ones((nssms,nssms), dtype=np.int8)
@@ -718,20 +852,20 @@ def get_ccm(scenario, t_ccm=None, t_clusters=None, size_clusters=100, n_clusters
         clusters = np.zeros((n_clusters*size_clusters,n_clusters+1))
         clusters[:,:-1] = np.copy(t_clusters)
         if "SplitClusterBot" in scenario:
-            clusters[(n_clusters-0.5) * size_clusters:n_clusters*size_clusters,n_clusters-1] = 0
-            clusters[(n_clusters-0.5)*size_clusters:n_clusters*size_clusters,n_clusters] = 1
+            clusters[int((n_clusters-0.5) * size_clusters):n_clusters*size_clusters,n_clusters-1] = 0
+            clusters[int((n_clusters-0.5)*size_clusters):n_clusters*size_clusters,n_clusters] = 1
             return np.dot(clusters, clusters.T)
             return np.dot(clusters, clusters.T)
-        elif scenario is "SplitClusterMidOneChild":
-            clusters[2.5*size_clusters:3*size_clusters,2] = 0
-            clusters[2.5*size_clusters:3*size_clusters,n_clusters] = 1
+        elif scenario == "SplitClusterMidOneChild":
+            clusters[int(2.5*size_clusters):3*size_clusters,2] = 0
+            clusters[int(2.5*size_clusters):3*size_clusters,n_clusters] = 1
             return np.dot(clusters, clusters.T)
-        elif scenario is "SplitClusterMidMultiChild":
-            clusters[1.5*size_clusters:2*size_clusters,1] = 0
-            clusters[1.5*size_clusters:2*size_clusters,n_clusters] = 1
+        elif scenario == "SplitClusterMidMultiChild":
+            clusters[int(1.5*size_clusters):2*size_clusters,1] = 0
+            clusters[int(1.5*size_clusters):2*size_clusters,n_clusters] = 1
             return np.dot(clusters, clusters.T)
 
-    elif scenario is "MergeClusterBot":
+    elif scenario == "MergeClusterBot":
         clusters = np.copy(t_clusters[:,:-1])
         clusters[(n_clusters-1)*size_clusters:n_clusters*size_clusters,n_clusters-2] = 1 #fix cluster 5 (originally cluster 6)
         clusters[(n_clusters-2)*size_clusters:(n_clusters-1)*size_clusters,n_clusters-2] = 0 #merge clusters 4 and 5 (from true phylogeny)
@@ -770,13 +904,40 @@ def get_ccm(scenario, t_ccm=None, t_clusters=None, size_clusters=100, n_clusters
     else:
         raise LookupError("Invalid scenario")
 
-def get_ad(scenario, t_ad=None, size_clusters=100, nssms=None):
+def get_ad(scenario, t_ad=None, size_clusters=100, nssms=None, representation='dense', cache=True):
     '''Find the ancestry-descendant matrix for the given scenario
 
     Attributes:
     :param scenario: string representing the clustering scenario being evaluated
     :param t_ad: optional value for the true AD matrix, to avoid comupting it multiple times
+    :param representation: one of SCENARIO_REPRESENTATIONS
+    :param cache: boolean for whether to reuse the matrices of earlier calls with the same parameters, they are
+            read-only then. Matrices built from a given t_ad are never cached.
+    :param return: the AD matrix of the scenario, (if representation == 'labels') the cluster of every mutation
+                   (from get_ccm) and the K x K AD matrix of the clusters
     '''
+    if representation not in SCENARIO_REPRESENTATIONS:
+        raise ValueError('Representation must be one of %s, not %s' % (', '.join(SCENARIO_REPRESENTATIONS), representation))
+
+    def build():
+        ad = build_ad(scenario, t_ad, size_clusters, nssms)
+        if representation == 'labels':
+            labels = get_ccm(scenario, size_clusters=size_clusters, nssms=nssms, representation='labels', cache=cache)
+            first = np.unique(labels, return_index=True)[1]
+            ad_clusters = np.asarray(ad)[first][:, first]
+            if not np.array_equal(ad_clusters[labels][:, labels], ad):
+                raise ValueError('The AD matrix of %s is not constant on its clusters' % scenario)
+            return labels, ad_clusters.astype(np.int8)
+        if representation == 'int8':
+            return ad.astype(np.int8)
+        return ad
+
+    if not cache or t_ad is not None:
+        return build()
+    return cached_scenario(('ad', scenario, size_clusters, None, None, nssms, representation), build)
+
+def build_ad(scenario, t_ad=None, size_clusters=100, nssms=None):
+    '''Builds the ancestry-descendant matrix for the given scenario, see get_ad'''
     if t_ad is None and nssms is None:
         t_ad = np.zeros((6*size_clusters,6*size_clusters))
         t_ad[0:size_clusters, size_clusters:] = 1
@@ -785,17 +946,17 @@ def get_ad(scenario, t_ad=None, size_clusters=100, nssms=None):
 
     if scenario in ["Truth", "SplitClusterBotSame", "MergeClusterBot"]:
         return t_ad
-    elif scenario is "SplitClusterBotDiff":
+    elif scenario == "SplitClusterBotDiff":
         ad = np.copy(t_ad)
-        ad[5*size_clusters:5.5*size_clusters,5.5*size_clusters:6*size_clusters] = 1.
+        ad[5*size_clusters:int(5.5*size_clusters),int(5.5*size_clusters):6*size_clusters] = 1.
         return ad
-    elif scenario is "SplitClusterMidOneChild":
+    elif scenario == "SplitClusterMidOneChild":
         ad = np.copy(t_ad)
-        ad[2.5*size_clusters:3*size_clusters,5*size_clusters:6*size_clusters] = 0
+        ad[int(2.5*size_clusters):3*size_clusters,5*size_clusters:6*size_clusters] = 0
         return ad
-    elif scenario is "SplitClusterMidMultiChild":
+    elif scenario == "SplitClusterMidMultiChild":
         ad = np.copy(t_ad)
-        ad[1.5*size_clusters:2*size_clusters,3*size_clusters:5*size_clusters] = 0
+        ad[int(1.5*size_clusters):2*size_clusters,3*size_clusters:5*size_clusters] = 0
         return ad
     elif scenario == "MergeClusterMid&BotOneChild":
         ad = np.copy(t_ad)
@@ -811,80 +972,79 @@ def get_ad(scenario, t_ad=None, size_clusters=100, nssms=None):
         ad[0:2*size_clusters, 2*size_clusters:] = 1
         ad[2*size_clusters:3*size_clusters, 5*size_clusters:] = 1
         return ad
-    elif scenario is "ParentIsSibling":
+    elif scenario == "ParentIsSibling":
         ad = np.copy(t_ad)
         ad[3*size_clusters:4*size_clusters,4*size_clusters:5*size_clusters] = 1
         return ad
-    elif scenario is "ParentIsGrandparent":
+    elif scenario == "ParentIsGrandparent":
         ad = np.copy(t_ad)
         ad[size_clusters:2*size_clusters,4*size_clusters:5*size_clusters] = 0
         return ad
-    elif scenario is "ParentIsAunt":
+    elif scenario == "ParentIsAunt":
         ad = np.copy(t_ad)
         ad[size_clusters:2*size_clusters,4*size_clusters:5*size_clusters] = 0
         ad[2*size_clusters:3*size_clusters,4*size_clusters:5*size_clusters] = 1
         return ad
-    elif scenario is "ParentIsCousin":
+    elif scenario == "ParentIsCousin":
         ad = np.copy(t_ad)
         ad[size_clusters:2*size_clusters,4*size_clusters:5*size_clusters] = 0
         ad[2*size_clusters:3*size_clusters,4*size_clusters:5*size_clusters] = 1
         ad[5*size_clusters:6*size_clusters,4*size_clusters:5*size_clusters] = 1
         return ad
-    elif scenario is "ParentIsSiblingWithChildren":
+    elif scenario == "ParentIsSiblingWithChildren":
         ad = np.copy(t_ad)
         ad[2*size_clusters:3*size_clusters, range(size_clusters,2*size_clusters)+range(3*size_clusters,5*size_clusters)] = 1 #adjust cluster 3's ancestry
         return ad
-    elif scenario is "ParentIsNieceWithChildren":
+    elif scenario == "ParentIsNieceWithChildren":
         ad = np.copy(t_ad)
         ad[2*size_clusters:3*size_clusters, range(size_clusters,2*size_clusters)+range(3*size_clusters,5*size_clusters)] = 1 #adjust cluster 3's ancestry
         ad[5*size_clusters:6*size_clusters, range(size_clusters,2*size_clusters)+range(3*size_clusters,5*size_clusters)] = 1 #adjust cluster 6's ancestry
         return ad
-    elif scenario is "OneCluster":
+    elif scenario == "OneCluster":
         if nssms is None:
             return np.zeros(t_ad.shape)
         return np.zeros((nssms,nssms), dtype=np.int8)
-    elif scenario is "NClusterOneLineage":
+    elif scenario == "NClusterOneLineage":
         # np.triu() returns a copy, this does the triu() in memory instead
         if nssms is None:
             return np.triu(np.ones(t_ad.shape))
         ad = np.ones((nssms, nssms), dtype=np.int8)
         for i in xrange(nssms):
-            for j in xrange(i + 1):
-                ad[i, j] = 0
+            ad[i, :i + 1] = 0
         return ad
-    elif scenario is "NClusterTwoLineages":
+    elif scenario == "NClusterTwoLineages":
         ad = np.triu(np.ones(t_ad.shape), k=1)
         ad[2:3*size_clusters+2,3*size_clusters+2:] = 0
         return ad
-    elif scenario is "NClusterCorrectLineage":
+    elif scenario == "NClusterCorrectLineage":
         ad = np.triu(np.ones(t_ad.shape), k=1)
         ad[size_clusters:2*size_clusters,range(2*size_clusters,3*size_clusters)+range(5*size_clusters,6*size_clusters)] = 0 # equivalent of cluster 2 from true AD matrix
         ad[2*size_clusters:3*size_clusters,3*size_clusters:5*size_clusters] = 0 # cluster 3 from true AD matrix
         ad[3*size_clusters:4*size_clusters,4*size_clusters:] = 0 # cluster 4 from true AD matrix
         ad[4*size_clusters:5*size_clusters,5*size_clusters:6*size_clusters] = 0 # cluster 5 from true AD matrix
         return ad
-    elif scenario is "SmallExtraNewBot":
+    elif scenario == "SmallExtraNewBot":
         ad = np.copy(t_ad)
         for i in range(0,6):
             ad[:,size_clusters*i] = 0
             ad[range(1,size_clusters)+range(size_clusters+1,2*size_clusters)+range(3*size_clusters+1,4*size_clusters),size_clusters*i] = 1
             ad[size_clusters*i,:] = 0
         return ad
-    elif scenario is "SmallExtraCurBot":
+    elif scenario == "SmallExtraCurBot":
         ad = np.copy(t_ad)
         for i in range(0,6):
             ad[:,size_clusters*i] = 0
             ad[range(1,size_clusters)+range(2*size_clusters+1,3*size_clusters),size_clusters*i] = 1
             ad[size_clusters*i,:] = 0
         return ad
-    elif scenario is "SmallExtraMid":
+    elif scenario == "SmallExtraMid":
         ad = np.copy(t_ad)
         for i in range(0,6):
             ad[:,size_clusters*i] = 0
             ad[range(1,size_clusters),size_clusters*i] = 1
             ad[size_clusters*i,:] = 0
         return ad
-    elif scenario is "SmallExtraTop":
+    elif scenario == "SmallExtraTop":
         ad = np.copy(t_ad)
         for i in range(0,6):
             ad[:,size_clusters*i] = 0
@@ -894,7 +1054,7 @@ def get_ad(scenario, t_ad=None, size_clusters=100, nssms=None):
                range(2*size_clusters+1,3*size_clusters)+
                range(3*size_clusters+1,4*size_clusters)+range(4*size_clusters+1,5*size_clusters)+range(5*size_clusters+1,6*size_clusters)] = 1
         return ad
-    elif scenario is "BigExtraNewBot":
+    elif scenario == "BigExtraNewBot":
         ad = np.copy(t_ad)
         for i in range(0,6):
             ad[:,size_clusters*i:size_clusters*i+15] = 0
@@ -904,21 +1064,21 @@ def get_ad(scenario, t_ad=None, size_clusters=100, nssms=None):
             size_clusters*i:size_clusters*i+15] = 1
             ad[size_clusters*i:size_clusters*i+15,:] = 0
         return ad
-    elif scenario is "BigExtraCurBot":
+    elif scenario == "BigExtraCurBot":
         ad = np.copy(t_ad)
         for i in range(0,6):
             ad[:,size_clusters*i:size_clusters*i+15] = 0
             ad[range(15,size_clusters)+range(2*size_clusters+15,3*size_clusters),size_clusters*i:size_clusters*i+15] = 1
             ad[size_clusters*i:size_clusters*i+15,:] = 0
         return ad
-    elif scenario is "BigExtraMid":
+    elif scenario == "BigExtraMid":
         ad = np.copy(t_ad)
         for i in range(0,6):
             ad[:,size_clusters*i:size_clusters*i+15] = 0
             ad[range(15,size_clusters),(size_clusters*i):(size_clusters*i+15)] = 1
             ad[size_clusters*i:size_clusters*i+15,:] = 0
         return ad
-    elif scenario is "BigExtraTop":
+    elif scenario == "BigExtraTop":
         ad = np.copy(t_ad)
         for i in range(0,6):
             ad[:,size_clusters*i:size_clusters*i+15] = 0
@@ -931,6 +1091,157 @@ def get_ad(scenario, t_ad=None, size_clusters=100, nssms=None):
     else:
         raise LookupError("Invalid scenario")
 
+# clusters moved by the ParentIs scenarios of get_labels, (cluster, wrong parent) in the true phylogeny
+label_parent_mistakes = {'ParentIsSibling' : (5, 4),
+                         'ParentIsGrandparent' : (5, 1),
+                         'ParentIsAunt' : (5, 3),
+                         'ParentIsCousin' : (5, 6),
+                         'ParentIsSiblingWithChildren' : (2, 3),
+                         'ParentIsNieceWithChildren' : (2, 6)}
+# clusters merged by the MergeCluster scenarios of get_labels, (kept cluster, merged cluster)
+label_merges = {'MergeClusterBot' : (4, 5),
+                'MergeClusterMid&BotOneChild' : (3, 6),
+                'MergeClusterMid&BotMultiChild' : (2, 5),
+                'MergeClusterTop&Mid' : (1, 2)}
+# parent of the extra cluster of the SmallExtra and BigExtra scenarios of get_labels, 0 puts it above cluster 1
+label_extra_parents = {'Top' : 0, 'Mid' : 1, 'CurBot' : 3, 'NewBot' : 4}
+
+def get_labels(scenario, size_clusters=100, n_clusters=6, big_extra_num=15):
+    '''Find the cluster of every mutation and the phylogeny of the clusters for the given scenario. This is the
+    label level equivalent of get_ccm and get_ad, for any number and size of clusters.
+
+    The true phylogeny is the tree where the parent of cluster k is cluster k/2, for six clusters the tree of get_ad:
+    1 -> (2, 3), 2 -> (4, 5), 3 -> 6. Every scenario changes the clusters drawn in
+    '3A Metric Behaviour - Description of Clusters.txt', the Bot scenarios use the last cluster. A new cluster is
+    cluster n_clusters+1 and a merged cluster takes the lower label (MergeClusterBot merges clusters 4 and 5, which
+    get_ccm does not do correctly). As with get_ad(nssms=...), no mutation of NClusterOneLineage is its own ancestor.
+
+    Attributes:
+    :param scenario: string representing the clustering scenario being evaluated, one of scenarios
+    :param size_clusters: number of mutations in each true cluster, or a list with the size of every cluster
+    :param n_clusters: number of true clusters, at least 6
+    :param big_extra_num: number of mutations from each cluster that are in the extra cluster of the BigExtra scenarios
+    :return: (labels, parents) - labels[i] is the cluster (from 1) of mutation i, the mutations are ordered by true
+            cluster, and parents[k-1] is the parent of cluster k with 0 the root, as in the 3A prediction files
+    '''
+    if n_clusters < 6:
+        raise ValueError('The scenarios need at least 6 true clusters, not %d' % n_clusters)
+    sizes = np.array([size_clusters] * n_clusters if np.isscalar(size_clusters) else size_clusters, dtype=int)
+    if len(sizes) != n_clusters or np.any(sizes < 2):
+        raise ValueError('Every one of the %d clusters needs at least 2 mutations' % n_clusters)
+    starts = np.cumsum(sizes) - sizes
+    nssms = np.sum(sizes)
+
+    labels = np.repeat(np.arange(1, n_clusters+1), sizes)
+    parents = [k // 2 for k in range(1, n_clusters+1)]
+    new = n_clusters + 1
+
+    if scenario == "Truth":
+        return labels, parents
+    elif scenario in label_parent_mistakes:
+        cluster, parent = label_parent_mistakes[scenario]
+        parents[cluster-1] = parent
+        return labels, parents
+    elif scenario == "OneCluster":
+        return np.ones(nssms, dtype=int), [0]
+    elif "NCluster" in scenario:
+        # every mutation is its own cluster, with the mutation before it as parent
+        parents = np.arange(nssms)
+        if scenario == "NClusterTwoLineages":
+            # the second lineage starts after the first two mutations, as in get_ad
+            parents[nssms//2 + 2] = 2
+        elif scenario == "NClusterCorrectLineage":
+            # the first mutation of a cluster follows the last mutation of its true parent cluster
+            parents[starts] = [0] + [starts[k//2 - 1] + sizes[k//2 - 1] for k in range(2, n_clusters+1)]
+        elif scenario != "NClusterOneLineage":
+            raise LookupError("Invalid scenario")
+        return np.arange(1, nssms+1), parents.tolist()
+    elif "SplitCluster" in scenario:
+        cluster = {'SplitClusterBotSame' : n_clusters,
+                   'SplitClusterBotDiff' : n_clusters,
+                   'SplitClusterMidOneChild' : 3,
+                   'SplitClusterMidMultiChild' : 2}.get(scenario)
+        if cluster is None:
+            raise LookupError("Invalid scenario")
+        # the second half of the cluster is a new cluster, a sibling or (BotDiff) a child of the first half
+        labels[starts[cluster-1] + sizes[cluster-1]//2:starts[cluster-1] + sizes[cluster-1]] = new
+        parents.append(cluster if scenario == "SplitClusterBotDiff" else parents[cluster-1])
+        return labels, parents
+    elif scenario in label_merges:
+        kept, merged = label_merges[scenario]
+        labels[labels == merged] = kept
+        labels[labels > merged] -= 1
+        del parents[merged-1]
+        parents = [kept if p == merged else p for p in parents]
+        parents = [p - 1 if p > merged else p for p in parents]
+        return labels, parents
+    elif "Extra" in scenario:
+        num_extra = 1 if scenario.startswith("SmallExtra") else big_extra_num
+        parent = label_extra_parents.get(scenario.split("Extra")[1])
+        if parent is None or not scenario.split("Extra")[0] in ("Small", "Big"):
+            raise LookupError("Invalid scenario")
+        if np.any(sizes <= num_extra):
+            raise ValueError('Every cluster needs more than the %d mutations it gives to the extra cluster' % num_extra)
+        # the first mutations of every cluster are in the extra cluster
+        labels[np.arange(nssms) - np.repeat(starts, sizes) < num_extra] = new
+        if parent == 0:
+            parents[0] = new
+        parents.append(parent)
+        return labels, parents
+    else:
+        raise LookupError("Invalid scenario")
+
+def labels_om(truth_labels, pred_labels):
+    '''Overlap matrix (true clusters x predicted clusters) of two labelings of the same mutations, as from om_validate2A'''
+    n_truth = np.max(truth_labels)
+    n_pred = np.max(pred_labels)
+    return np.bincount((truth_labels - 1) * n_pred + pred_labels - 1, minlength=n_truth * n_pred).reshape(n_truth, n_pred)
+
+def labels_ad(parents):
+    '''K x K AD matrix of the clusters of a phylogeny, as from om_validate3A'''
+    return phylogeny_closure(parents)[1:, 1:].astype(int)
+
+def scoring_labels_behavior(size_clusters=100, n_clusters=6, big_extra_num=15, scenario_list=None, verbose=False, save=True):
+    '''Scoring behaviour of the subchallenge 2A and 3A metrics with the scenarios of get_labels, scored from the
+    overlap matrices and cluster AD matrices (om_calculate2A and calculate3A) so samples with 10k - 100k mutations
+    can be evaluated. The NCluster scenarios have a cluster per mutation, their matrices grow with the square of
+    the number of mutations.
+
+    Attributes:
+    :param size_clusters: number of mutations in each true cluster, or a list with the size of every cluster
+    :param n_clusters: number of true clusters, at least 6
+    :param big_extra_num: number of mutations from each cluster in the extra cluster of the BigExtra scenarios
+    :param scenario_list: scenarios to score, all of scenarios if None
+    :param verbose: boolean for whether to print the scores of every scenario
+    :param save: boolean for whether or not to save the results to a tsv file
+    :return: list of [scenario, 2A score, 3A score]
+    '''
+    t_labels, t_parents = get_labels("Truth", size_clusters, n_clusters, big_extra_num)
+    t_ad = labels_ad(t_parents)
+    # the baselines only depend on the size of the true clusters
+    t_sizes = np.bincount(t_labels)[1:].reshape(-1, 1)
+    baselines2A = om_get_baselines2A(t_sizes)
+    baselines3A = get_baselines3A(t_sizes, t_ad)
+
+    res = list()
+    for scenario in scenarios if scenario_list is None else scenario_list:
+        labels, parents = get_labels(scenario, size_clusters, n_clusters, big_extra_num)
+        om = labels_om(t_labels, labels)
+        res.append([scenario,
+                    om_calculate2A(om, baselines=baselines2A),
+                    calculate3A(om, t_labels, labels_ad(parents), t_ad, baselines=baselines3A)])
+        if verbose:
+            print '%s\t%s\t%s' % tuple(res[-1])
+
+    if save:
+        f = open(tsv_dir + 'scoring_labels_behavior_%d_clusters_%d_ssms.tsv' % (n_clusters, len(t_labels)), 'w')
+        out_res = [map(str,x) for x in res]
+        out_res = ['\t'.join(x) for x in out_res]
+        f.write('\n'.join(out_res))
+        f.close()
+
+    return res
+
 def get_cluster_size(scenario, t_size=100):
     '''Find the size of each cluster for the given scenario
 
@@ -939,9 +1250,9 @@ def get_cluster_size(scenario, t_size=100):
     :param t_size: True size of each cluster. It is assumed the the true clusters are all the same size.
     '''
     t_n = 6 # true number of clusters
-    if scenario is "Truth" or "ParentIs" in scenario:
+    if scenario == "Truth" or "ParentIs" in scenario:
         return np.repeat(t_size, t_n)
-    elif scenario is "OneCluster":
+    elif scenario == "OneCluster":
         return np.array([t_n * t_size])
     elif "NCluster" in scenario:
         return np.repeat(1,t_n * t_size)
@@ -973,7 +1284,7 @@ def get_cellularity(scenario):
     :param scenario: string representing the clustering scenario being evaluated
     '''
     t_cell = 0.7 # true cellularity
-    if scenario is "Truth":
+    if scenario == "Truth":
         return t_cell
     else:
         return t_cell + np.random.normal(scale=0.05)
@@ -1035,6 +1346,8 @@ def scoringtotal_behavior(verbose=False):
 
 
 if __name__ == '__main__':
+    # the sweeps checkpoint their results in tsv_dir, rerunning the script resumes them
+    processes = multiprocessing.cpu_count()
     methods ={
         '1A':['abs', 'sqr'],
         '1B':['orig', 'normalized'],
@@ -1072,11 +1385,11 @@ if __name__ == '__main__':
         print 'Scoring 2A Behavior with method ' + m + '...'
         scoring2A_behavior(method=m, verbose=True, tst_closest_reassign=False, tst_big_mat=True, tst_rand_reassign=False)
         print 'Scoring 2B Behavior with method ' + m + '...'
-        scoring2B_behavior(method=m, verbose=True, tst_betas=True, tst_prob_mod_err=True, tst_prob_mod=True)
+        scoring2B_behavior(method=m, verbose=True, tst_betas=True, tst_prob_mod_err=True, tst_prob_mod=True, processes=processes)
 
 
     print 'Scoring 3A Behavior...'
-    scoring3A_behavior_all(verbose=True)
+    scoring3A_behavior_all(verbose=True, processes=processes)
     scoring3A_behavior(method="mcc", verbose=True,pc_amount="none", full_matrix=False, in_mat=1)
 
     print 'Scoring 3A Behavior using multiple metrics with different weights...'
@@ -26,13 +26,31 @@ def calcDifferent(num_of_ones_in_pred, num_of_ones_in_truth, num_of_mutations, t
         ((1/sum_of_pred_row)*np.log(rnd/sum_of_truth_row) + (rnd/sum_of_truth_row)*np.log(1/sum_of_pred_row))*fp +
         ((rnd/sum_of_pred_row)*np.log(rnd/sum_of_truth_row) + (rnd/sum_of_truth_row)*np.log(rnd/sum_of_pred_row))*tn)
 
+def expected_different(num_of_descendants, num_of_mutations, rnd=0.01):
+    '''
+    Sum over the rows j of a random permutation of the expected calcDifferent of a mutation with num_of_descendants
+    descendants. The number of true positives of row j is hypergeometric (j draws out of the other num_of_mutations-1
+    mutations) and calcDifferent is linear in it, so its expectation is calcDifferent at the mean, j*d/(n-1).
+    '''
+    d = num_of_descendants
+    n = num_of_mutations
+    if d > n - 1:
+        return 0
+    j = np.arange(n)
+    mean_tp = j * float(d) / (n - 1) if n > 1 else np.zeros(n)
+    return np.sum(calcDifferent(j, d, n, mean_tp, rnd=rnd)) / n
+
 def ccm_permute_N_cluster(ad_true, rnd=0.01):
-    num_of_mutations = ad_true.shape[0]
+    return descendants_permute_N_cluster([np.count_nonzero(ad_true[i]) for i in range(ad_true.shape[0])], rnd=rnd)
+
+def descendants_permute_N_cluster(num_of_descendants, rnd=0.01):
+    # num_of_descendants - number of descendants of every mutation, i.e. the number of ones in each row of the AD matrix
+    num_of_mutations = len(num_of_descendants)
     num_of_descendants_in_cluster_list = []
     
 
     for i in range(num_of_mutations):
-        descendants = np.count_nonzero(ad_true[i])
+        descendants = num_of_descendants[i]
         if not (descendants in num_of_descendants_in_cluster_list):
             num_of_descendants_in_cluster_list.append(descendants)
     
@@ -41,7 +59,7 @@ def ccm_permute_N_cluster(ad_true, rnd=0.01):
     num_of_descendants_in_cluster = np.zeros((num_of_clusters, 1))
 
     for i in range(num_of_mutations):
-        descendants = np.count_nonzero(ad_true[i])
+        descendants = num_of_descendants[i]
         ind = num_of_descendants_in_cluster_list.index(descendants)
         num_of_descendants_in_cluster[ind, 0] = descendants
         num_of_mutations_in_cluster[ind, 0] = num_of_mutations_in_cluster[ind, 0]+1
@@ -59,24 +77,7 @@ def ccm_permute_N_cluster(ad_true, rnd=0.01):
     #print q
     r = 0
     for i in range(num_of_clusters):
-        for j in range(num_of_mutations):
-            #print i, " ", j
-            minTP = max(0, num_of_descendants_in_cluster[i, 0]-num_of_mutations+j+1)
-            maxTP = min(num_of_descendants_in_cluster[i, 0], j)
-            #print "minTP", minTP
-            #print "maxTP", maxTP
-            for TP in range(int(minTP), int(maxTP)+1):
-                r += (num_of_mutations_in_cluster[i, 0]*
-                    np.exp( gammaln(num_of_descendants_in_cluster[i, 0] + 1) -
-                        gammaln(TP+1) - 
-                        gammaln(num_of_descendants_in_cluster[i, 0] - TP + 1) + 
-                        gammaln(num_of_mutations-1-num_of_descendants_in_cluster[i, 0]+1) -
-                        gammaln(j-TP+1) - 
-                        gammaln(num_of_mutations-1-num_of_descendants_in_cluster[i, 0]-j+TP+1) -
-                        gammaln(num_of_mutations+1) +
-                        gammaln(j+1) + 
-                        gammaln(num_of_mutations-j) ) *
-                    calcDifferent(j, num_of_descendants_in_cluster[i, 0], num_of_mutations, TP, rnd=rnd))
+        r += num_of_mutations_in_cluster[i, 0] * expected_different(num_of_descendants_in_cluster[i, 0], num_of_mutations, rnd=rnd)
     #print p, q, r
     return p+q-r
 
@@ -107,24 +108,7 @@ def om_permute_N_cluster(om, num_of_descendants_in_cluster, rnd=0.01):
     #print q
     r = 0
     for i in range(num_of_clusters):
-        for j in range(num_of_mutations):
-            #print i, " ", j
-            minTP = max(0, num_of_descendants_in_cluster[i, 0]-num_of_mutations+j+1)
-            maxTP = min(num_of_descendants_in_cluster[i, 0], j)
-            #print "minTP", minTP
-            #print "maxTP", maxTP
-            for TP in range(int(minTP), int(maxTP)+1):
-                r += (num_of_mutations_in_cluster[i, 0]*
-                    np.exp( gammaln(num_of_descendants_in_cluster[i, 0] + 1) -
-                        gammaln(TP+1) - 
-                        gammaln(num_of_descendants_in_cluster[i, 0] - TP + 1) + 
-                        gammaln(num_of_mutations-1-num_of_descendants_in_cluster[i, 0]+1) -
-                        gammaln(j-TP+1) - 
-                        gammaln(num_of_mutations-1-num_of_descendants_in_cluster[i, 0]-j+TP+1) -
-                        gammaln(num_of_mutations+1) +
-                        gammaln(j+1) + 
-                        gammaln(num_of_mutations-j) ) *
-                    calcDifferent(j, num_of_descendants_in_cluster[i, 0], num_of_mutations, TP, rnd=rnd))
+        r += num_of_mutations_in_cluster[i, 0] * expected_different(num_of_descendants_in_cluster[i, 0], num_of_mutations, rnd=rnd)
     print p, q, r
     return p+q-r
 
@@ -0,0 +1,175 @@
+import atexit
+import cProfile
+import functools
+import os
+import pstats
+import signal
+import time
+import telemetry
+
+# profilers that can wrap the registered functions
+#   cprofile - deterministic profile (cProfile) of every call
+#   sample   - line level sampling of the cpu time, the line running every SAMPLE_INTERVAL seconds is counted
+#   memory   - peak RSS above the RSS at the start of every call (tracemalloc does not exist in python 2)
+MODES = ['cprofile', 'sample', 'memory']
+
+SAMPLE_INTERVAL = 0.005
+
+# number of rows of the text reports
+REPORT_LINES = 40
+
+# profiler used by the wrapped functions, None when profiling is off
+MODE = None
+# reports are written to <PREFIX>.<function>.<mode>.txt
+PREFIX = 'smc_profile'
+# names of the functions that are profiled, None to profile all the registered ones
+FUNCTIONS = None
+
+# collected profile of every function, by name
+_collectors = {}
+# a profiled function is running, the profiled functions it calls are part of its profile
+_active = False
+_atexit = False
+
+class CProfileCollector(object):
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.calls = 0
+
+    def start(self):
+        self.calls += 1
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path + '.prof')
+        with open(path + '.txt', 'w') as f:
+            f.write('%d calls, raw profile in %s.prof\n' % (self.calls, path))
+            pstats.Stats(self.profile, stream=f).sort_stats('cumulative').print_stats(REPORT_LINES)
+
+class SampleCollector(object):
+    def __init__(self):
+        self.samples = {}
+        self.calls = 0
+
+    def sample(self, signum, frame):
+        key = (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self):
+        self.calls += 1
+        self.handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.handler)
+
+    def write(self, path):
+        total = sum(self.samples.values())
+        with open(path + '.txt', 'w') as f:
+            f.write('%d calls, %d samples every %gs of cpu time\n' % (self.calls, total, SAMPLE_INTERVAL))
+            f.write('%8s %7s  %s\n' % ('samples', '%', 'line'))
+            for (filename, line, name), count in sorted(self.samples.items(), key=lambda x: -x[1])[:REPORT_LINES]:
+                f.write('%8d %6.1f%%  %s:%d (%s)\n' % (count, 100.0 * count / total, filename, line, name))
+
+class MemoryCollector(object):
+    def __init__(self):
+        self.records = []
+
+    def start(self):
+        telemetry.reset_peak()
+        self.rss = telemetry.memory_status()[0]
+        self.start_time = time.time()
+
+    def stop(self):
+        rss, peak = telemetry.memory_status()
+        self.records.append((time.time() - self.start_time, peak - (self.rss or 0), (rss or 0) - (self.rss or 0)))
+
+    def write(self, path):
+        with open(path + '.txt', 'w') as f:
+            f.write('%d calls, peak RSS above the RSS at the start of the call\n' % len(self.records))
+            f.write('%10s %14s %14s\n' % ('wall (s)', 'peak (bytes)', 'delta (bytes)'))
+            for wall, peak, delta in self.records:
+                f.write('%10.3f %14d %14d\n' % (wall, peak, delta))
+
+COLLECTORS = {
+    'cprofile' : CProfileCollector,
+    'sample' : SampleCollector,
+    'memory' : MemoryCollector
+}
+
+def enable(mode, prefix=None, functions=None):
+    '''
+    Turns profiling on for the functions wrapped by install, the reports are written when the process exits
+    :param mode: one of MODES
+    :param prefix: path prefix of the reports, ex. the output file of the scoring run
+    :param functions: names of the functions to profile, None for all of them
+    '''
+    global MODE, PREFIX, FUNCTIONS, _atexit
+    if mode not in MODES:
+        raise ValueError('Profiling mode must be one of %s, not %s' % (', '.join(MODES), mode))
+    MODE = mode
+    if prefix is not None:
+        PREFIX = prefix
+    FUNCTIONS = set(functions) if functions else None
+    if not _atexit:
+        atexit.register(write_reports)
+        _atexit = True
+
+def disable():
+    global MODE
+    MODE = None
+
+def profiled(f):
+    '''
+    Wraps a function so that its calls are profiled while profiling is on
+    '''
+    if getattr(f, 'profiled', False):
+        return f
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        global _active
+        if MODE is None or _active or (FUNCTIONS is not None and f.__name__ not in FUNCTIONS):
+            return f(*args, **kwargs)
+        key = (f.__name__, MODE)
+        if key not in _collectors:
+            _collectors[key] = COLLECTORS[MODE]()
+        collector = _collectors[key]
+        _active = True
+        collector.start()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            collector.stop()
+            _active = False
+    wrapper.profiled = True
+    # the wrapped function, for the code that tells functions apart by identity
+    wrapper.__wrapped__ = f
+    return wrapper
+
+def install(table, keys=None):
+    '''
+    Replaces the functions of a table (a dictionary such as challengeMapping[c], calculate2_funcs or
+    the globals() of a module) with profiled wrappers
+    :param table: dictionary of functions
+    :param keys: keys of the functions to wrap, None for all the callable values
+    '''
+    for key in table.keys() if keys is None else keys:
+        if callable(table.get(key)):
+            table[key] = profiled(table[key])
+
+def write_reports():
+    '''
+    Writes the report of every profiled function to <PREFIX>.<function>.<mode>.txt
+    :return: paths of the reports, without extension
+    '''
+    paths = []
+    for (name, mode), collector in sorted(_collectors.items()):
+        path = '%s.%s.%s' % (PREFIX, name, mode)
+        collector.write(path)
+        paths.append(path)
+    _collectors.clear()
+    return paths
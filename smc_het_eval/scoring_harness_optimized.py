@@ -1,94 +1,163 @@
 import numpy as np
 from permutations import*
+import telemetry
 
 import gc
 
+class ValidationError(Exception):
+    def __init__(self, value):
+        self.value = value
+        print('VALIDATION ERROR: %s' % value)
+    def __str__(self):
+        return repr(self.value)
+
 def om_validate2A (pred_data, truth_data, nssms_x, nssms_y, filter_mut=None, mask=None, subchallenge="2A"):
     '''
     Creates overlapping matrix for SubChallenge 2 and 3
-    :param pred_data: inputed data from prediction file
-    :param truth_data: inputed data from truth file
+    The prediction is read one block of lines at a time and paired with the truth as it is read,
+    so it is never held in memory as a whole
+    :param pred_data: inputed data from prediction file, or an open prediction file
+    :param truth_data: inputed data from truth file, an open truth file, or the cluster of each mutation if already parsed
     :param nssms_x: number of mutations prediction file (specified by vcf)
     :param filter_mut: list of mutations to filter in prediction file
     :param mask: mask applied
     :subchallenge: subchallenge scored
     :return: overlapping matrix and (for subchallenge 3) a list which specifies the cluster of each mutation
     '''
-    pred_data = pred_data.split('\n')
-    pred_data = filter(None, pred_data)
-    pred_data = [x for i, x in enumerate(pred_data) if i in mask] if mask else pred_data
-     
-    if len(pred_data) != nssms_x:
-        raise ValidationError("Prediction file contains a different number of lines than the specification file. Input: %s lines. Specification: %s lines" % (len(pred_data), nssms_x))
-    pred_cluster_entries = set()
-
-    for i in xrange(len(pred_data)):
-        try:
-            pred_data[i] = int(pred_data[i])
-            pred_cluster_entries.add(pred_data[i])
-        except ValueError:
-            raise ValidationError("Cluster ID in line %d (ssm %s) can not be cast to an int", (i+1, pred_data[i][0]))
-
-    num_pred_clusters = max(pred_cluster_entries)
-
-    truth_data = truth_data.split('\n')
-    truth_data = filter(None, truth_data)
-    truth_data = [x for i, x in enumerate(truth_data) if i in mask] if mask else truth_data
-
-    if len(truth_data) != nssms_y:
-        raise ValidationError("Truth file contains a different number of lines than the specification file. Input: %s lines. Specification: %s lines" % (len(truth_data), nssms_y))
+    if isinstance(pred_data, basestring):
+        pred_data = pred_data.split('\n')
 
-    truth_cluster_entries = set()
-    for i in xrange(len(truth_data)):
-        try:
-            truth_data[i] = int(truth_data[i])
-            truth_cluster_entries.add(truth_data[i])
-        except ValueError:
-            raise ValidationError("Cluster ID in line %d (ssm %s) can not be cast to an int", (i+1, truth_data[i][0]))
+    # the truth can be passed in already parsed, e.g. loaded from the truth store
+    if isinstance(truth_data, np.ndarray) or isinstance(truth_data, list):
+        if len(truth_data) != nssms_y:
+            raise ValidationError("Truth file contains a different number of lines than the specification file. Input: %s lines. Specification: %s lines" % (len(truth_data), nssms_y))
+    else:
+        truth_data = om_validate2A_truth(truth_data, nssms_y, mask=mask)
+    truth_data = np.asarray(truth_data, dtype=int)
 
-    num_truth_clusters = max(truth_cluster_entries)
+    num_truth_clusters = np.max(truth_data)
 
-    om = np.zeros((num_truth_clusters, num_pred_clusters), dtype=int)
-
-    # print len(filter_mut)
-    new_pred_data = []
+    # lines of the prediction file that are true mutations
     if filter_mut is not None:
-        for i in range(len(pred_data)):     
-            if i in filter_mut:
-                new_pred_data.append(pred_data[i])
-    else:
-        new_pred_data = pred_data
-
-    for i in range(len(new_pred_data)):
-        # print(new_pred_data[i]), 
-        om[truth_data[i]-1, new_pred_data[i]-1] += 1
+        is_true = np.zeros(max(filter_mut) + 1 if len(filter_mut) > 0 else 0, dtype=bool)
+        is_true[np.asarray(filter_mut, dtype=int)] = True
+
+    # the number of predicted clusters is only known at the end, so the om grows as new clusters show up
+    om = np.zeros((num_truth_clusters, 0), dtype=int)
+    num_pred_lines = 0
+    num_paired = 0
+    # pairs with cluster ids < 1 index the om from the end, they are added once its final size is known
+    unordered = []
+    for pred_block in cluster_id_blocks(pred_data, mask=mask):
+        lines = np.arange(num_pred_lines, num_pred_lines + len(pred_block))
+        num_pred_lines += len(pred_block)
+
+        num_pred_clusters = np.max(pred_block)
+        if num_pred_clusters > om.shape[1]:
+            grown = np.zeros((num_truth_clusters, num_pred_clusters), dtype=int)
+            grown[:, :om.shape[1]] = om
+            om = grown
+
+        if filter_mut is not None:
+            selected = np.zeros(len(lines), dtype=bool)
+            selected[lines < len(is_true)] = is_true[lines[lines < len(is_true)]]
+            pred_block = pred_block[selected]
+        truth_block = truth_data[num_paired:num_paired + len(pred_block)]
+        if len(truth_block) != len(pred_block):
+            raise ValidationError("Prediction file contains more true mutations than the truth file. Truth: %s lines" % len(truth_data))
+        num_paired += len(pred_block)
+
+        valid = (pred_block > 0) & (truth_block > 0)
+        if not np.all(valid):
+            unordered.append((truth_block[~valid], pred_block[~valid]))
+            pred_block, truth_block = pred_block[valid], truth_block[valid]
+        om += np.bincount((truth_block - 1) * om.shape[1] + pred_block - 1, minlength=om.size).reshape(om.shape)
+
+    if num_pred_lines != nssms_x:
+        raise ValidationError("Prediction file contains a different number of lines than the specification file. Input: %s lines. Specification: %s lines" % (num_pred_lines, nssms_x))
+
+    for truth_block, pred_block in unordered:
+        np.add.at(om, (truth_block - 1, pred_block - 1), 1)
 
     if subchallenge is "3A":
         return om, truth_data
 
     return om
 
-def om_calculate2A(om, full_matrix=True, method='default', add_pseudo=True, pseudo_counts=None):
+def om_validate2A_truth(truth_data, nssms_y, mask=None):
+    '''
+    Reads the cluster of every mutation from the truth file for SubChallenge 2 and 3
+    :param truth_data: inputed data from truth file, or an open truth file
+    :param nssms_y: number of mutations in truth file (specified by vcf)
+    :param mask: mask applied
+    :return: array with the cluster of each mutation
+    '''
+    if isinstance(truth_data, basestring):
+        truth_data = truth_data.split('\n')
+    blocks = list(cluster_id_blocks(truth_data, mask=mask))
+    truth_data = np.concatenate(blocks) if len(blocks) > 0 else np.zeros(0, dtype=int)
+
+    if len(truth_data) != nssms_y:
+        raise ValidationError("Truth file contains a different number of lines than the specification file. Input: %s lines. Specification: %s lines" % (len(truth_data), nssms_y))
+
+    return truth_data
+
+def cluster_id_blocks(lines, mask=None, block_size=2**16):
+    '''
+    Reads the cluster id of every mutation in a SubChallenge 2A file, one block of lines at a time.
+    Empty lines are skipped.
+    :param lines: lines of the file (or an open file)
+    :param mask: indices of the lines to keep (None keeps all lines)
+    :param block_size: number of lines converted to int at a time
+    :return: generator of arrays of cluster ids
+    '''
+    if mask:
+        keep = np.zeros(max(mask) + 1, dtype=bool)
+        keep[np.asarray(mask, dtype=int)] = True
+
+    block = []
+    num_read = 0
+    i = 0
+    for line in lines:
+        line = line.rstrip('\n')
+        if line == '':
+            continue
+        if not mask or (i < len(keep) and keep[i]):
+            block.append(line)
+        i += 1
+        if len(block) == block_size:
+            yield cluster_ids(block, num_read)
+            num_read += len(block)
+            block = []
+    if len(block) > 0:
+        yield cluster_ids(block, num_read)
+
+def cluster_ids(block, offset):
+    try:
+        return np.array(block).astype(int)
+    except (ValueError, OverflowError):
+        # find the line that can't be cast to report it, with the same cast as the block (ids too large for an int overflow)
+        for i in xrange(len(block)):
+            try:
+                np.array([block[i]]).astype(int)
+            except (ValueError, OverflowError):
+                raise ValidationError("Cluster ID in line %d (ssm %s) can not be cast to an int" % (offset+i+1, block[i]))
+        raise ValidationError("Cluster IDs in lines %d to %d can not be cast to an int" % (offset+1, offset+len(block)))
+
+def om_calculate2A(om, full_matrix=True, method='default', add_pseudo=True, pseudo_counts=None, baselines=None):
     '''
     Calculate the score for SubChallenge 2
     :param om: overlapping matrix
     :param full_matrix: logical for whether to use the full matrix or just the upper triangular matrices when calculating the score
     :param method: scoring metric used, default is average of Pseudo V,
     :param pseudo_counts: logical for how many psuedo counts to add to the matrices
+    :param baselines: worst scores from om_get_baselines2A, computed from the om if not given
     :return: subchallenge 2 score for the predicted co-clustering matrix
     '''
 
     larger_is_worse_methods = ['pseudoV', 'sym_pseudoV'] # methods where a larger score is worse
     import gc
-    func_dict = {
-        "orig"           : om_calculate2_orig,
-        "sqrt"           : om_calculate2_sqrt,
-        "spearman"       : om_calculate2_spearman,
-        "aupr"           : om_calculate2_aupr,
-        "pseudoV"        : om_calculate2_pseudoV,
-        "sym_pseudoV"    : om_calculate2_sym_pseudoV,
-        "mcc"            : om_calculate2_mcc
-    }
+    func_dict = om_calculate2A_funcs
     func = func_dict.get(method, None)
     tp, fp, tn, fn = calculate_overlap_matrix(om)
     if add_pseudo:
@@ -108,9 +177,10 @@ def om_calculate2A(om, full_matrix=True, method='default', add_pseudo=True, pseu
                 scores.append(func_dict[m](tp, fp, tn, fn, full_matrix=full_matrix))
 
             # normalize the scores to be between (worst of OneCluster and NCluster scores) and (Truth score)
+        if baselines is None:
+            baselines = om_get_baselines2A(om)
         for m in functions:
-            gc.collect()
-            worst_scores.append(get_worst_score_om(om, func_dict[m], larger_is_worse=(m in larger_is_worse_methods)))
+            worst_scores.append(baselines[m])
         for i, m in enumerate(functions):
             if m in larger_is_worse_methods:
                 scores[i] = set_to_zero(1 - (scores[i] / worst_scores[i]))
@@ -128,14 +198,32 @@ def om_calculate2A(om, full_matrix=True, method='default', add_pseudo=True, pseu
         else:
             score = func(tp, fp, tn, fn, full_matrix=full_matrix)
 
+        if baselines is None:
+            baselines = om_get_baselines2A(om, method=method)
+        worst_score = baselines[method]
         if method in larger_is_worse_methods: # normalize the scores to be between 0 and 1 where 1 is the true matrix
-            worst_score = get_worst_score_om(om, func, larger_is_worse=True) # and zero is the worse score of the NCluster matrix
-            score = set_to_zero(1 - (score / worst_score))                   # and the OneCluster matrix - similar to above
-        else:
-            worst_score = get_worst_score_om(om, func, larger_is_worse=False)
+            score = set_to_zero(1 - (score / worst_score))                   # and zero is the worse score of the NCluster matrix
+        else:                                                                # and the OneCluster matrix - similar to above
             score = set_to_zero((score - worst_score) / (1 - worst_score))
         return score
 
+@telemetry.traced('baselines')
+def om_get_baselines2A(om, method='default'):
+    '''
+    Calculates the worst scores (worst of OneCluster and NCluster) used to normalize the scores for SubChallenge 2.
+    They only depend on the number of mutations in each truth cluster, so they can be computed once per truth file
+    :param om: overlapping matrix, or a single column with the number of mutations in each truth cluster
+    :param method: scoring metric used, default is the average used by om_calculate2A
+    :return: dictionary with the worst score of each scoring metric
+    '''
+    larger_is_worse_methods = ['pseudoV', 'sym_pseudoV'] # methods where a larger score is worse
+    methods = [method] if method in om_calculate2A_funcs else ['pseudoV', 'mcc']
+    baselines = {}
+    for m in methods:
+        gc.collect()
+        baselines[m] = get_worst_score_om(om, om_calculate2A_funcs[m], larger_is_worse=(m in larger_is_worse_methods))
+    return baselines
+
 # nssms should be the length of the pred file as well as the length of the truth file
 def calculate_overlap_matrix(om):
     '''
@@ -402,6 +490,42 @@ def om_calculate2_mcc(tp, fp, tn, fn, full_matrix=True):
     # print num / float(denom) 
     return num / float(denom)
 
+# dictionary of method names and their corresponding metric functions for SubChallenge 2A
+om_calculate2A_funcs = {
+    "orig"           : om_calculate2_orig,
+    "sqrt"           : om_calculate2_sqrt,
+    "spearman"       : om_calculate2_spearman,
+    "aupr"           : om_calculate2_aupr,
+    "pseudoV"        : om_calculate2_pseudoV,
+    "sym_pseudoV"    : om_calculate2_sym_pseudoV,
+    "mcc"            : om_calculate2_mcc
+}
+
+def phylogeny_closure(parents):
+    """Computes which clusters are ancestors of which other clusters in one pass over the tree
+    :param parents: parent of every cluster, parents[k-1] is the parent of cluster k and 0 is the root
+    :return: (K+1) x (K+1) boolean matrix with [i, j] set if cluster i is an ancestor of cluster j (row and column 0 are the root),
+        or None if not every cluster is connected to the root
+    """
+    K = len(parents)
+    children = [[] for i in xrange(K+1)]
+    for child, parent in enumerate(parents, 1):
+        children[parent].append(child)
+
+    # breadth first from the root, so the ancestors of a cluster are those of its parent plus the parent itself.
+    # clusters in a cycle or in a component without the root are never reached
+    ancestors = np.zeros((K+1, K+1), dtype=bool)
+    order = [0]
+    for node in order:
+        for child in children[node]:
+            ancestors[child] = ancestors[node]
+            ancestors[child, node] = True
+            order.append(child)
+
+    if len(order) != K+1:
+        return None
+    return ancestors.T
+
 def om_validate3A(data_3A, predK, mask=None):
     """Constructs a matrix that describes the relationship between the clusters
     :param data_3A: inputted data for subchallenge 3A
@@ -427,44 +551,18 @@ def om_validate3A(data_3A, predK, mask=None):
     if [x[0] for x in data_3A] != range(1, predK+1):
         raise ValidationError("First column must have %d entries in acending order starting with 1" % predK)
 
+    valid_parents = set(range(predK+1))
     for i in range(len(data_3A)):
-        if data_3A[i][1] not in set(range(predK+1)):
+        if data_3A[i][1] not in valid_parents:
             raise ValidationError("Parent node label in line %d is not valid." % (i+1))
 
-    # Since cluster zero is not included in file
-    ad_cluster = np.zeros((len(data_3A)+1, len(data_3A)+1), dtype=int)
-    # file starts at one
-    for i in range(len(data_3A)):
-        ad_cluster[data_3A[i][1]][data_3A[i][0]] = 1
     # fill in a matrix which tells you whether or not one cluster is a descendant of another
-    for i in range(len(data_3A)+1):
-        for j in range(len(data_3A)+1):
-            if (ad_cluster[j][i] == 1):
-                for k in range(len(data_3A)+1):
-                    if(ad_cluster[k][j] == 1):
-                        ad_cluster[k][i] = 1
-                    if(ad_cluster[i][k] == 1):
-                        ad_cluster[j][k] = 1
-
-    # check if all nodes are connected. If there are not, we could possibly run the above code again 
-    if (not np.array_equal(np.nonzero(ad_cluster[0])[0], map(lambda x: x+1, range(len(data_3A))))):
-        for i in range(len(data_3A)+1):
-            for j in range(len(data_3A)+1):
-                if (ad_cluster[j][i] == 1):
-                    for k in range(len(data_3A)+1):
-                        if(ad_cluster[k][j] == 1):
-                            ad_cluster[k][i] = 1
-                        if(ad_cluster[i][k] == 1):
-                            ad_cluster[j][k] = 1
-
-    if (not np.array_equal(np.nonzero(ad_cluster[0])[0], map(lambda x: x+1, range(len(data_3A))))):
+    ad_cluster = phylogeny_closure([x[1] for x in data_3A])
+    if ad_cluster is None:
         raise ValidationError("Root of phylogeny not ancestor of all clusters / Tree is not connected.")
 
-    # print ad_cluster
-    ad_cluster = np.delete(ad_cluster, 0, 0)
-    ad_cluster = np.delete(ad_cluster, 0, 1)
-
-    return ad_cluster
+    # Since cluster zero is not included in file
+    return ad_cluster[1:, 1:].astype(int)
 
 def construct_relative_matrix(om, pred, truth, mode="ancestor"):
     """Constructs the shared relative matrix
@@ -676,47 +774,56 @@ def calculate3A_worst(om, ad_pred, ad_truth, scenario="OneCluster", modification
     return calculate3_pseudoV(worst_srm, worst_om, worst_P, T)
 
 # This method is equivalent to the calculate3Final in the orignal script
-def calculate3A(om, truth_data, ad_pred, ad_truth):
+def calculate3A(om, truth_data, ad_pred, ad_truth, baselines=None):
     """Calculates the score given an overlap matrix and matrices which describes the relationship of clusters in both
     pred and truth files
     :param om: overlap matrix
     :param ad_pred: matrix which describes the relationshop between clusters has in the prediction file
     :param ad_truth: matrix which describes the relationship between clusters in the truth file
     :truth_data: the order in which the mutations were inputted; this is necessary to calculate the score for N Cluster N Lineages
+    :param baselines: worst scores from get_baselines3A, computed from the truth if not given
     :return: the score for subchallenge 3
     """
-    n_scores = []
-    n_scores.append(set_to_zero(calculate3A_worst(om, ad_pred, ad_truth, scenario="NCluster", truth_data=truth_data)))
-    n_scores.append(set_to_zero(calculate3A_worst(om, ad_pred, ad_truth, scenario="NCluster", modification="transpose", truth_data=truth_data)))
-    n_scores.append(set_to_zero(calculate3A_worst(om, ad_pred, ad_truth, scenario="NCluster", modification="cousin")))
+    if baselines is None:
+        baselines = get_baselines3A(om, ad_truth)
     del truth_data
     gc.collect()
-    n_scores_permuted = []
-    
-    P, T = construct_related_mutations_matrix(om, ad_pred, ad_truth, mode="descendant")
-    n_scores_permuted.append(set_to_zero(om_permute_N_cluster(om, T)))
-    P, T = construct_related_mutations_matrix(om, ad_pred.T, ad_truth.T, mode="descendant")
-    n_scores_permuted.append(set_to_zero(om_permute_N_cluster(om, T)))
-    n_scores_permuted.append(n_scores[2])
 
     scores = []
     scores.append(set_to_zero(calculate3A_pseudoV_final(om, ad_pred, ad_truth)))
     scores.append(set_to_zero(calculate3A_pseudoV_final(om, ad_pred, ad_truth, modification="transpose")))
     scores.append(set_to_zero(calculate3A_pseudoV_final(om, ad_pred, ad_truth, modification="cousin")))
 
+    score = sum(scores) / 3.0
+
+#    return [set_to_zero((1 - (score / max(one_score, n_score)))), set_to_zero((1 - (score / max(one_score, n_score_permuted))))]  
+    return  set_to_zero((1 - (score / max(baselines['OneCluster'], baselines['NCluster']))))
+
+@telemetry.traced('baselines')
+def get_baselines3A(om, ad_truth):
+    """Calculates the OneCluster and the (permuted) NCluster scores used to normalize the score for subchallenge 3.
+    They only depend on the truth, so they can be computed once per truth file
+    :param om: overlap matrix, or a single column with the number of mutations in each truth cluster
+    :param ad_truth: matrix which describes the relationship between clusters in the truth file
+    :return: dictionary with the OneCluster and NCluster scores
+    """
+    # none of the worst scores look at the predicted clusters, only at the size of each truth cluster
+    om = np.sum(om, axis=1).reshape(-1, 1)
+    ad_pred = np.zeros((1, 1))
+
+    n_scores_permuted = []
+    P, T = construct_related_mutations_matrix(om, ad_pred, ad_truth, mode="descendant")
+    n_scores_permuted.append(set_to_zero(om_permute_N_cluster(om, T)))
+    P, T = construct_related_mutations_matrix(om, ad_pred.T, ad_truth.T, mode="descendant")
+    n_scores_permuted.append(set_to_zero(om_permute_N_cluster(om, T)))
+    n_scores_permuted.append(set_to_zero(calculate3A_worst(om, ad_pred, ad_truth, scenario="NCluster", modification="cousin")))
+
     one_scores = []
     one_scores.append(set_to_zero(calculate3A_worst(om, ad_pred, ad_truth, scenario="OneCluster")))
     one_scores.append(set_to_zero(calculate3A_worst(om, ad_pred, ad_truth, scenario="OneCluster", modification="transpose")))
     one_scores.append(set_to_zero(calculate3A_worst(om, ad_pred, ad_truth, scenario="OneCluster", modification="cousin")))
 
-    score = sum(scores) / 3.0
-    one_score = sum(one_scores) / 3.0
-    n_score = sum(n_scores) / 3.0
-
-    n_score_permuted = sum(n_scores_permuted)/3.0
-
-#    return [set_to_zero((1 - (score / max(one_score, n_score)))), set_to_zero((1 - (score / max(one_score, n_score_permuted))))]  
-    return  set_to_zero((1 - (score / max(one_score, n_score_permuted))))
+    return { 'OneCluster' : sum(one_scores) / 3.0, 'NCluster' : sum(n_scores_permuted) / 3.0 }
 
 # adds num pseudo counts to the om; default is square root of the number of mutations
 def add_pseudo_counts_om(om, num=None):
@@ -785,7 +892,8 @@ def get_worst_score_om(om, scoring_func, larger_is_worse=True):
 
 # Equivalent to get_bad_score in original function
 def get_bad_score_om(om, score_func, scenario='OneCluster', pseudo_counts=None):
-    if score_func is om_calculate2_pseudoV or score_func is om_calculate2_pseudoV_norm or score_func is om_calculate2_sym_pseudoV:
+    # the metrics of om_calculate2A_funcs are wrapped when they are profiled, __wrapped__ is the metric itself
+    if getattr(score_func, '__wrapped__', score_func) in [om_calculate2_pseudoV, om_calculate2_pseudoV_norm, om_calculate2_sym_pseudoV]:
         bad_om = get_bad_om(om, scenario)
         return score_func(bad_om, modify=True, pseudo_counts=pseudo_counts)
     else:
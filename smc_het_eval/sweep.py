@@ -0,0 +1,110 @@
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import zlib
+import numpy as np
+
+# function and shared context of the running sweep, the pool workers are forked after they are set
+# so they share the truth matrices with the parent process
+_worker_sweep = None
+
+def expand(grid):
+    '''
+    Expands a parameter grid into its tasks
+    :param grid: list of (name, values) pairs, the last parameter varies fastest
+    :return: list of dictionaries name -> value, one per combination of the values
+    '''
+    names = [name for name, _ in grid]
+    return [dict(zip(names, values)) for values in itertools.product(*[values for _, values in grid])]
+
+def task_key(task):
+    return json.dumps(task, sort_keys=True)
+
+def task_seed(task, seed=0):
+    '''Seed of the random numbers of a task, the same in every process and in every run of the sweep'''
+    return (zlib.crc32(task_key(task)) + seed) & 0xffffffff
+
+def read_checkpoint(path, names):
+    '''
+    Reads the results of the tasks that completed in an earlier run of a sweep
+    :param path: checkpoint file written by run
+    :param names: names of the parameters of the sweep
+    :return: dictionary task key -> result, a line that was not completely written is ignored
+    '''
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        lines = f.readlines()
+    if not lines or lines[0].rstrip('\n').split('\t') != names + ['result']:
+        raise ValueError('%s is not the checkpoint of a sweep over %s' % (path, ', '.join(names)))
+    for line in lines[1:]:
+        fields = line.rstrip('\n').split('\t')
+        if not line.endswith('\n') or len(fields) != len(names) + 1:
+            continue
+        try:
+            values = [json.loads(x) for x in fields]
+        except ValueError:
+            continue
+        done[task_key(dict(zip(names, values[:-1])))] = values[-1]
+    return done
+
+def run(func, grid, checkpoint, context=None, processes=1, seed=0, verbose=False):
+    '''
+    Runs func on every task of a parameter grid, on a process pool. The result of every task is appended to
+    a tsv checkpoint as soon as it completes (one column per parameter and the result, all json encoded),
+    so a sweep that is interrupted resumes with the tasks that have no result yet.
+    :param func: function called as func(context, **task), its result must be json serializable
+    :param grid: list of (name, values) pairs, see expand
+    :param checkpoint: tsv file of the results
+    :param context: shared data of the tasks (ex. the truth matrices), computed once and inherited by the workers
+    :param processes: number of worker processes, 1 to run the tasks in this process
+    :param seed: the random numbers of every task are seeded from the task and this seed
+    :param verbose: boolean for whether to print every task that completes
+    :return: list of (task, result) in the order of the grid
+    '''
+    global _worker_sweep
+    names = [name for name, _ in grid]
+    tasks = expand(grid)
+    done = read_checkpoint(checkpoint, names)
+    pending = [t for t in tasks if task_key(t) not in done]
+
+    # rewrite the completed rows, which drops a line a killed run did not finish
+    tmp = '%s.%d.tmp' % (checkpoint, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write('\t'.join(names + ['result']) + '\n')
+        for t in tasks:
+            if task_key(t) in done:
+                f.write(_checkpoint_line(names, t, done[task_key(t)]))
+    os.rename(tmp, checkpoint)
+    if verbose and len(pending) < len(tasks):
+        print('Resuming %s, %d of %d tasks done' % (checkpoint, len(tasks) - len(pending), len(tasks)))
+
+    _worker_sweep = (func, context, seed)
+    pool = multiprocessing.Pool(processes) if processes > 1 and len(pending) > 1 else None
+    try:
+        results = pool.imap_unordered(_run_task, pending, chunksize=1) if pool is not None else itertools.imap(_run_task, pending)
+        with open(checkpoint, 'a') as f:
+            for i, (task, result) in enumerate(results):
+                f.write(_checkpoint_line(names, task, result))
+                f.flush()
+                done[task_key(task)] = result
+                if verbose:
+                    print('[%d/%d] %s -> %s' % (len(tasks) - len(pending) + i + 1, len(tasks), task_key(task), json.dumps(result)))
+                    sys.stdout.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _worker_sweep = None
+    return [(t, done[task_key(t)]) for t in tasks]
+
+def _checkpoint_line(names, task, result):
+    return '\t'.join(json.dumps(x) for x in [task[n] for n in names] + [result]) + '\n'
+
+def _run_task(task):
+    func, context, seed = _worker_sweep
+    np.random.seed(task_seed(task, seed))
+    return task, func(context, **task)
@@ -0,0 +1,143 @@
+import functools
+import json
+import os
+import resource
+import time
+
+# open trace file, None when tracing is off
+_trace = None
+# spans that are open, innermost last
+_open = []
+# /proc/self/clear_refs can reset the peak RSS (VmHWM) of the process, checked on the first span
+_can_reset_peak = None
+
+class NullSpan(object):
+    '''Span returned when tracing is off, does nothing'''
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+def enable(path):
+    '''
+    Starts writing spans to a JSON lines trace file, appending to it if it exists
+    :param path: trace file
+    '''
+    global _trace
+    disable()
+    _trace = open(path, 'a')
+
+def disable():
+    global _trace
+    if _trace is not None:
+        _trace.close()
+    _trace = None
+
+def enabled():
+    return _trace is not None
+
+def memory_status():
+    '''
+    Current and peak resident memory of the process
+    :return: (rss, peak rss) in bytes, rss is None where /proc is not available
+    '''
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(l.split(':', 1) for l in f if l.startswith('VmRSS') or l.startswith('VmHWM'))
+        return int(fields['VmRSS'].split()[0]) * 1024, int(fields['VmHWM'].split()[0]) * 1024
+    except (IOError, OSError, KeyError, ValueError):
+        return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def reset_peak():
+    '''
+    Resets the peak RSS of the process so the next reading is the peak of the span that starts.
+    The peak so far is folded into all the open spans first.
+    '''
+    global _can_reset_peak
+    if _can_reset_peak is False:
+        return
+    peak = memory_status()[1]
+    for s in _open:
+        s.peak = max(s.peak, peak)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        _can_reset_peak = True
+    except (IOError, OSError):
+        # the peak stays the one of the whole process
+        _can_reset_peak = False
+
+def cpu_time():
+    t = os.times()
+    return t[0] + t[1]
+
+class Span(object):
+    '''
+    Named phase of a run. Records its wall time, CPU time, RSS delta and peak RSS,
+    and writes them as one JSON line to the trace file when it ends.
+    '''
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.peak = 0
+
+    def __enter__(self):
+        reset_peak()
+        self.parent = _open[-1].name if _open else None
+        _open.append(self)
+        self.rss = memory_status()[0]
+        self.start = time.time()
+        self.cpu = cpu_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.time() - self.start
+        cpu = cpu_time() - self.cpu
+        rss, peak = memory_status()
+        _open.pop()
+        self.peak = max(self.peak, peak)
+        for s in _open:
+            s.peak = max(s.peak, self.peak)
+        record = {
+            'span' : self.name,
+            'parent' : self.parent,
+            'pid' : os.getpid(),
+            'start' : self.start,
+            'wall' : wall,
+            'cpu' : cpu,
+            'rss_delta' : rss - self.rss if rss is not None and self.rss is not None else None,
+            'peak_rss' : self.peak,
+            'error' : exc_type.__name__ if exc_type is not None else None
+        }
+        record.update(self.fields)
+        if _trace is not None:
+            # one write per line, so lines of forked workers appending to the same file do not interleave
+            _trace.write(json.dumps(record) + '\n')
+            _trace.flush()
+        return False
+
+def span(name, **fields):
+    '''
+    Span of a phase, to be used as a context manager
+    :param name: name of the phase (e.g. vcf, truth, pred, filter, pseudo counts, metric, baselines)
+    :param fields: extra values written with the span, must be json serializable
+    '''
+    if _trace is None:
+        return NULL_SPAN
+    return Span(name, fields)
+
+def traced(name):
+    '''
+    Decorator that runs every call of a function in a span, with the name of the function as a field
+    '''
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if _trace is None:
+                return f(*args, **kwargs)
+            with Span(name, {'function' : f.__name__}):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -5,6 +5,7 @@ import itertools
 import os
 import json
 import sys
+import shutil
 
 #FUNCTIONS RELATED TO 2A AND 3A ARE OBSOLETE
 def test_calculate1A():
@@ -835,6 +836,838 @@ def test_verify3B():
         if params[0] != two[0] + three[0] and params[1] == s[0]:
             assert res == "Invalid"
 
+def test_cached_artifact():
+    cache = new_artifact_cache([['valid2B.txt', 'valid2B.truth.txt', 'valid.VCF'],
+                                ['valid2B.txt', 'valid3B.txt', 'valid2B.truth.txt', 'valid3B.truth.txt', 'valid.VCF']])
+    calls = []
+    def loader():
+        calls.append(1)
+        return np.ones((2,2))
+
+    # shared files are only parsed once, copies protect the cached matrix from in place changes
+    a = cached_artifact(cache, 'ccm', ['valid2B.txt', 'valid.VCF'], None, loader, copy=True)
+    a[0,0] = 5
+    b = cached_artifact(cache, 'ccm', ['valid2B.txt', 'valid.VCF'], None, loader, copy=True)
+    assert len(calls) == 1
+    assert b[0,0] == 1
+
+    # a different mask is a different artifact
+    cached_artifact(cache, 'ccm', ['valid2B.txt', 'valid.VCF'], [0, 2], loader)
+    assert len(calls) == 2
+
+    # files used by a single challenge are not cached
+    cached_artifact(cache, 'ccm', ['valid3B.txt'], None, loader)
+    cached_artifact(cache, 'ccm', ['valid3B.txt'], None, loader)
+    assert len(calls) == 4
+
+    # scores don't change when challenges share the cache
+    cache = new_artifact_cache([['valid2B.txt', 'valid2B.truth.txt', 'valid.VCF'],
+                                ['valid2B.txt', 'valid3B.txt', 'valid2B.truth.txt', 'valid3B.truth.txt', 'valid.VCF']])
+    assert scoreChallenge('2B', ['valid2B.txt'], ['valid2B.truth.txt'], 'valid.VCF', cache=cache) == 1.0
+    assert scoreChallenge('3B', ['valid2B.txt', 'valid3B.txt'], ['valid2B.truth.txt', 'valid3B.truth.txt'], 'valid.VCF', cache=cache) == 1.0
+    assert scoreChallenge('2B', ['valid2B.txt'], ['valid2B.truth.txt'], 'valid.VCF', cache=cache) == 1.0
+
+def test_truth_store(tmpdir):
+    store = str(tmpdir.join('truth_store'))
+    files = {
+        '2A' : (['valid2A.txt'], ['valid2A.truth.txt']),
+        '2B' : (['valid2B.txt'], ['valid2B.truth.txt']),
+        '3A' : (['valid2A.txt', 'valid3A.txt'], ['valid2A.truth.txt', 'valid3A.truth.txt']),
+        '3B' : (['valid2B.txt', 'valid3B.txt'], ['valid2B.truth.txt', 'valid3B.truth.txt'])
+    }
+    for challenge, (predfiles, truthfiles) in sorted(files.items()):
+        expected = scoreChallenge(challenge, predfiles, truthfiles, 'valid.VCF')
+        # first run parses and stores the truth, second run loads it from the store
+        assert scoreChallenge(challenge, predfiles, truthfiles, 'valid.VCF', truth_store=store) == expected
+        assert scoreChallenge(challenge, predfiles, truthfiles, 'valid.VCF', truth_store=store) == expected
+
+    stored = os.listdir(store)
+    assert len([f for f in stored if f.endswith('.ccm.npy')]) == 1
+    assert len([f for f in stored if f.endswith('.ad.npy')]) == 2
+    assert len([f for f in stored if f.endswith('.labels.npy')]) == 1
+    assert len([f for f in stored if f.endswith('.parseVCF2and3.json')]) == 1
+
+    # stored arrays are memory mapped, unless the caller needs to modify them
+    ccm = truth_store.load_artifact(store, 'ccm', ['valid2B.truth.txt', 'valid.VCF'])
+    assert isinstance(ccm, np.memmap)
+    assert not ccm.flags.writeable
+    ccm = truth_store.load_artifact(store, 'ccm', ['valid2B.truth.txt', 'valid.VCF'], mmap_mode=None)
+    assert ccm.flags.writeable
+    assert np.array_equal(ccm, validate2B('valid2B.truth.txt', ccm.shape[0]))
+
+    # the key only depends on the content of the files
+    assert truth_store.artifact_key('ccm', ['valid2B.truth.txt']) == truth_store.artifact_key('ccm', [os.path.abspath('valid2B.truth.txt')])
+    assert truth_store.artifact_key('ccm', ['valid2B.truth.txt']) != truth_store.artifact_key('ccm', ['valid3B.truth.txt'])
+    assert truth_store.artifact_key('ccm', ['valid2B.truth.txt']) != truth_store.artifact_key('ad', ['valid2B.truth.txt'])
+
+def test_baselines(tmpdir):
+    # baselines computed from the truth alone give the same scores as the ones computed while scoring
+    def read(f):
+        with open(os.path.join('complex', f)) as handle:
+            return handle.read()
+    pred, truth = read('pred_2A_3A_complex.txt'), read('truth_2A_3A_complex.txt')
+    om, truth_data = om_validate2A(pred, truth, len(pred.split()), len(truth.split()), subchallenge="3A")
+    ad_pred = om_validate3A(read('pred_3A_complex.txt'), om.shape[1])
+    ad_truth = om_validate3A(read('truth_3A_complex.txt'), om.shape[0])
+    truth_om = np.bincount(truth_data)[1:].reshape(-1, 1)
+    assert om_calculate2A(om) == om_calculate2A(om, baselines=om_get_baselines2A(truth_om))
+    assert om_calculate2A(om, method='aupr') == om_calculate2A(om, method='aupr', baselines=om_get_baselines2A(truth_om, method='aupr'))
+    assert calculate3A(om, truth_data, ad_pred, ad_truth) == calculate3A(om, truth_data, ad_pred, ad_truth, baselines=get_baselines3A(truth_om, ad_truth))
+
+    # precomputed baselines are stored next to the truth and only used while the truth is unchanged
+    files = {
+        '2A' : (['valid2A.txt'], ['valid2A.truth.txt']),
+        '2B' : (['valid2B.txt'], ['valid2B.truth.txt']),
+        '3A' : (['valid2A.txt', 'valid3A.txt'], ['valid2A.truth.txt', 'valid3A.truth.txt']),
+        '3B' : (['valid2B.txt', 'valid3B.txt'], ['valid2B.truth.txt', 'valid3B.truth.txt'])
+    }
+    vcf = str(tmpdir.join('valid.VCF'))
+    shutil.copy('valid.VCF', vcf)
+    for challenge, (predfiles, truthfiles) in sorted(files.items()):
+        truthfiles = [shutil.copy(f, str(tmpdir)) or str(tmpdir.join(f)) for f in truthfiles]
+        path = precompute_baselines(challenge, truthfiles, vcf)
+        assert path == truthfiles[-1] + '.baselines.json'
+        assert load_baselines(challenge, truthfiles, vcf) == json.load(open(path))['baselines']
+        assert scoreChallenge(challenge, predfiles, truthfiles, vcf) == 1.0
+
+        # sidecars of another challenge or of an older truth are ignored
+        assert load_baselines('1A', truthfiles, vcf) is None
+        with open(truthfiles[-1], 'a') as handle:
+            handle.write('\n')
+        assert load_baselines(challenge, truthfiles, vcf) is None
+
+def test_read_vcf_truth(tmpdir):
+    import SMCScoring
+    with open('valid.VCF') as handle:
+        data = handle.read()
+    lines = [x for x in data.split('\n') if x != '' and x[0] != '#']
+    expected = np.array([x[-4:] == "True" for x in lines])
+
+    # plain files, gzip files and strings give the same flags
+    vcf = str(tmpdir.join('valid.VCF'))
+    shutil.copy('valid.VCF', vcf)
+    with gzip.open(vcf + '.gz', 'w') as handle:
+        handle.write(data)
+    assert np.array_equal(read_vcf_truth(vcf), expected)
+    assert np.array_equal(read_vcf_truth(vcf + '.gz'), expected)
+    assert np.array_equal(read_vcf_truth_text(data), expected)
+    assert parseVCF2and3(vcf, is_path=True) == parseVCF2and3(data) == [[len(lines)], [int(np.sum(expected))], list(np.flatnonzero(expected))]
+    assert parseVCF2and3(vcf, sample_mask=[0, 2, 3], is_path=True) == [[3], [int(np.sum(expected[[0, 2, 3]]))], list(np.flatnonzero(expected[[0, 2, 3]]))]
+    assert parseVCF1C(vcf + '.gz', is_path=True) == [[len(lines)], [len(lines)]]
+
+    # a missing vcf is an error opening the file, not the content of a vcf
+    with pytest.raises(IOError):
+        read_vcf_truth(str(tmpdir.join('nosuch.vcf')))
+    assert verify(str(tmpdir.join('nosuch.vcf')), 'input VCF', parseVCF2and3) is None
+    assert scoreChallenge('2A', ['valid2A.txt'], ['valid2A.truth.txt'], str(tmpdir.join('nosuch.vcf'))) == 'NA'
+
+    # a one line vcf without a line break is content, a vcf with only a header has no SSMs
+    header = str(tmpdir.join('header.vcf'))
+    with open(header, 'w') as handle:
+        handle.write('#CHROM\tPOS')
+    for func in [parseVCF1C, parseVCF2and3]:
+        with pytest.raises(ValidationError) as e:
+            func('#CHROM\tPOS')
+        assert e.value.value == "Input VCF contains no SSMs"
+        with pytest.raises(ValidationError):
+            func(header, is_path=True)
+        del err_msgs[:]
+        assert verify(header, 'input VCF', func) is None
+        assert err_msgs == ["input VCF does not validate: Input VCF contains no SSMs"]
+
+    # the sidecar is only written on request and only used while it is not older than the vcf
+    assert not os.path.exists(vcf + '.mask.npy')
+    SMCScoring.WRITE_VCF_MASK = True
+    try:
+        read_vcf_truth(vcf)
+    finally:
+        SMCScoring.WRITE_VCF_MASK = False
+    assert np.array_equal(np.load(vcf + '.mask.npy'), expected)
+    np.save(vcf + '.mask.npy', np.zeros(len(expected), dtype=bool))
+    assert not np.any(read_vcf_truth(vcf))
+    os.utime(vcf, (os.path.getmtime(vcf) + 10, os.path.getmtime(vcf) + 10))
+    assert np.array_equal(read_vcf_truth(vcf), expected)
+
+    # truth mask holds the position in the truth file of every sampled true line
+    np.random.seed(3)
+    masks = makeMasks('valid.VCF', 0.5)
+    truth_index = np.cumsum(expected) - 1
+    assert masks['truths'] == [truth_index[i] for i in masks['samples'] if expected[i]]
+
+def test_om_validate2A_blocks():
+    # enough lines for several blocks, with predicted clusters that first show up in later blocks
+    np.random.seed(5)
+    n = 150000
+    pred = np.random.randint(1, 40, n)
+    pred[-10:] = 55
+    filter_mut = sorted(np.random.choice(n, 100000, replace=False))
+    truth = np.random.randint(1, 6, len(filter_mut))
+    expected = np.zeros((5, 55), dtype=int)
+    np.add.at(expected, (truth - 1, pred[filter_mut] - 1), 1)
+
+    pred_data = '\n'.join(str(x) for x in pred) + '\n'
+    truth_data = '\n'.join(str(x) for x in truth)
+    om, truth_labels = om_validate2A(pred_data, truth_data, n, len(truth), filter_mut=filter_mut, subchallenge="3A")
+    assert np.array_equal(om, expected)
+    assert np.array_equal(truth_labels, truth)
+    # files are read line by line, already parsed truth gives the same om
+    assert np.array_equal(om_validate2A(StringIO.StringIO(pred_data), truth, n, len(truth), filter_mut=filter_mut), expected)
+
+    # without false positives every line is paired, masks apply to both files
+    om = om_validate2A("1\n2\n\n2\n3\n", "1\n1\n2\n2\n", 4, 4)
+    assert np.array_equal(om, [[1, 1, 0], [0, 1, 1]])
+    om = om_validate2A("1\n2\n2\n3\n", "1\n1\n2\n2\n", 2, 2, mask=[0, 3])
+    assert np.array_equal(om, [[1, 0, 0], [0, 0, 1]])
+
+    # a prediction with more true mutations than the truth, or a cluster id that is not an int, does not validate
+    with pytest.raises(ValidationError) as e:
+        om_validate2A("1\n2\n2\n3\n1\n", "1\n1\n2\n2\n", 5, 4)
+    assert 'more true mutations' in e.value.value
+    with pytest.raises(ValidationError) as e:
+        om_validate2A("1\n2\nx2\n3\n", "1\n1\n2\n2\n", 4, 4)
+    assert e.value.value == "Cluster ID in line 3 (ssm x2) can not be cast to an int"
+    with pytest.raises(ValidationError) as e:
+        om_validate2A("1\n99999999999999999999\n2\n3\n", "1\n1\n2\n2\n", 4, 4)
+    assert e.value.value == "Cluster ID in line 2 (ssm 99999999999999999999) can not be cast to an int"
+
+def test_validate3A_expansion(tmpdir):
+    # random tree, every cluster's parent has a smaller label
+    np.random.seed(7)
+    K, n = 12, 300
+    parents = [np.random.randint(0, k) for k in range(1, K+1)]
+    data = '\n'.join('%d\t%d' % (k, p) for k, p in zip(range(1, K+1), parents))
+    labels = np.random.randint(1, K+1, n)
+    cas = np.zeros((n, K), dtype=np.int8)
+    cas[np.arange(n), labels - 1] = 1
+
+    def is_descendant(i, j):
+        while j != 0:
+            j = parents[j-1]
+            if j == i:
+                return True
+        return False
+    expected = np.array([[is_descendant(i, j) for j in labels] for i in labels], dtype=np.int8)
+
+    ad = validate3A(data, cas, n)
+    assert ad.dtype == np.int8
+    assert np.array_equal(ad, expected)
+
+    # written into a memory mapped matrix
+    out = np.memmap(str(tmpdir.join('ad.dat')), dtype=np.int8, mode='w+', shape=(n, n))
+    assert validate3A(data, cas, n, out=out) is out
+    assert np.array_equal(out, expected)
+
+def test_phylogeny_closure():
+    # parents listed after their children, ancestors found through the whole chain
+    parents = [3, 1, 0, 2]
+    ad = phylogeny_closure(parents)
+    expected = np.zeros((5, 5), dtype=bool)
+    for j in range(1, 5):
+        i = j
+        while i != 0:
+            i = parents[i-1]
+            expected[i, j] = True
+    assert np.array_equal(ad, expected)
+    assert np.array_equal(om_validate3A('1\t3\n2\t1\n3\t0\n4\t2\n', 4), expected[1:, 1:].astype(int))
+
+    # cycle and component without the root
+    assert phylogeny_closure([2, 1]) is None
+    assert phylogeny_closure([0, 3, 2]) is None
+    assert phylogeny_closure([1]) is None
+    with pytest.raises(ValidationError) as e:
+        validate3A('1\t0\n2\t3\n3\t2\n', np.eye(3, dtype=np.int8), 3)
+    assert 'Root of phylogeny' in str(e.value)
+
+def test_bitmatrix():
+    np.random.seed(3)
+    labels = np.random.randint(0, 6, 37)
+    truth = (labels[:, None] == labels[None, :]).astype(np.int8)
+    pred = (np.random.rand(37, 37) < 0.3).astype(np.int8)
+    ad = np.triu(np.random.rand(37, 37) < 0.2, k=1).astype(np.int8)
+
+    packed = bitmatrix.pack_binary(pred, truth)
+    assert bitmatrix.pack_binary(pred, truth * 0.5) is None
+    assert np.array_equal(packed[0].row_counts(), pred.sum(1))
+
+    # same results as the dense kernels, which are used for matrices that are not binary
+    for full_matrix in [True, False]:
+        dense = mcc_from_counts(*mcc_counts(pred.astype(float), truth.astype(float)))
+        if full_matrix:
+            assert np.isclose(calculate2_mcc(pred, truth), dense)
+        tp, fp, tn, fn = bitmatrix.confusion_counts(packed[0], packed[1], full_matrix=full_matrix)
+        inds = np.triu_indices(37, k=1) if not full_matrix else tuple(np.indices((37, 37)))
+        p, t = pred[inds].astype(bool), truth[inds].astype(bool)
+        assert (tp, fp, tn, fn) == (np.sum(p & t), np.sum(p & ~t), np.sum(~p & ~t), np.sum(~p & t))
+
+        for sym in [True, False]:
+            res = calculate2_pseudoV(pred, truth, full_matrix=full_matrix, sym=sym)
+            dense = calculate2_pseudoV(pred + 1e-300, truth, full_matrix=full_matrix, sym=sym)
+            assert np.isclose(res, dense, rtol=1e-12)
+
+    assert not checkForBadTriuIndices(ad, ad.T, np.eye(37, dtype=np.int8))
+    ad[3, 5] = ad[5, 3] = 1
+    assert checkForBadTriuIndices(ad, ad.T, np.eye(37, dtype=np.int8))
+    assert checkForBadTriuIndices(ad * 0.9, ad.T * 0.9, np.eye(37))
+    assert not checkForBadTriuIndices(ad * 0.5, ad.T * 0.5, np.eye(37))
+
+def test_spearman_table():
+    np.random.seed(5)
+    labels = np.random.randint(0, 4, 41)
+    truth = (labels[:, None] == labels[None, :]).astype(float)
+    pred = np.round(np.random.rand(41, 41), 1)
+
+    def ranked(pred, truth):
+        import scipy.stats
+        d = scipy.stats.rankdata(truth) - scipy.stats.rankdata(pred)
+        return 1 - 6 * np.sum(np.square(d)) / float(len(d) * (len(d)**2 - 1))
+
+    inds = np.triu_indices(41, k=1)
+    assert np.isclose(calculate2_spearman(pred, truth), ranked(pred.ravel(), truth.ravel()))
+    assert np.isclose(calculate2_spearman(pred, truth, full_matrix=False), ranked(pred[inds], truth[inds]))
+    assert value_pair_counts(pred, truth)[0].shape == (11, 2)
+
+    # too many distinct values, ranked directly
+    import SMCScoring
+    pred = np.random.rand(41, 41)
+    SMCScoring.MAX_VALUE_PAIRS = 1000
+    try:
+        assert SMCScoring.value_pair_counts(pred, truth) is None
+        assert np.isclose(SMCScoring.calculate2_spearman(pred, truth), ranked(pred.ravel(), truth.ravel()))
+    finally:
+        SMCScoring.MAX_VALUE_PAIRS = 2**22
+
+def test_aupr_table():
+    import SMCScoring
+    import sklearn.metrics as mt
+    np.random.seed(9)
+    labels = np.random.randint(0, 4, 41)
+    truth = (labels[:, None] == labels[None, :]).astype(float)
+    pred = np.round(0.6 * truth + 0.5 * np.random.rand(41, 41), 1)
+
+    def sorted_aupr(pred, truth):
+        precision, recall, thresholds = mt.precision_recall_curve(truth, pred)
+        return mt.auc(recall, precision)
+
+    inds = np.triu_indices(41, k=1)
+    assert np.isclose(calculate2_aupr(pred, truth), sorted_aupr(pred.ravel(), truth.ravel()))
+    assert np.isclose(calculate2_aupr(pred, truth, full_matrix=False), sorted_aupr(pred[inds], truth[inds]))
+    assert np.isclose(calculate2_aupr(truth, truth), 1)
+
+    # too many distinct values, sorted by sklearn unless a resolution is set
+    pred = 0.6 * truth + 0.5 * np.random.rand(41, 41)
+    SMCScoring.MAX_VALUE_PAIRS = 1000
+    try:
+        assert np.isclose(SMCScoring.calculate2_aupr(pred, truth), sorted_aupr(pred.ravel(), truth.ravel()))
+        SMCScoring.AUPR_RESOLUTION = 100
+        assert np.isclose(SMCScoring.calculate2_aupr(pred, truth), sorted_aupr(np.round(pred.ravel(), 2), truth.ravel()))
+    finally:
+        SMCScoring.MAX_VALUE_PAIRS = 2**22
+        SMCScoring.AUPR_RESOLUTION = None
+
+def test_compute_scaled_sc():
+    sc = [(3, 0.2), (5, 0.5), (2, 0.9)]
+    # cluster of every quantile, from the cumulative fractions of the mutations
+    expected = [0.2 if i / 10.0 <= 0.3 else 0.5 if i / 10.0 <= 0.8 else 0.9 for i in range(10)]
+    assert np.allclose(compute_scaled_sc(sc, resolution=10), expected)
+    assert len(compute_scaled_sc(sc)) == 1000
+    assert np.array_equal(compute_scaled_sc([]), np.zeros(1000))
+    assert np.array_equal(expand_sc(sc), [0.2] * 3 + [0.5] * 5 + [0.9] * 2)
+    assert np.isclose(calculate1C(list(sc), list(sc), resolution=10), 1.0)
+
+def test_truth_context():
+    from batch_scoring import TruthContext
+    files = {
+        '1A' : (['valid1A.txt'], ['valid1A.txt']),
+        '1C' : (['valid1C.txt'], ['valid1C.txt']),
+        '2A' : (['valid2A.txt'], ['valid2A.truth.txt']),
+        '2B' : (['valid2B.txt'], ['valid2B.truth.txt']),
+        '3A' : (['valid2A.txt', 'valid3A.txt'], ['valid2A.truth.txt', 'valid3A.truth.txt']),
+        '3B' : (['valid2B.txt', 'valid3B.txt'], ['valid2B.truth.txt', 'valid3B.truth.txt'])
+    }
+    for challenge, (predfiles, truthfiles) in sorted(files.items()):
+        expected = scoreChallenge(challenge, predfiles, truthfiles, 'valid.VCF')
+        truth = TruthContext(challenge, truthfiles, 'valid.VCF')
+        assert truth.score_many([predfiles, predfiles, predfiles]) == [expected] * 3
+        assert truth.score_many([predfiles] * 3, processes=2) == [expected] * 3
+
+    # the truth is parsed once and kept with its pseudo counts, the predictions are not cached
+    truth = TruthContext('2B', ['valid2B.truth.txt'], 'valid.VCF')
+    assert sorted(k[0] for k in truth.cache['artifacts']) == ['ccm_pseudo', 'parseVCF2and3']
+    truth.score('valid2B.txt')
+    assert sorted(k[0] for k in truth.cache['artifacts']) == ['ccm_labels', 'ccm_pseudo', 'parseVCF2and3']
+
+def test_calculate2_overlap(tmpdir):
+    # hard clusterings scored from their overlap get the same scores as the dense matrices
+    np.random.seed(4)
+    truth = np.random.randint(0, 5, 45)
+    pred = np.random.randint(0, 3, 45)
+    truth_ccm = (truth[:, None] == truth[None, :]).astype(float)
+    pred_ccm = (pred[:, None] == pred[None, :]).astype(float)
+    labels = ccm_labels(truth_ccm)
+    assert np.array_equal(truth_ccm, labels[:, None] == labels[None, :])
+
+    truth_apc = add_pseudo_counts(np.copy(truth_ccm))
+    pred_apc = add_pseudo_counts(np.copy(pred_ccm))
+    entries = overlap_entries(truth, pred)
+    for m in calculate2_overlap_funcs:
+        assert np.isclose(calculate2_overlap_funcs[m](entries), calculate2_funcs[m](pred_apc, truth_apc))
+        assert np.isclose(calculate2_overlap(truth, pred, method=m), calculate2(pred_apc, truth_apc, method=m))
+    baselines = get_baselines2(truth_apc)
+    for m, v in get_baselines2_overlap(truth).items():
+        assert np.isclose(v, baselines[m])
+    assert np.isclose(calculate2_overlap(truth, pred), calculate2(pred_apc, truth_apc))
+
+    # soft or inconsistent matrices are not hard clusterings
+    pred_ccm[0, 1] = pred_ccm[1, 0] = 0.5
+    assert ccm_labels(pred_ccm) is None
+    pred_ccm[0, 1] = pred_ccm[1, 0] = 1 - pred_ccm[0, 1] + 0.5
+    pred_ccm[0, 2] = pred_ccm[2, 0] = 1 - pred_ccm[0, 2]
+    assert ccm_labels(pred_ccm) is None
+    assert ccm_labels(np.zeros((3, 3))) is None
+
+    # a soft matrix is rejected from its first block of rows
+    class Rows(object):
+        def __init__(self, matrix):
+            self.matrix, self.shape, self.read = matrix, matrix.shape, []
+        def __getitem__(self, rows):
+            self.read.append(rows)
+            return self.matrix[rows]
+    soft = Rows(np.where(truth_ccm == 1, 0.8, 0.0) + np.identity(45) * 0.2)
+    old_block = bitmatrix.BLOCK_BYTES
+    bitmatrix.BLOCK_BYTES = 450
+    try:
+        assert ccm_labels(soft) is None and all(r.stop <= 10 for r in soft.read)
+        assert np.array_equal(ccm_labels(truth_ccm), labels)
+    finally:
+        bitmatrix.BLOCK_BYTES = old_block
+
+    # scoreChallenge takes the overlap path for hard 2B files, one of the four vcf lines is a false positive
+    pred_file = str(tmpdir.join('pred2B.txt'))
+    np.savetxt(pred_file, np.ones((4, 4)), fmt='%d', delimiter='\t')
+    truth_ccm = np.loadtxt('valid2B.truth.txt', ndmin=2)
+    expected = calculate2(add_pseudo_counts(np.ones((3, 3))), add_pseudo_counts(np.copy(truth_ccm)))
+    assert np.isclose(scoreChallenge('2B', [pred_file], ['valid2B.truth.txt'], 'valid.VCF'), expected)
+    assert scoreChallenge('2B', ['valid2B.txt'], ['valid2B.truth.txt'], 'valid.VCF') == 1.0
+
+def test_calculate3_overlap(tmpdir):
+    # 3B matrices of hard clusterings with block constant AD matrices get the same scores from their clusters
+    np.random.seed(6)
+    def blocks(n, K):
+        labels = np.random.randint(0, K, n)
+        ad = phylogeny_closure([np.random.randint(0, k) for k in range(1, K+1)])[1:, 1:].astype(np.int8)
+        return (labels[:, None] == labels[None, :]).astype(float), ad[labels[:, None], labels[None, :]].astype(float)
+    truth_ccm, truth_ad = blocks(40, 5)
+    pred_ccm, pred_ad = blocks(40, 3)
+    truth_blocks = cluster_blocks(truth_ccm, truth_ad)
+    pred_blocks = cluster_blocks(pred_ccm, pred_ad)
+    labels, ad = truth_blocks
+    assert np.array_equal(ad[labels[:, None], labels[None, :]], truth_ad)
+
+    assert np.isclose(calculate3_overlap(truth_blocks, pred_blocks), calculate3Final(pred_ccm, pred_ad, truth_ccm, truth_ad))
+    baselines = get_baselines3Final(truth_ccm, truth_ad)
+    for k, v in get_baselines3_overlap(truth_blocks).items():
+        assert np.isclose(v, baselines[k])
+
+    # AD matrices that differ within a block are scored densely
+    pred_ad[np.nonzero(pred_ad)[0][0], np.nonzero(pred_ad)[1][0]] = 0
+    assert cluster_blocks(pred_ccm, pred_ad) is None
+    assert cluster_blocks(pred_ccm, pred_ad * 0.5) is None
+    assert cluster_blocks(pred_ccm * 0.5, pred_ad) is None
+
+    # scoreChallenge takes the cluster level path for the hard 3B files
+    predfiles = [str(tmpdir.join('pred2B.txt')), str(tmpdir.join('pred3B.txt'))]
+    np.savetxt(predfiles[0], np.identity(4), fmt='%d', delimiter='\t')
+    np.savetxt(predfiles[1], np.triu(np.ones((4, 4)), k=1), fmt='%d', delimiter='\t')
+    truth = [np.loadtxt(f, ndmin=2) for f in ['valid2B.truth.txt', 'valid3B.truth.txt']]
+    expected = calculate3Final(np.identity(3), np.triu(np.ones((3, 3)), k=1), *truth)
+    assert np.isclose(scoreChallenge('3B', predfiles, ['valid2B.truth.txt', 'valid3B.truth.txt'], 'valid.VCF'), expected)
+
+def test_memplan():
+    assert memplan.parse_size('512M') == 512 * 2**20
+    assert memplan.parse_size('1.5gb') == int(1.5 * 2**30)
+    assert memplan.parse_size('1000') == 1000
+    with pytest.raises(ValueError):
+        memplan.parse_size('lots')
+
+    assert memplan.estimate_peak('2A', 10**5, 10**5, 'float64') is None
+    for challenge in ['2B', '3B']:
+        dense = memplan.estimate_peak(challenge, 10**5, 8 * 10**4, 'float64')
+        assert memplan.estimate_peak(challenge, 10**5, 8 * 10**4, 'float32') < dense
+        assert memplan.estimate_peak(challenge, 10**5, 8 * 10**4, 'float64', baselines=True) <= dense
+        assert memplan.plan(challenge, 10**5, 8 * 10**4, dense) == ('float64', dense)
+        assert memplan.plan(challenge, 10**5, 8 * 10**4, dense - 1)[0] == 'float32'
+        assert memplan.plan(challenge, 10**5, 8 * 10**4, 2**20)[0] is None
+    assert memplan.estimate_peak('3B', 10**5, 8 * 10**4, 'float64', truth_mapped=True) < memplan.estimate_peak('3B', 10**5, 8 * 10**4, 'float64')
+
+    # scoreChallenge parses the predictions as float32 or refuses to score them
+    import SMCScoring
+    predfiles = ['valid2B.txt', 'valid3B.txt']
+    truthfiles = ['valid2B.truth.txt', 'valid3B.truth.txt']
+    expected = scoreChallenge('3B', predfiles, truthfiles, 'valid.VCF')
+    try:
+        SMCScoring.MEM_LIMIT = memplan.estimate_peak('3B', 4, 3, 'float32')
+        assert np.isclose(SMCScoring.scoreChallenge('3B', predfiles, truthfiles, 'valid.VCF'), expected)
+        assert verify('valid2B.txt', 'pred', validate2B, 4, dtype=np.float32).dtype == np.float32
+
+        SMCScoring.MEM_LIMIT = 1000
+        del err_msgs[:]
+        assert SMCScoring.scoreChallenge('3B', predfiles, truthfiles, 'valid.VCF') == "NA"
+        assert len(err_msgs) == 1
+    finally:
+        SMCScoring.MEM_LIMIT = None
+        del err_msgs[:]
+
+def test_telemetry(tmpdir):
+    assert telemetry.span('score') is telemetry.NULL_SPAN
+    trace = str(tmpdir.join('trace.jsonl'))
+    telemetry.enable(trace)
+    try:
+        score = scoreChallenge('3B', ['valid2B.txt', 'valid3B.txt'], ['valid2B.truth.txt', 'valid3B.truth.txt'], 'valid.VCF')
+    finally:
+        telemetry.disable()
+    assert score == scoreChallenge('3B', ['valid2B.txt', 'valid3B.txt'], ['valid2B.truth.txt', 'valid3B.truth.txt'], 'valid.VCF')
+
+    with open(trace) as f:
+        spans = [json.loads(line) for line in f]
+    # spans are written when they end, the score span of the whole call is last
+    assert spans[-1]['span'] == 'score' and spans[-1]['challenge'] == '3B' and spans[-1]['parent'] is None
+    names = set(s['span'] for s in spans)
+    assert set(['vcf', 'truth', 'pred', 'verify', 'hard clusterings', 'metric', 'baselines']) <= names
+    for s in spans:
+        assert s['wall'] >= 0 and s['cpu'] >= 0 and s['error'] is None
+        assert s['peak_rss'] <= spans[-1]['peak_rss']
+    assert [s['parent'] for s in spans if s['span'] == 'vcf'] == ['score']
+    assert [s['function'] for s in spans if s['span'] == 'baselines'] == ['load_baselines', 'get_baselines3_overlap']
+
+def test_benchmark(tmpdir):
+    import benchmark
+    outdir = str(tmpdir.join('sample'))
+    benchmark.generate_sample(outdir, 60, fp_rate=0.2, seed=1)
+    with open(os.path.join(outdir, 'pred.soft.2B.txt')) as f:
+        first = f.read()
+    # the same settings give the same sample, which is not written again
+    mtime = os.path.getmtime(os.path.join(outdir, 'scoring.vcf'))
+    benchmark.generate_sample(outdir, 60, fp_rate=0.2, seed=1)
+    assert os.path.getmtime(os.path.join(outdir, 'scoring.vcf')) == mtime
+    benchmark.generate_sample(str(tmpdir.join('again')), 60, fp_rate=0.2, seed=1)
+    with open(str(tmpdir.join('again', 'pred.soft.2B.txt'))) as f:
+        assert f.read() == first
+
+    vcf = os.path.join(outdir, 'scoring.vcf')
+    for challenge in ['1A', '1B', '1C', '2A', '2B', '3A', '3B']:
+        for fmt, kind in [('txt', 'hard'), ('gz', 'soft')] if challenge in ['2B', '3B'] else [('txt', 'hard')]:
+            predfiles, truthfiles = benchmark.case_files(outdir, challenge, fmt, kind)
+            score = scoreChallenge(challenge, predfiles, truthfiles, vcf)
+            assert 0 < score < 1 or challenge == '1B'
+    soft = np.loadtxt(os.path.join(outdir, 'pred.soft.2B.txt.gz'))
+    assert np.array_equal(np.unique(soft), [0, benchmark.SOFT_VALUE, 1])
+
+    row = benchmark.run_case(outdir, '1B')
+    assert row['status'] == 0 and row['score'] == 1.0 and row['peak_rss'] > 0
+
+def test_benchmark_compare(tmpdir):
+    import benchmark
+    import csv
+    import subprocess
+    def write(name, rows):
+        path = str(tmpdir.join(name))
+        with open(path, 'wb') as handle:
+            writer = csv.DictWriter(handle, benchmark.RESULT_FIELDS)
+            writer.writeheader()
+            for challenge, wall, rss, score in rows:
+                for r, noise in enumerate([0.98, 1.0, 1.02]):
+                    writer.writerow({'challenge' : challenge, 'nssms' : 1000, 'format' : 'txt', 'predictions' : 'hard', 'repeat' : r,
+                                     'wall' : wall * noise, 'peak_rss' : rss, 'score' : score, 'status' : 0})
+        return path
+
+    baseline = write('baseline.csv', [('2B', 10.0, 2e8, 0.75), ('3B', 20.0, 4e8, 0.5), ('1A', 1.0, 1e7, 0.9)])
+    candidate = write('candidate.csv', [('2B', 5.0, 1e8, 0.75 + 1e-12), ('3B', 30.0, 4e8, 0.5), ('2A', 1.0, 1e7, 0.8)])
+    comparisons = benchmark.compare(benchmark.read_results(baseline), benchmark.read_results(candidate))
+    assert [c['challenge'] for c in comparisons] == ['2B', '3B']
+    assert np.isclose(comparisons[0]['speedup'], 2) and comparisons[0]['speedup_low'] < 2 < comparisons[0]['speedup_high']
+    assert np.isclose(comparisons[0]['memory_ratio'], 0.5)
+    assert comparisons[0]['failures'] == []
+    assert comparisons[1]['failures'] == ['1.50x slower']
+    # a 50% slowdown passes with a larger threshold, a changed score never does
+    comparisons = benchmark.compare(benchmark.read_results(baseline), benchmark.read_results(candidate), threshold=0.6, score_tolerance=1e-15)
+    assert [c['failures'] for c in comparisons] == [['score 0.750000000001 instead of 0.75'], []]
+
+    script = os.path.join(os.path.dirname(os.path.abspath(benchmark.__file__)), 'benchmark.py')
+    with open(os.devnull, 'w') as devnull:
+        assert subprocess.call([sys.executable, script, 'compare', baseline, baseline], stdout=devnull) == 0
+        assert subprocess.call([sys.executable, script, 'compare', baseline, candidate], stdout=devnull) == 1
+
+def test_profiling(tmpdir):
+    predfiles = ['valid2B.txt', 'valid3B.txt']
+    truthfiles = ['valid2B.truth.txt', 'valid3B.truth.txt']
+    expected = [scoreChallenge(c, predfiles[:n], truthfiles[:n], 'valid.VCF') for c, n in [('2B', 1), ('3B', 2)]]
+    files_2A = ['valid2A.txt', 'valid3A.txt']
+    truth_2A = ['valid2A.truth.txt', 'valid3A.truth.txt']
+    expected_2A = [scoreChallenge(c, files_2A[:n], truth_2A[:n], 'valid.VCF') for c, n in [('2A', 1), ('3A', 2)]]
+    om = np.array([[3, 1, 0], [0, 2, 2], [1, 0, 4]])
+    expected_om = dict((m, om_calculate2A(om, method=m)) for m in ['pseudoV', 'sym_pseudoV', 'default'])
+    prefix = str(tmpdir.join('sc.txt'))
+    try:
+        for mode in profiling.MODES:
+            enable_profiling(mode, prefix=prefix)
+            assert [scoreChallenge(c, predfiles[:n], truthfiles[:n], 'valid.VCF') for c, n in [('2B', 1), ('3B', 2)]] == expected
+            # nested profiled functions (the metrics of calculate2_overlap) are part of the report of the outer one
+            names = [os.path.basename(p) for p in profiling.write_reports()]
+            assert names == ['sc.txt.%s.%s' % (f, mode) for f in ['calculate2_overlap', 'calculate3_overlap', 'verify']]
+        with open(prefix + '.verify.cprofile.txt') as f:
+            assert f.readline().startswith('8 calls')
+        with open(prefix + '.verify.memory.txt') as f:
+            assert len(f.readlines()) == 2 + 8
+
+        # the 2A/3A baselines tell the pseudoV metrics apart by identity, also when they are wrapped
+        enable_profiling('cprofile', prefix=prefix)
+        assert [scoreChallenge(c, files_2A[:n], truth_2A[:n], 'valid.VCF') for c, n in [('2A', 1), ('3A', 2)]] == expected_2A
+        assert om_calculate2A_funcs['pseudoV'].profiled and om_calculate2A_funcs['sym_pseudoV'].profiled
+        for m in expected_om:
+            assert np.isclose(om_calculate2A(om, method=m), expected_om[m])
+        profiling.write_reports()
+
+        # only the selected functions are profiled
+        enable_profiling('cprofile', prefix=prefix, functions=['overlap_mcc'])
+        scoreChallenge('2B', predfiles[:1], truthfiles[:1], 'valid.VCF')
+        assert [os.path.basename(p) for p in profiling.write_reports()] == ['sc.txt.overlap_mcc.cprofile']
+        with pytest.raises(ValueError):
+            enable_profiling('tracemalloc')
+    finally:
+        profiling.disable()
+    assert calculate2_funcs['mcc'].profiled and calculate2_funcs['mcc'].__name__ == 'calculate2_mcc'
+
+def test_estimate(tmpdir):
+    import SMCScoring
+    import benchmark
+    est = estimate_challenge('3A', ['valid2A.txt', 'valid3A.txt'], ['valid2A.truth.txt', 'valid3A.truth.txt'], 'valid.VCF')
+    assert (est['nssms'], est['truth_nssms'], est['pred_clusters'], est['truth_clusters']) == (4, 3, 2, 2)
+    assert est['strategy'] == 'labels' and est['predictions'] == 'hard'
+    assert est['seconds'] == memplan.estimate_runtime('3A', 4) and est['strategies']['labels'].keys() == ['peak_bytes']
+
+    soft = str(tmpdir.join('soft2B.txt'))
+    with open(soft, 'w') as f:
+        f.write('1 0.5 0 0\n0.5 1 0 0\n0 0 1 0\n0 0 0 1\n')
+    est = estimate_challenge('2B', [soft], ['valid2B.truth.txt'], 'valid.VCF')
+    assert est['predictions'] == 'soft' and sorted(est['strategies']) == ['float32', 'float64']
+    assert est['strategies']['float32']['peak_bytes'] < est['strategies']['float64']['peak_bytes']
+    try:
+        SMCScoring.MEM_LIMIT = est['strategies']['float32']['peak_bytes'] - memplan.BASE_BYTES
+        assert estimate_challenge('2B', [soft], ['valid2B.truth.txt'], 'valid.VCF')['strategy'] == 'float32'
+        SMCScoring.MEM_LIMIT = 1000
+        assert estimate_challenge('2B', [soft], ['valid2B.truth.txt'], 'valid.VCF')['strategy'] is None
+    finally:
+        SMCScoring.MEM_LIMIT = None
+
+    # calibrate recovers the model the walls were made with
+    results = {}
+    for n in [500, 1000, 2000, 4000]:
+        wall = 0.5 + 2.0 * (n / 1000.0)**1.5
+        results[('3B', n, 'txt', 'soft')] = [{'wall' : wall, 'peak_rss' : 4e7 + n, 'status' : 0}]
+        results[('3B', n, 'gz', 'soft')] = [{'wall' : 2 * wall, 'peak_rss' : 4e7, 'status' : 0}]
+    calibration = benchmark.calibrate(results)
+    assert np.allclose(calibration['runtime']['3B']['soft'], [0.5, 2.0, 1.5], atol=1e-6)
+    assert calibration['base_bytes'] == 4e7
+
+    # the exponent of the challenges without matrices is at most 2, a runtime that only changes by
+    # the run-to-run noise keeps the constant alone
+    results = {}
+    for n in [1000, 5000, 20000]:
+        results[('2A', n, 'txt', 'hard')] = [{'wall' : 0.1 * (n / 1000.0)**3, 'peak_rss' : 4e7, 'status' : 0}]
+        results[('1A', n, 'txt', 'hard')] = [{'wall' : w + 1e-4 * n / 1000.0, 'peak_rss' : 4e7, 'status' : 0} for w in [0.15, 0.2, 0.25]]
+    runtime = benchmark.calibrate(results)['runtime']
+    assert runtime['2A']['hard'][2] <= 2
+    assert runtime['1A']['hard'][1:] == [0.0, 0.0] and 0.15 < runtime['1A']['hard'][0] < 0.25
+    path = str(tmpdir.join('calibration.json'))
+    with open(path, 'w') as f:
+        json.dump(calibration, f)
+    models = json.loads(json.dumps(memplan.RUNTIME_MODELS))
+    base = memplan.BASE_BYTES
+    try:
+        memplan.load_runtime_models(path)
+        assert np.isclose(memplan.estimate_runtime('3B', 3000, 'soft'), 0.5 + 2.0 * 3**1.5)
+        assert memplan.BASE_BYTES == 4e7
+    finally:
+        memplan.RUNTIME_MODELS.update(models)
+        memplan.BASE_BYTES = base
+
+def test_sweep(tmpdir):
+    import sweep
+    grid = [('a', [1, 2, 3]), ('b', ['x', ['y', 'z']])]
+    assert sweep.expand(grid)[:2] == [{'a' : 1, 'b' : 'x'}, {'a' : 1, 'b' : ['y', 'z']}]
+    func = lambda context, a, b: [context * a, len(b), np.random.random()]
+    checkpoint = str(tmpdir.join('sweep.tsv'))
+    results = sweep.run(func, grid, checkpoint, context=10, processes=2)
+    assert [t for t, _ in results] == sweep.expand(grid)
+    assert [r[:2] for _, r in results] == [[10, 1], [10, 2], [20, 1], [20, 2], [30, 1], [30, 2]]
+    # the random numbers of a task do not depend on the process that runs it
+    assert sweep.run(func, grid, str(tmpdir.join('serial.tsv')), context=10) == results
+
+    # an interrupted sweep only runs the tasks without a result, a partially written line is dropped
+    with open(checkpoint) as f:
+        lines = f.readlines()
+    with open(checkpoint, 'w') as f:
+        f.writelines(lines[:3] + [lines[3][:5]])
+    calls = []
+    def counted(context, a, b):
+        calls.append((a, b))
+        return func(context, a, b)
+    assert sweep.run(counted, grid, checkpoint, context=10) == results
+    assert len(calls) == 4
+    assert len(open(checkpoint).readlines()) == 7
+    with pytest.raises(ValueError):
+        sweep.run(func, [('c', [1])], checkpoint)
+
+def test_scenario_cache():
+    mb.clear_scenario_cache()
+    ccm = mb.get_ccm('SplitClusterBotDiff')
+    assert mb.get_ccm('SplitClusterBotDiff') is ccm and not ccm.flags.writeable
+    assert np.array_equal(mb.get_ccm('SplitClusterBotDiff', representation='int8'), ccm)
+    assert mb.get_ccm('SplitClusterBotDiff', cache=False).flags.writeable
+    # matrices built from a given truth are not cached
+    t_ccm, t_clusters = mb.get_ccm('Truth')
+    assert mb.get_ccm('BigExtraTop', t_ccm=t_ccm, t_clusters=t_clusters).flags.writeable
+
+    labels = mb.get_ccm('SplitClusterBotDiff', representation='labels')
+    assert labels.max() == 6 and np.array_equal(labels[:, None] == labels[None, :], ccm == 1)
+    labels, ad_clusters = mb.get_ad('ParentIsCousin', representation='labels')
+    assert ad_clusters.shape == (6, 6) and np.array_equal(ad_clusters[labels][:, labels], mb.get_ad('ParentIsCousin'))
+    with pytest.raises(ValueError):
+        mb.get_ccm('MergeClusterBot', representation='labels')
+    with pytest.raises(ValueError):
+        mb.get_ad('Truth', representation='sparse')
+
+    # the least recently used matrices are dropped first
+    limit = mb.SCENARIO_CACHE_BYTES
+    try:
+        mb.SCENARIO_CACHE_BYTES = 2 * ccm.nbytes
+        mb.clear_scenario_cache()
+        first = mb.get_ccm('SplitClusterBotDiff')
+        mb.get_ccm('BigExtraTop')
+        assert mb.get_ccm('SplitClusterBotDiff') is first
+        mb.get_ccm('SmallExtraTop')
+        assert mb.get_ccm('SplitClusterBotDiff') is first and mb.get_ccm('BigExtraTop') is not None
+        assert len(mb._scenario_cache) == 2 and mb._scenario_cache_bytes[0] == 2 * ccm.nbytes
+    finally:
+        mb.SCENARIO_CACHE_BYTES = limit
+        mb.clear_scenario_cache()
+
+    # the baselines of calculate3 copy the cached matrices they add pseudo counts to
+    t_ad = mb.get_ad('Truth')
+    scores = [calculate3(mb.get_ccm('ParentIsCousin'), mb.get_ad('ParentIsCousin'), t_ccm, t_ad, method='pseudoV') for i in range(2)]
+    assert scores[0] == scores[1]
+
+def test_scenario_labels():
+    # the labels and trees of the scenarios give the matrices of get_ccm and get_ad
+    for scenario in mb.scenarios:
+        labels, parents = mb.get_labels(scenario, size_clusters=20)
+        ad = mb.labels_ad(parents)[labels - 1][:, labels - 1]
+        if scenario != 'MergeClusterBot':
+            ccm = mb.get_ccm(scenario, size_clusters=20, cache=False)
+            ccm = ccm[0] if scenario == 'Truth' else ccm
+            assert np.array_equal(labels[:, None] == labels[None, :], ccm == 1)
+        if scenario != 'NClusterOneLineage':
+            assert np.array_equal(ad, mb.get_ad(scenario, size_clusters=20, cache=False))
+    labels, parents = mb.get_labels('MergeClusterBot', size_clusters=20)
+    assert parents == [0, 1, 1, 2, 3] and np.array_equal(np.bincount(labels), [0, 20, 20, 20, 40, 20])
+
+    # any number and size of clusters
+    sizes = [30, 20, 25, 40, 18, 22, 35, 16, 50]
+    for scenario in mb.scenarios:
+        labels, parents = mb.get_labels(scenario, size_clusters=sizes, n_clusters=9, big_extra_num=5)
+        assert len(labels) == sum(sizes) and sorted(set(labels)) == range(1, len(parents) + 1)
+        assert phylogeny_closure(parents) is not None
+    om = mb.labels_om(*[mb.get_labels(sc, sizes, 9)[0] for sc in ['Truth', 'SplitClusterBotDiff']])
+    assert om.shape == (9, 10) and om[8, 8] == 25 and om[8, 9] == 25 and np.sum(om) == sum(sizes)
+    with pytest.raises(ValueError):
+        mb.get_labels('Truth', n_clusters=5)
+    with pytest.raises(LookupError):
+        mb.get_labels('SplitClusterTop')
+
+    res = mb.scoring_labels_behavior(size_clusters=20, scenario_list=['Truth', 'OneCluster', 'ParentIsCousin', 'BigExtraTop'], save=False)
+    assert res[0] == ['Truth', 1.0, 1.0]
+    # the ParentIs scenarios have the true clusters
+    assert res[2][1] == 1.0 and all(0 <= s < 1 for s in [res[1][1], res[1][2], res[2][2], res[3][1], res[3][2]])
+
+def test_expected_different():
+    # sum over the hypergeometric number of true positives of every row of a permutation
+    from scipy.special import comb
+    from permutations import calcDifferent, expected_different
+    for d, n in [(0, 5), (3, 7), (6, 7), (4, 9)]:
+        expected = sum(comb(d, tp) * comb(n - 1 - d, j - tp) / comb(n - 1, j) / n * calcDifferent(j, d, n, tp)
+                       for j in range(n) for tp in range(max(0, d - n + j + 1), min(d, j) + 1))
+        assert np.isclose(expected_different(d, n), expected)
+
+def test_calculate2_batch():
+    np.random.seed(3)
+    truth = np.repeat(np.arange(4), 15)
+    t_ccm = (truth[:, None] == truth[None, :]).astype(float)
+
+    # reassigned hard clusterings, scored from their overlap with the truth
+    labels = mb.reassign_labels(truth, 4, 0.2, 6, kind='closest')
+    assert labels.shape == (6, 60) and labels.min() >= 0 and labels.max() <= 3
+    assert np.all(np.abs(labels - truth) <= 1) and np.any(labels != truth)
+    assert np.array_equal(mb.reassign_labels(truth, 4, 0, 2), [truth, truth])
+    assert np.all(mb.reassign_labels(truth, 4, 1, 3, kind='rand') % 4 != truth)
+    labels[0] = truth
+    for m in ['default', 'pseudoV', 'sym_pseudoV', 'pearson', 'mcc']:
+        scores = calculate2_overlap_batch(truth, labels, method=m, pseudo_counts=None)
+        assert scores[0] == 1 and np.allclose(scores, [calculate2_overlap(truth, l, method=m) for l in labels])
+
+    # stacks of soft co-clustering matrices
+    ccms = mb.beta_error_ccms(t_ccm, 5, 3)
+    assert np.array_equal(ccms, ccms.transpose(0, 2, 1)) and np.all(ccms[:, range(60), range(60)] == 1)
+    assert np.all((0 <= ccms) & (ccms <= 1)) and np.all(ccms[:, t_ccm == 0] <= 1) and np.any(ccms != t_ccm)
+    ccms = np.concatenate([ccms, mb.prob_ccms(t_ccm, [1, 0.8])])
+    assert np.array_equal(ccms[3], t_ccm) and np.allclose(np.unique(ccms[4]), [0.2, 0.8, 1])
+    for m in calculate2_funcs.keys() + ['default']:
+        assert np.allclose(calculate2_batch(ccms, t_ccm, method=m), [calculate2(c, t_ccm, method=m) for c in ccms])
+
+def test_scoring2A_reassign(monkeypatch):
+    # names metric_behavior gets from SMCScoring when it is imported first
+    import SMCScoring
+    for name in dir(SMCScoring):
+        if not hasattr(mb, name):
+            monkeypatch.setattr(mb, name, getattr(SMCScoring, name), raising=False)
+
+    # the batched study gives the scores of calculate2 on the raw co-clustering matrices of every replicate
+    for method in ['default', 'mcc', 'pseudoV', 'spearman']:
+        context = mb.scoring2A_reassign_context(30, 5, method, ['closest', 'rand'])
+        np.random.seed(4)
+        scores = mb.scoring2A_reassign_task(context, 0.1, 3)
+        np.random.seed(4)
+        t_ccm = mb.get_ccm('Truth', size_clusters=30, n_clusters=5, cache=False)[0]
+        for kind in ['closest', 'rand']:
+            labels = mb.reassign_labels(context['t_labels'], 5, 0.1, 3, kind)
+            expected = [calculate2((l[:, None] == l[None, :]).astype(float), t_ccm, method=method) for l in labels]
+            assert np.allclose(scores[kind], expected)
+
+def test_weight_grid(tmpdir, monkeypatch):
+    # the assignments that are a multiple of another one are left out, repeated calls give the same grid
+    w = mb.get_weights(3, [0, 0.5, 1])
+    assert w.shape == (19, 3) and np.array_equal(mb.get_weights(3, [0, 0.5, 1]), w)
+    assert [0.5, 0.5, 0.5] not in w.tolist() and [0, 0.5, 0] not in w.tolist() and [1, 0.5, 0] in w.tolist()
+    w = mb.get_weights(4, np.linspace(0, 1, 21))
+    norm = w / np.sum(w, axis=1, keepdims=True)
+    assert len(set(tuple(np.round(x, 8)) for x in norm)) == len(w)
+
+    monkeypatch.setattr(mb, 'tsv_dir', str(tmpdir) + '/')
+    res = np.random.RandomState(0).random_sample((len(mb.scenarios), 3))
+    norm, scores, _ = mb.scoring3A_weight_behavior(methods=['a', 'b', 'c'], res=res, weights=np.linspace(0, 1, 11), fmt='npz')
+    assert scores.shape == (len(norm), len(mb.scenarios))
+    for i in [0, 100, len(norm) - 1]:
+        assert np.allclose(scores[i], [np.dot(norm[i], r) for r in res])
+    saved = np.load(str(tmpdir.join('weights3A_all_cases_a_nc_b_nc_c_nc.npz')))
+    assert np.array_equal(saved['scores'], scores) and list(saved['scenarios']) == mb.scenarios
+
+    mb.scoring3A_weight_behavior(methods=['a', 'b', 'c'], res=res)
+    with open(str(tmpdir.join('weights3A_all_cases_a_nc_b_nc_c_nc.tsv'))) as f:
+        rows = [line.rstrip('\n').split('\t') for line in f]
+    assert len(rows) == len(mb.scenarios) + 1 and len(rows[0]) == 20 and rows[0][0] == 'Case'
+    # the columns keep their names, str() of the weights when they are not the methods they weight
+    assert str(np.array([1, 0.5, 0.])) in rows[0] and 'a+b' in rows[0]
+    assert rows[1][0] == 'Truth' and np.isclose(float(rows[1][rows[0].index('a+b')]), (res[0, 0] + res[0, 1]) / 2)
+
 def test_integration():
     score_mapping = {    '1A': 'python ../SMCScoring.py -c 1A -o sc.json --predfiles valid1A.txt --truthfiles valid1A.txt --vcf valid.VCF',
                         '1B': 'python ../SMCScoring.py -c 1B -o sc.json --predfiles valid1B.txt --truthfiles valid1B.txt --vcf valid.VCF',
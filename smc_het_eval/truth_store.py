@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+# bump whenever the parsed form of an artifact changes, so old entries are not picked up
+STORE_VERSION = 1
+
+# file digests already computed in this process, keyed by (path, mtime, size)
+_digests = {}
+
+def file_digest(path, block_size=2**20):
+    '''
+    Computes the sha1 digest of the content of a file, reading it in blocks
+    :param path: file to hash
+    :param block_size: number of bytes read at a time
+    :return: hex digest of the file content
+    '''
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    if key not in _digests:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as handle:
+            for block in iter(lambda: handle.read(block_size), b''):
+                digest.update(block)
+        _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+def artifact_key(kind, paths):
+    '''
+    Key of an artifact in the store, only depends on the content of the files it is parsed from
+    :param kind: name of the parsed form (e.g. ccm, ad, parseVCF2and3)
+    :param paths: files the artifact is parsed from, in order
+    :return: hex digest used to name the artifact
+    '''
+    digest = hashlib.sha1('%s:%d' % (kind, STORE_VERSION))
+    for path in paths:
+        digest.update(file_digest(path))
+    return digest.hexdigest()
+
+def artifact_path(store_dir, kind, paths, ext):
+    return os.path.join(store_dir, '%s.%s.%s' % (artifact_key(kind, paths), kind, ext))
+
+def load_artifact(store_dir, kind, paths, mmap_mode='r'):
+    '''
+    Loads a parsed artifact from the store
+    :param store_dir: directory of the truth store
+    :param kind: name of the parsed form
+    :param paths: files the artifact is parsed from
+    :param mmap_mode: mmap mode used to open stored arrays, None to read them into memory
+    :return: the stored artifact or None if it is not in the store
+    '''
+    path = artifact_path(store_dir, kind, paths, 'npy')
+    if os.path.exists(path):
+        return np.load(path, mmap_mode=mmap_mode)
+    path = artifact_path(store_dir, kind, paths, 'json')
+    if os.path.exists(path):
+        with open(path) as handle:
+            return json.load(handle)
+    return None
+
+def save_artifact(store_dir, kind, paths, artifact):
+    '''
+    Writes a parsed artifact to the store. Arrays are stored as .npy files so they can be memory mapped,
+    anything else as json. The file is written under a temporary name and renamed, so concurrent
+    scoring runs never see a partially written artifact.
+    :param store_dir: directory of the truth store, created if it does not exist
+    :param kind: name of the parsed form
+    :param paths: files the artifact is parsed from
+    :param artifact: parsed artifact
+    :return: path of the stored artifact
+    '''
+    if not os.path.isdir(store_dir):
+        try:
+            os.makedirs(store_dir)
+        except OSError:
+            # another run might have created it in the meantime
+            if not os.path.isdir(store_dir):
+                raise
+    is_array = isinstance(artifact, np.ndarray)
+    path = artifact_path(store_dir, kind, paths, 'npy' if is_array else 'json')
+    handle, tmp = tempfile.mkstemp(dir=store_dir, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            if is_array:
+                np.save(f, artifact)
+            else:
+                json.dump(artifact, f)
+        os.rename(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+    return path